@@ -0,0 +1,154 @@
+"""
+Boot (start up) benchmark: source vs precompiled modules
+========================================================
+
+Starts a fresh interpreter for each run of `boot_probe.py`, which imports
+`keypad_lcd_uasyncio` (on the simulated board) and runs the first keypad
+scan, and reports the median of:
+
+    * import time and time to first scan (from the start of the probe),
+    * process wall time (including interpreter start up),
+    * heap in use after the imports, after the first scan, and live heap
+      after a `gc.collect()` (the difference is compiler/import garbage,
+      which fragments the heap before the app starts).
+
+for two variants:
+
+    * source    -- the `.py` files are compiled at import time,
+    * compiled  -- the modules precompiled by `tools/build_mpy.py` (the
+                   `keypad_lcd` and `sim` bundles).
+
+Notes
+-----
+
+    * Runs on the host (CPython); the probe runs on the MicroPython unix
+      port (`micropython` on the PATH, or `--micropython PATH`) with `.mpy`
+      bundles, which needs `mpy-cross`.  Without MicroPython the probe runs
+      on CPython, with sourceless `.pyc` files as the precompiled variant
+      (and copies of the sources, with no cached bytecode, as the source
+      variant).
+
+    * To run, from the repo root:
+        $ python3 bench/bench_boot.py [-n SCALE] [--micropython PATH]
+
+"""
+
+##============================================================================
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import benchlib
+
+benchlib.setup(hwconfig=None)
+
+ROOT = os.path.abspath(benchlib.repo_root())
+sys.path.append(os.path.join(ROOT, 'tools'))
+
+import build_mpy
+
+##============================================================================
+
+RUNS = 15
+PROBE = os.path.join(ROOT, 'bench', 'boot_probe.py')
+
+##============================================================================
+
+def run_probe(cmd, dirs, env, heap=False):
+    """Run the probe once; return `(wall_us, results)`."""
+
+    args = cmd + [ PROBE ] + ([ '--heap' ] if heap else []) + dirs
+    start = time.perf_counter()
+    out = subprocess.check_output(args, env=env)
+    wall_us = int((time.perf_counter() - start) * 1000000)
+    return wall_us, json.loads(out.decode().strip().splitlines()[-1])
+
+#-----------------------------------------------------------------------------
+
+def run_variant(cmd, dirs, env, runs):
+    """Run the probe `runs` times; return a dict of medians."""
+
+    samples = {}
+    for _ in range(runs):
+        wall_us, res = run_probe(cmd, dirs, env)
+        res['wall_us'] = wall_us
+        for key in ('import_us', 'first_scan_us', 'wall_us'):
+            samples.setdefault(key, []).append(res[key])
+
+    ## Heap use is deterministic, one (traced) run will do.
+    _, res = run_probe(cmd, dirs, env, heap=True)
+    medians = { key: benchlib.percentile(sorted(values), 50) for key, values in samples.items() }
+    for key in ('heap_import', 'heap_first_scan', 'heap_live'):
+        medians[key] = res[key]
+    return medians
+
+##============================================================================
+
+def main():
+    """Run the benchmark."""
+
+    argv = sys.argv[1:]
+    micropython = shutil.which('micropython')
+    if '--micropython' in argv:
+        i = argv.index('--micropython')
+        micropython = argv[i + 1]
+        del argv[i:i + 2]
+
+    opts = benchlib.parse_args('bench_boot', argv)
+    runs = max(3, int(RUNS * opts['scale']))
+    results = benchlib.Results()
+
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ)
+    try:
+        if micropython:
+            impl = 'micropython'
+            cmd = [ micropython ]
+            pyc = False
+        else:
+            impl = 'cpython'
+            cmd = [ sys.executable, '-B' ]
+            pyc = True
+        print('--- probe interpreter:', ' '.join(cmd))
+
+        ## (the simulated board has its own LCD, not the LCD driver)
+        files = [ path for path in build_mpy.bundle_files([ 'keypad_lcd', 'sim' ]) if path not in build_mpy.LCD_DRIVER ]
+        compiled_dir = os.path.join(tmp, 'compiled')
+        build_mpy.build(files, compiled_dir, pyc=pyc)
+
+        ## Copies of the sources, so there is no cached bytecode (with
+        ## `-B` none is written): they are compiled on every run.
+        source_dir = os.path.join(tmp, 'source')
+        os.mkdir(source_dir)
+        for path in files:
+            shutil.copy(os.path.join(ROOT, path), source_dir)
+
+        variants = [
+            ('source', [ source_dir ]),
+            ('compiled', [ compiled_dir ]),
+            ]
+        for name, dirs in variants:
+            res = run_variant(cmd, dirs, env, runs)
+            prefix = '{}.{}'.format(impl, name)
+            results.add(prefix + '.import', res['import_us'], 'us')
+            results.add(prefix + '.first_scan', res['first_scan_us'], 'us')
+            results.add(prefix + '.process_wall', res['wall_us'], 'us')
+            results.add(prefix + '.heap_after_import', res['heap_import'], 'bytes')
+            results.add(prefix + '.heap_after_first_scan', res['heap_first_scan'], 'bytes')
+            results.add(prefix + '.heap_live', res['heap_live'], 'bytes')
+    finally:
+        shutil.rmtree(tmp)
+
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
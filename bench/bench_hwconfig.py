@@ -0,0 +1,121 @@
+"""
+Board profile (hwconfig) start up benchmark
+===========================================
+
+Measures the time and heap used to import the simulated board's `hwconfig`
+module and construct the peripherals used by an app, for apps using a few
+of the declared peripherals and for constructing all of them (as the old,
+eager config modules did on import).
+
+Notes
+-----
+
+    * To run, from the repo root:
+        $ micropython bench/bench_hwconfig.py
+        $ python3 bench/bench_hwconfig.py
+
+    * On CPython heap use is measured with `tracemalloc`, so it is only a
+      rough guide to the MicroPython heap.
+
+"""
+
+##============================================================================
+
+import sys
+import gc
+
+import benchlib
+
+benchlib.setup(hwconfig=None)
+
+##============================================================================
+
+## Peripherals used by each (kind of) app.
+APPS = [
+    ('keypad', [ 'KEYPAD' ]),
+    ('leds', [ 'LED', 'BUTTON', 'LEDS' ]),
+    ('keypad_lcd', [ 'KEYPAD', 'I2C1', 'LCD' ]),
+    ('all', None),
+    ]
+
+REPEAT = 20
+
+##============================================================================
+
+try:
+    mem_alloc = gc.mem_alloc
+    mem_start = mem_stop = lambda: None
+except AttributeError:
+    import tracemalloc
+
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0]
+
+    mem_start = tracemalloc.start
+    mem_stop = tracemalloc.stop
+
+#-----------------------------------------------------------------------------
+
+def fresh_import():
+    """Import the simulated board config afresh; return `(module, us, bytes)`."""
+
+    for name in ('hwconfig', 'hwconfig_SIM', 'board'):
+        sys.modules.pop(name, None)
+    gc.collect()
+    mem = mem_alloc()
+    start = benchlib.ticks_us()
+    module = __import__('hwconfig_SIM')
+    us = benchlib.ticks_diff(benchlib.ticks_us(), start)
+    return module, us, mem_alloc() - mem
+
+#-----------------------------------------------------------------------------
+
+def construct(module, names):
+    """Construct the named peripherals; return `(us, bytes)`."""
+
+    board = module.BOARD
+    names = board.names() if names is None else names
+    gc.collect()
+    mem = mem_alloc()
+    start = benchlib.ticks_us()
+    for name in names:
+        board.get(name)
+    us = benchlib.ticks_diff(benchlib.ticks_us(), start)
+    return us, mem_alloc() - mem
+
+##============================================================================
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_hwconfig')
+    results = benchlib.Results()
+    mem_start()
+
+    import_us = []
+    for _ in range(REPEAT):
+        _, us, nbytes = fresh_import()
+        import_us.append(us)
+    import_us.sort()
+    results.add('import.time', benchlib.percentile(import_us, 50), 'us')
+    results.add('import.heap', nbytes, 'bytes')
+
+    for app, names in APPS:
+        times = []
+        for _ in range(REPEAT):
+            module, us, _ = fresh_import()
+            us, nbytes = construct(module, names)
+            times.append(us)
+        times.sort()
+        results.add('{}.construct_time'.format(app), benchlib.percentile(times, 50), 'us')
+        results.add('{}.construct_heap'.format(app), nbytes, 'bytes')
+
+    mem_stop()
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
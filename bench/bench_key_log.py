@@ -0,0 +1,253 @@
+"""
+Key event log benchmark
+=======================
+
+Measures `key_log.KeyLog` on the host (or unix port) filesystem:
+
+    * write amplification: bytes written to flash per byte of event
+      records, for a busy keypad (blocks fill up) and a slow one (blocks are
+      written part full when `max_age_ms` expires),
+    * flush latency: time per sector sized block write,
+    * the same for the naive approach of appending each record to a file
+      and flushing it; on flash every flush programs (at least) a whole
+      sector, so its amplification is estimated as `SECTOR_SIZE /
+      RECORD_SIZE`,
+    * torn write recovery: the log is cut or corrupted part way through its
+      last block, reopened, and must read back exactly the events before the
+      torn block and carry on logging after it, with no sequence number
+      gaps, also after the log has wrapped around its segments (the
+      benchmark fails otherwise).
+
+Events are timed with a simulated clock, so the runs are fast and
+repeatable.
+
+Notes
+-----
+
+    * To run, from the repo root:
+        $ python3 bench/bench_key_log.py [-n SCALE] [DIR]
+
+      Log files are written to DIR (default: a temporary directory).
+
+"""
+
+##============================================================================
+
+import os
+
+import benchlib
+
+benchlib.setup(hwconfig=None)
+
+from key_log import KeyLog, SECTOR_SIZE, RECORD_SIZE, records_per_block
+
+##============================================================================
+
+NSEGMENTS = 4
+SEGMENT_BLOCKS = 16
+
+##============================================================================
+
+def temp_dir():
+    """Return a directory for the log files."""
+
+    try:
+        import tempfile
+        return tempfile.mkdtemp()
+    except ImportError:
+        path = '/tmp/bench_key_log'
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass
+        return path
+
+#-----------------------------------------------------------------------------
+
+def remove_log(path):
+    for i in range(NSEGMENTS):
+        try:
+            os.remove('{}{}.bin'.format(path, i))
+        except OSError:
+            pass
+    try:
+        os.remove(path + '.naive')
+    except OSError:
+        pass
+
+#-----------------------------------------------------------------------------
+
+class Clock():
+    """Simulated ms clock."""
+
+    def __init__(self):
+        self.t = 0
+
+    def __call__(self):
+        return self.t
+
+##============================================================================
+
+def run_log(path, nevents, event_interval_ms):
+    """Log `nevents` events, one every `event_interval_ms`; return the log and block write times."""
+
+    remove_log(path)
+    clock = Clock()
+    log = KeyLog(path, nsegments=NSEGMENTS, segment_blocks=SEGMENT_BLOCKS, clock=clock)
+    times = []
+    next_run = log.interval_ms
+
+    for i in range(nevents):
+        log.add(i & 15, i & 3)
+        clock.t += event_interval_ms
+
+        ## What the run() task does every interval_ms.
+        while clock.t >= next_run:
+            next_run += log.interval_ms
+            if log.due():
+                log._seal()
+            while log.full:
+                start = benchlib.ticks_us()
+                log._write_block()
+                times.append(benchlib.ticks_diff(benchlib.ticks_us(), start))
+
+    log.close()
+    times.sort()
+    return log, times
+
+#-----------------------------------------------------------------------------
+
+def run_naive(path, nevents):
+    """Append and flush each record; return the write times."""
+
+    remove_log(path)
+    record = bytes(RECORD_SIZE)
+    times = []
+    with open(path + '.naive', 'ab') as f:
+        for _ in range(nevents):
+            start = benchlib.ticks_us()
+            f.write(record)
+            f.flush()
+            times.append(benchlib.ticks_diff(benchlib.ticks_us(), start))
+    times.sort()
+    return times
+
+##============================================================================
+
+def continuous(events):
+    """True if the events' sequence numbers have no gaps."""
+
+    return all(events[i][0] == events[0][0] + i for i in range(len(events)))
+
+#-----------------------------------------------------------------------------
+
+def check_recovery(path, nevents, tear):
+    """Log, tear the last block written, reopen; return None if recovery is correct, else what failed."""
+
+    remove_log(path)
+    clock = Clock()
+    log = KeyLog(path, nsegments=NSEGMENTS, segment_blocks=SEGMENT_BLOCKS, clock=clock)
+    for i in range(nevents):
+        clock.t += 1
+        log.add(i & 15, i & 3)
+        if log.full:
+            log._write_block()
+    log.flush()
+    log.file.close()
+    segment, used = log.segment, log.segment_used
+    good = list(KeyLog.read(path, NSEGMENTS))
+
+    ## Tear the last block: cut it short, or scribble over part of it.
+    seg_path = log.segment_path(segment)
+    with open(seg_path, 'rb') as f:
+        data = bytearray(f.read())
+    offset = (used - 1) * SECTOR_SIZE
+    torn = data[offset + 2:offset + 10]
+    if tear == 'cut':
+        data = data[:offset + SECTOR_SIZE // 2]
+    else:
+        for i in range(SECTOR_SIZE // 3, SECTOR_SIZE // 2):
+            data[offset + i] ^= 0x5A
+    with open(seg_path, 'wb') as f:
+        f.write(data)
+
+    ## The events of the torn block are lost, all before it are kept (the
+    ## oldest ones only if the log has not wrapped around).
+    lost = torn[6] | (torn[7] << 8)
+    expected = good[:len(good) - lost]
+    wrapped = good[0][0] != 0
+    if not continuous(good) or good[-1][0] != nevents - 1:
+        return 'log not continuous before the tear'
+    next_seq = expected[-1][0] + 1 if expected else 0
+
+    log = KeyLog(path, nsegments=NSEGMENTS, segment_blocks=SEGMENT_BLOCKS, clock=clock)
+    if list(KeyLog.read(path, NSEGMENTS)) != expected:
+        return 'events after reopening'
+    if log.seq != next_seq:
+        return 'log.seq {} after reopening, expected {}'.format(log.seq, next_seq)
+    for i in range(10):
+        log.add(1, 1)
+    log.close()
+
+    ## Logging carries on from the last kept event (appending may rotate
+    ## out the oldest segment, so only a suffix of `expected` may be left).
+    after = list(KeyLog.read(path, NSEGMENTS))
+    if not continuous(after) or after[-1][0] != next_seq + 9:
+        return 'sequence after logging on'
+    kept = [ event for event in after if event[0] < next_seq ]
+    if kept != expected[len(expected) - len(kept):]:
+        return 'kept events changed after logging on'
+    if not wrapped and kept != expected:
+        return 'events lost without a wrap around'
+    return None
+
+##============================================================================
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_key_log')
+    nevents = int(5000 * opts['scale'])
+    directory = opts['args'][0] if opts['args'] else temp_dir()
+    path = directory + '/keylog'
+    results = benchlib.Results()
+
+    for name, interval in (('busy', 50), ('slow', 2000)):
+        log, times = run_log(path, nevents, interval)
+        results.add('{}.write_amplification'.format(name), log.write_amplification(), 'x')
+        results.add('{}.records_per_block'.format(name), log.records_written / log.blocks_written, 'records', better='higher')
+        results.add('{}.events_dropped'.format(name), log.events_dropped, 'events')
+        results.add('{}.block_write_p50'.format(name), benchlib.percentile(times, 50), 'us')
+        results.add('{}.block_write_p99'.format(name), benchlib.percentile(times, 99), 'us')
+        results.add('{}.block_write_max'.format(name), times[-1] if times else 0, 'us')
+        results.add('{}.sector_writes_per_1000_events'.format(name), log.blocks_written * 1000 / nevents, 'sectors')
+
+    times = run_naive(path, nevents)
+    results.add('naive.write_amplification', SECTOR_SIZE / RECORD_SIZE, 'x')
+    results.add('naive.record_write_p50', benchlib.percentile(times, 50), 'us')
+    results.add('naive.record_write_p99', benchlib.percentile(times, 99), 'us')
+    results.add('naive.sector_writes_per_1000_events', 1000, 'sectors')
+
+    rpb = records_per_block()
+    ring = rpb * SEGMENT_BLOCKS * NSEGMENTS
+    trials = 0
+    for tear in ('cut', 'corrupt'):
+        for n in (rpb // 2, rpb * SEGMENT_BLOCKS + 7, rpb * 3,
+                  ring + rpb * 5 + 3,                       ## wrapped, mid segment
+                  ring + rpb * SEGMENT_BLOCKS + 1,          ## wrapped, torn first block of a segment
+                  2 * ring + rpb * (SEGMENT_BLOCKS - 1)):   ## wrapped twice, torn last block of a segment
+            trials += 1
+            failed = check_recovery(path, n, tear)
+            if failed:
+                raise SystemExit('recovery ({} tear, {} events): {}'.format(tear, n, failed))
+    results.add('recovery.trials', trials, 'trials', better='higher')
+
+    remove_log(path)
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
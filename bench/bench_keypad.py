@@ -0,0 +1,279 @@
+"""
+Keypad and LCD path benchmarks
+==============================
+
+Runs the keypad scanners and the LCD key handling against the simulated
+board (`hwapi/hwconfig_SIM.py`) and reports:
+
+    * key_process() time per call (timer and uasyncio scanners).
+    * full-matrix scan time per frame (timer callback and scan_coro).
+    * key events per second through the keypad queue.
+    * press-to-consumer latency percentiles.
+    * key event to action resolve time per call (keymap).
+    * LCD (I2C) bytes written per keystroke.
+
+Notes
+-----
+
+    * To run (MicroPython unix port or CPython), from the repo root:
+        $ micropython bench/bench_keypad.py
+        $ python3 bench/bench_keypad.py -b baseline.json
+
+    * See `benchlib.py` for the command line options and results format.
+
+    * `scan_coro` is run with `row_scan_delay_ms = 0` so the numbers are the
+      software overhead of the scan, not the (deliberate) row settle delay.
+
+"""
+
+##============================================================================
+
+import benchlib
+from benchlib import ticks_us, ticks_diff
+
+benchlib.setup()
+
+import hwconfig
+from keypad_timer import Keypad_Timer
+from keypad_uasyncio import Keypad_uasyncio, asyncio, sleep_ms
+from keypad_lcd_uasyncio import lcd_key_process
+import keymap
+
+##============================================================================
+
+MATRIX = hwconfig.MATRIX
+
+##============================================================================
+
+class FrameCounter():
+    """Wraps the first row pin of a keypad to count scan frames.
+
+       Calls `hook(frame)` at the start of each frame and stops the
+       keypad after `frames` frames.
+    """
+
+    def __init__(self, keypad, frames, hook=None):
+        """Constructor."""
+
+        self.keypad = keypad
+        self.pin = keypad.row_pins[0]
+        self.frames = frames
+        self.frame = 0
+        self.hook = hook
+        keypad.row_pins[0] = self
+
+    #-------------------------------------------------------------------------
+
+    def value(self, x=None):
+        if x:
+            if self.hook:
+                self.hook(self.frame)
+            self.frame += 1
+            if self.frame >= self.frames:
+                self.keypad.running = False
+        return self.pin.value(x)
+
+##============================================================================
+
+def bench_key_process(results, count):
+    """Time `key_process()` for both scanners."""
+
+    for name, keypad in (('timer', Keypad_Timer()), ('uasyncio', Keypad_uasyncio())):
+        col_pin = keypad.col_pins[0]
+        keypad.row_pins[0].value(1)
+
+        MATRIX.release_all()
+        t = benchlib.time_per_call(lambda: keypad.key_process(0, col_pin), count)
+        results.add('key_process.{}.idle'.format(name), t, 'us')
+
+        MATRIX.press(0)
+        t = benchlib.time_per_call(lambda: keypad.key_process(0, col_pin), count)
+        results.add('key_process.{}.held'.format(name), t, 'us')
+
+        MATRIX.release_all()
+        keypad.row_pins[0].value(0)
+
+#-----------------------------------------------------------------------------
+
+def bench_timer_frame(results, count):
+    """Time a full-matrix scan (one timer tick per row) of Keypad_Timer."""
+
+    keypad = Keypad_Timer()
+    nrows = len(keypad.row_pins)
+
+    def frame():
+        for _ in range(nrows):
+            keypad.timer_callback(keypad.timer)
+
+    MATRIX.release_all()
+    results.add('scan_frame.timer.idle', benchlib.time_per_call(frame, count), 'us')
+    MATRIX.press(5)
+    results.add('scan_frame.timer.held', benchlib.time_per_call(frame, count), 'us')
+    MATRIX.release_all()
+
+#-----------------------------------------------------------------------------
+
+def bench_uasyncio_frame(results, count):
+    """Time a full-matrix scan of Keypad_uasyncio.scan_coro."""
+
+    keypad = Keypad_uasyncio(start=True)
+    keypad.row_scan_delay_ms = 0
+    FrameCounter(keypad, count)
+
+    MATRIX.release_all()
+    start = ticks_us()
+    benchlib.run_async(keypad.scan_coro())
+    results.add('scan_frame.uasyncio.idle', ticks_diff(ticks_us(), start) / count, 'us')
+
+#-----------------------------------------------------------------------------
+
+def bench_queue_throughput(results, count):
+    """Key events per second through the keypad queue to a consumer."""
+
+    keypad = Keypad_uasyncio(queue_size=4, start=True)
+    keypad.row_scan_delay_ms = 0
+    nkeys = len(keypad.keys)
+
+    ## Press all keys on even frames, release them on odd frames, so every
+    ## second frame produces one event per key.
+    def toggle(frame):
+        if frame & 1:
+            MATRIX.release_all()
+        else:
+            for key_code in range(nkeys):
+                MATRIX.press(key_code)
+
+    FrameCounter(keypad, count, hook=toggle)
+    received = [ 0 ]
+
+    async def consumer():
+        while True:
+            await keypad.get_key()
+            received[0] += 1
+
+    async def main():
+        task = asyncio.get_event_loop().create_task(consumer())
+        start = ticks_us()
+        await keypad.scan_coro()
+        while keypad.queue.qsize():
+            await sleep_ms(0)
+        elapsed = ticks_diff(ticks_us(), start)
+        task.cancel()
+        return elapsed
+
+    elapsed = benchlib.run_async(main())
+    MATRIX.release_all()
+    results.add('queue.events_per_sec', received[0] * 1000000 / elapsed, 'events/s', better='higher')
+
+#-----------------------------------------------------------------------------
+
+def bench_latency(results, count):
+    """Latency from the key release (which emits the event) to the consumer."""
+
+    keypad = Keypad_uasyncio(queue_size=4, start=True)
+    keypad.row_scan_delay_ms = 0
+    released_at = [ 0 ]
+    latencies = []
+
+    ## Press key 10 for 2 frames, release it for 2 frames, and so on.
+    def toggle(frame):
+        phase = frame & 3
+        if phase == 0:
+            MATRIX.press(10)
+        elif phase == 2:
+            MATRIX.release(10)
+            released_at[0] = ticks_us()
+
+    FrameCounter(keypad, count * 4, hook=toggle)
+
+    async def consumer():
+        while True:
+            await keypad.get_key()
+            latencies.append(ticks_diff(ticks_us(), released_at[0]))
+
+    async def main():
+        task = asyncio.get_event_loop().create_task(consumer())
+        await keypad.scan_coro()
+        await sleep_ms(0)
+        task.cancel()
+
+    benchlib.run_async(main())
+    MATRIX.release_all()
+
+    latencies.sort()
+    for pct in (50, 90, 99):
+        results.add('latency.p{}'.format(pct), benchlib.percentile(latencies, pct), 'us')
+    results.add('latency.max', latencies[-1] if latencies else 0, 'us')
+
+#-----------------------------------------------------------------------------
+
+def bench_keymap(results, count):
+    """Time resolving a key event to an action, in the base and a switched layer."""
+
+    km = keymap.Keymap(keymap.LCD_LAYOUT)
+    results.add('keymap.layers', len(km.names), 'layers', better='higher')
+    results.add('keymap.table_size', len(km.table), 'bytes')
+
+    t = benchlib.time_per_call(lambda: km.resolve(13, keymap.EVENT_UP), count)
+    results.add('keymap.resolve.base', t, 'us')
+
+    km.set_layer(km.layer_index('function'))
+    t = benchlib.time_per_call(lambda: km.resolve(5, keymap.EVENT_UP), count)
+    results.add('keymap.resolve.layer', t, 'us')
+
+    ## A momentary modifier held past the long press time stays on until
+    ## released.
+    km = keymap.Keymap([
+        ('base', { 'up': list('123A456B789C*0#D'), 'down': [ None ] * 15 + [ keymap.momentary('fn') ] }),
+        ('fn', { 'up': list('abcdefghijklmno') + [ None ] }),
+        ])
+    layers = []
+    for key_code, key_event in ((15, keymap.EVENT_DOWN), (15, keymap.EVENT_LONG), (5, keymap.EVENT_UP),
+                                (15, keymap.EVENT_UP_LONG), (5, keymap.EVENT_UP)):
+        action = km.resolve(key_code, key_event)
+        layers.append((km.layer, chr(action) if action else None))
+    if layers != [ (1, None), (1, None), (1, 'f'), (0, None), (0, '5') ]:
+        raise SystemExit('keymap: momentary layer released by a long press: {}'.format(layers))
+
+#-----------------------------------------------------------------------------
+
+def bench_lcd_bytes(results):
+    """I2C bytes written to the LCD per keystroke."""
+
+    i2c = hwconfig.I2C(1, hwconfig.I2C.MASTER)
+    lcd = hwconfig.SimLcd(i2c, 0x27, 4, 20)
+
+    for name, action in (('char', ord('A')), ('enter', keymap.ENTER), ('backspace', keymap.BACKSPACE),
+                         ('erase_line', keymap.CLEAR_LINE), ('erase_screen', keymap.CLEAR_SCREEN),
+                         ('cursor_right', keymap.CURSOR_RIGHT)):
+        count = 100
+        start = i2c.bytes_written
+        for _ in range(count):
+            lcd_key_process(lcd, action)
+        results.add('lcd.bytes_per_key.{}'.format(name), (i2c.bytes_written - start) / count, 'bytes')
+
+##============================================================================
+
+def main():
+    """Run all benchmarks."""
+
+    opts = benchlib.parse_args('bench_keypad')
+    scale = opts['scale']
+    results = benchlib.Results()
+
+    bench_key_process(results, int(20000 * scale))
+    bench_timer_frame(results, int(5000 * scale))
+    bench_uasyncio_frame(results, int(2000 * scale))
+    bench_queue_throughput(results, int(2000 * scale))
+    bench_latency(results, int(500 * scale))
+    bench_keymap(results, int(20000 * scale))
+    bench_lcd_bytes(results)
+
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+I2C GPIO expander keypad benchmark
+==================================
+
+Replays the synthetic soak trace of `bench_keypad_trace.py` (typing bursts,
+long presses, chords and long idle stretches) through keypads on simulated
+I2C GPIO expanders, and reports I2C transactions and bytes per frame (and
+transactions per scanned frame), the fraction of frames scanned, and the
+replay rate, for:
+
+    * naive         -- MCP23017 matrix, separate row write and column read
+                       register transactions, scanned every frame,
+    * combined      -- MCP23017 matrix, one (repeated start) transaction per
+                       row, scanned every frame,
+    * combined_int  -- as combined, idle frames skipped with the INT line,
+    * direct_int    -- MCP23017 with one key per pin, one burst read per
+                       scanned frame, INT idle skip,
+    * pcf8574_int   -- PCF8574 matrix, one transaction per row, INT skip.
+
+Each replay must produce the same keys as the pin keypad (`Keypad_uasyncio`).
+
+Notes
+-----
+
+    * To run (MicroPython unix port or CPython), from the repo root:
+        $ micropython bench/bench_keypad_expander.py
+        $ python3 bench/bench_keypad_expander.py -n 0.1
+
+"""
+
+##============================================================================
+
+import benchlib
+
+benchlib.setup()
+
+import hwconfig
+from board import ExpanderKeypad
+from keypad_uasyncio import Keypad_uasyncio
+from keypad_expander import Keypad_expander, MCP23017
+from bench_keypad_trace import make_trace, replay
+
+##============================================================================
+
+MATRIX = hwconfig.MATRIX
+ADDR = 0x20
+
+##============================================================================
+
+class NaiveMCP23017(MCP23017):
+    """Row write and column read as separate register transactions."""
+
+    def read_row(self, row):
+        i2c = self.i2c
+        i2c.writeto_mem(self.addr, self.GPIOA, self.row_bufs[row][1:])
+        i2c.readfrom_mem_into(self.addr, self.GPIOB, self.buf1)
+        self.transactions += 2
+        return ~self.buf1[0] & self.col_mask
+
+##============================================================================
+
+def make_keypad(sim_device, chip='MCP23017', wiring='matrix', use_int=True, chip_class=None):
+    """Return `(keypad, i2c, device)` for a keypad on a fresh simulated bus."""
+
+    i2c = hwconfig.I2C(3, hwconfig.I2C.MASTER)
+    int_pin = hwconfig.Pin('PE3', hwconfig.Pin.IN, hwconfig.Pin.PULL_UP)
+    device = sim_device(MATRIX, int_pin, wiring=wiring)
+    i2c.add_device(ADDR, device)
+    expander = ExpanderKeypad(i2c, ADDR, chip, int_pin if use_int else None, 4, 4, wiring)
+    keypad = Keypad_expander(expander=expander)
+    if chip_class:
+        keypad.chip = chip_class(i2c, ADDR, 4, 4, wiring)
+    return keypad, i2c, device
+
+##============================================================================
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_keypad_expander')
+    frames = int(100000 * opts['scale'])
+    results = benchlib.Results()
+
+    trace = make_trace(frames).trace()
+    _, _, ref_keys, _ = replay(trace, Keypad_uasyncio(), record=False)
+
+    variants = [
+        ('naive', hwconfig.SimMCP23017, 'MCP23017', 'matrix', False, NaiveMCP23017),
+        ('combined', hwconfig.SimMCP23017, 'MCP23017', 'matrix', False, None),
+        ('combined_int', hwconfig.SimMCP23017, 'MCP23017', 'matrix', True, None),
+        ('direct_int', hwconfig.SimMCP23017, 'MCP23017', 'direct', True, None),
+        ('pcf8574_int', hwconfig.SimPCF8574, 'PCF8574', 'matrix', True, None),
+        ]
+    for name, sim_device, chip, wiring, use_int, chip_class in variants:
+        keypad, i2c, device = make_keypad(sim_device, chip, wiring, use_int, chip_class)
+        start_transactions = i2c.transactions
+        start_bytes = i2c.bytes_written + i2c.bytes_read
+        nframes, elapsed, keys, _ = replay(trace, keypad, record=False)
+        MATRIX.listeners.remove(device.update)
+        if keys != ref_keys:
+            raise SystemExit('{}: keys differ from the pin keypad'.format(name))
+
+        transactions = i2c.transactions - start_transactions
+        nbytes = i2c.bytes_written + i2c.bytes_read - start_bytes
+        results.add('{}.transactions_per_frame'.format(name), transactions / nframes, 'transactions')
+        results.add('{}.transactions_per_scan'.format(name), transactions / keypad.scans, 'transactions')
+        results.add('{}.bytes_per_frame'.format(name), nbytes / nframes, 'bytes')
+        results.add('{}.scanned_frames'.format(name), keypad.scans * 100 / keypad.frames, '%')
+        results.add('{}.frames_per_sec'.format(name), nframes / elapsed, 'frames/s', better='higher')
+
+    results.add('keys', len(ref_keys), 'keys', better='higher')
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
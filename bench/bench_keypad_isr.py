@@ -0,0 +1,97 @@
+"""
+Keypad timer ISR benchmark
+==========================
+
+Reports the time per timer tick (one row scanned) of the original
+`Keypad_Timer.timer_callback` and of each `Keypad_Timer_Fast` hot path
+variant available on this port (python, native, viper), and checks they
+all report the same keys.
+
+Notes
+-----
+
+    * To run (MicroPython unix port or CPython), from the repo root:
+        $ micropython bench/bench_keypad_isr.py
+        $ python3 bench/bench_keypad_isr.py -b baseline.json
+
+    * CPython only has the python variant.
+
+"""
+
+##============================================================================
+
+import benchlib
+
+benchlib.setup()
+
+import hwconfig
+from keypad_timer import Keypad_Timer
+from keypad_timer_fast import Keypad_Timer_Fast, EMITTERS
+
+##============================================================================
+
+MATRIX = hwconfig.MATRIX
+
+## Keys pressed/released during the equivalence check: (tick, key_code, down).
+PRESSES = [ (1, 0, 1), (9, 0, 0), (12, 5, 1), (14, 15, 1), (30, 5, 0), (31, 15, 0), (40, 10, 1), (48, 10, 0) ]
+
+##============================================================================
+
+def keys_seen(keypad, ticks=64):
+    """Run the keypad for `ticks` ticks, returning the keys reported."""
+
+    seen = []
+    presses = list(PRESSES)
+    MATRIX.release_all()
+    for tick in range(ticks):
+        while presses and presses[0][0] == tick:
+            _, key_code, down = presses.pop(0)
+            if down:
+                MATRIX.press(key_code)
+            else:
+                MATRIX.release(key_code)
+        keypad.timer_callback(keypad.timer)
+        key = keypad.get_key()
+        if key:
+            seen.append(key)
+    MATRIX.release_all()
+    return seen
+
+#-----------------------------------------------------------------------------
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_keypad_isr')
+    count = int(20000 * opts['scale'])
+    results = benchlib.Results()
+
+    variants = [ ('bytecode_original', Keypad_Timer()) ]
+    for name in ('python', 'native', 'viper'):
+        if name in EMITTERS:
+            variants.append((name, Keypad_Timer_Fast(emitter=name)))
+
+    expected = keys_seen(variants[0][1])
+    for name, keypad in variants:
+        seen = keys_seen(keypad)
+        if seen != expected:
+            print('MISMATCH', name, seen, expected)
+            raise SystemExit(1)
+
+        callback = keypad.timer_callback
+        timer = keypad.timer
+
+        MATRIX.release_all()
+        results.add('isr_tick.{}.idle'.format(name), benchlib.time_per_call(lambda: callback(timer), count), 'us')
+        MATRIX.press(6)
+        results.add('isr_tick.{}.held'.format(name), benchlib.time_per_call(lambda: callback(timer), count), 'us')
+        MATRIX.release_all()
+
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Keypad trace replay benchmark
+=============================
+
+Builds a synthetic soak trace (bursts of typing, long presses, chords and
+long idle stretches at 25 frames/s), then replays it as fast as possible
+through the simulated pins into `Keypad_uasyncio` and `Keypad_Timer_Fast`.
+
+Reports the replay rate (frames per second) and the trace size, and checks
+the replay is bit-exact: recording during the replay must reproduce the
+trace byte for byte, and a second replay must produce the same keys.
+
+Notes
+-----
+
+    * To run (MicroPython unix port or CPython), from the repo root:
+        $ micropython bench/bench_keypad_trace.py
+        $ python3 bench/bench_keypad_trace.py -n 10     ## 10x longer soak
+
+"""
+
+##============================================================================
+
+import benchlib
+from benchlib import ticks_us, ticks_diff
+
+benchlib.setup()
+
+import hwconfig
+from keypad_uasyncio import Keypad_uasyncio
+from keypad_timer_fast import Keypad_Timer_Fast
+from keypad_trace import TraceRecorder, TraceReplay
+
+##============================================================================
+
+MATRIX = hwconfig.MATRIX
+FRAME_MS = 40
+
+##============================================================================
+
+def make_trace(frames):
+    """Record a synthetic session of about `frames` frames (deterministic)."""
+
+    ## Timestamps from a fake clock, FRAME_MS per frame.
+    clock = [ 0 ]
+
+    def fake_clock():
+        clock[0] += FRAME_MS
+        return clock[0]
+
+    keypad = Keypad_uasyncio()
+    recorder = TraceRecorder(nrows=4, ncols=4, size=frames // 16 + 4096, clock=fake_clock)
+    keypad.trace = recorder
+    key_chars = []
+    seed = 12345
+
+    frame = 0
+    while frame < frames:
+        ## simple LCG so the trace is the same on every port
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        choice = seed >> 16
+        key_code = choice & 15
+        if choice & 0x300 == 0:
+            held, idle = 30, 10         ## long press
+        elif choice & 0x300 == 0x100:
+            held, idle = 3, 2000        ## press then long idle
+        else:
+            held, idle = 2 + (choice & 3), 3 + ((choice >> 4) & 7)
+        if choice & 0x400:
+            MATRIX.press((key_code + 5) & 15)   ## chord
+        MATRIX.press(key_code)
+        for _ in range(held):
+            keypad.scan_frame(key_chars)
+        MATRIX.release_all()
+        for _ in range(idle):
+            keypad.scan_frame(key_chars)
+        frame += held + idle
+
+    MATRIX.release_all()
+    return recorder
+
+#-----------------------------------------------------------------------------
+
+def replay(trace, keypad, record=True):
+    """Replay a trace into a keypad, returning (frames, seconds, keys, recorder)."""
+
+    recorder = TraceRecorder(trace.nrows, trace.ncols, size=len(trace.records) + 64) if record else None
+    keypad.trace = recorder
+    keys = []
+    player = TraceReplay(trace, keypad, MATRIX)
+    start = ticks_us()
+    player.run(on_key=lambda frame, key_char: keys.append((frame, key_char)))
+    elapsed = ticks_diff(ticks_us(), start) / 1000000
+    MATRIX.release_all()
+    return player.frames, elapsed, keys, recorder
+
+#-----------------------------------------------------------------------------
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_keypad_trace')
+    frames = int(200000 * opts['scale'])
+    results = benchlib.Results()
+
+    recorder = make_trace(frames)
+    trace = recorder.trace()
+    results.add('trace.frames', recorder.frames, 'frames', better='higher')
+    results.add('trace.bytes_per_kframe', len(trace.records) * 1000 / recorder.frames, 'bytes')
+
+    for name, keypad in (('uasyncio', Keypad_uasyncio()), ('timer_fast', Keypad_Timer_Fast())):
+        nframes, elapsed, keys, rerecorded = replay(trace, keypad)
+        if nframes != recorder.frames:
+            raise SystemExit('{}: replayed {} of {} frames'.format(name, nframes, recorder.frames))
+        if name == 'uasyncio' and rerecorded.records() != trace.records:
+            raise SystemExit('{}: replay is not bit-exact'.format(name))
+        _, _, keys2, _ = replay(trace, type(keypad)(), record=False)
+        if keys2 != keys:
+            raise SystemExit('{}: replays differ'.format(name))
+        results.add('replay.{}.frames_per_sec'.format(name), nframes / elapsed, 'frames/s', better='higher')
+        results.add('replay.{}.keys'.format(name), len(keys), 'keys', better='higher')
+
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
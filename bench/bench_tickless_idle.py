@@ -0,0 +1,209 @@
+"""
+Tickless idle benchmark (simulated board, CPython asyncio)
+==========================================================
+
+Runs two app workloads on the event loop, without and with the
+`tickless_idle` hook, using the simulated board's fake lightsleep
+(`hwconfig_SIM.LIGHTSLEEP`), and reports:
+
+    * time asleep (% of wall time) and sleeps per second,
+    * task wakeup lateness (p50/p99/max) of a probe task sleeping random
+      12-60ms intervals, i.e. the accuracy cost of sleeping,
+    * pin IRQ wake latency (p99): a thread toggles the button pin, a wake
+      source, while the loop sleeps.
+
+Workloads:
+
+    * keypad    -- expander keypad scan (40ms frames, INT idle skip) and
+                   button polling (100ms), as `keypad_expander.py`,
+    * leds      -- LED fade (1-19ms PWM sleeps) and button polling, as
+                   `led_fade_flash_uasyncio.py`.
+
+Variants: `off` (no hook), `tickless` (threshold 10ms, margin 2ms), and
+`tickless` with the fake lightsleep waking 1ms late (within the margin)
+and 5ms late (3ms beyond it).
+
+The benchmark fails if a variant's lateness p99 exceeds the accuracy bound
+of `tickless_idle`: the `off` p99 + max(0, overshoot - margin), plus
+`TOLERANCE_MS` for host scheduling noise.
+
+Notes
+-----
+
+    * Needs CPython (threads, and the asyncio selector hook):
+        $ python3 bench/bench_tickless_idle.py [-n SCALE]
+
+"""
+
+##============================================================================
+
+import asyncio
+import threading
+import time
+
+import benchlib
+
+benchlib.setup()
+
+import hwconfig
+import tickless_idle
+from keypad_expander import Keypad_expander
+
+##============================================================================
+
+DURATION_S = 2.0
+PROBE_SEED = 12345
+TOLERANCE_MS = 2.0
+
+##============================================================================
+
+async def button_poll(button, state):
+    """Poll the button every 100ms (as `check_button()`)."""
+
+    while True:
+        await asyncio.sleep(0.1)
+        if button.value():
+            state['flash_count'] = 10
+
+#-----------------------------------------------------------------------------
+
+async def led_fade(led, state):
+    """Fade the LED with 20ms PWM cycles, or flash it (as `update_led()`)."""
+
+    while True:
+        if state['flash_count'] > 0:
+            led.value(1)
+            await asyncio.sleep(0.1)
+            led.value(0)
+            await asyncio.sleep(0.1)
+            state['flash_count'] -= 1
+            continue
+        for duty in list(range(1, 21)) + list(range(20, 0, -1)):
+            if duty:
+                led.value(1)
+                await asyncio.sleep(duty / 1000)
+            if 20 - duty:
+                led.value(0)
+                await asyncio.sleep((20 - duty) / 1000)
+
+#-----------------------------------------------------------------------------
+
+async def probe(lateness):
+    """Sleep random intervals, recording how late each wakeup is (us)."""
+
+    seed = PROBE_SEED
+    while True:
+        seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+        delay = (12 + (seed >> 16) % 49) / 1000
+        target = time.perf_counter() + delay
+        await asyncio.sleep(delay)
+        lateness.append((time.perf_counter() - target) * 1000000)
+
+#-----------------------------------------------------------------------------
+
+def button_toggler(button, stop):
+    """Thread: toggle the button pin every 250ms (an external signal)."""
+
+    level = 0
+    while not stop.wait(0.25):
+        level ^= 1
+        button.set_level(level)
+
+##============================================================================
+
+async def run_workload(workload, hook, overshoot_ms, duration):
+    """Run a workload; return a dict of results."""
+
+    loop = asyncio.get_event_loop()
+    sleep = hwconfig.LIGHTSLEEP
+    sleep.overshoot_ms = overshoot_ms
+    button = hwconfig.BUTTON
+    state = { 'flash_count': 0 }
+    lateness = []
+
+    idle = None
+    if hook:
+        idle = tickless_idle.install(loop=loop)
+        idle.add_wake_pin(button)
+    else:
+        button.irq(handler=lambda pin: None)
+    sleep.reset()
+
+    tasks = [ loop.create_task(button_poll(button, state)), loop.create_task(probe(lateness)) ]
+    keypad = None
+    if workload == 'keypad':
+        keypad = Keypad_expander(start=True)
+        tasks.append(loop.create_task(keypad.scan_coro()))
+    else:
+        tasks.append(loop.create_task(led_fade(hwconfig.LED, state)))
+
+    stop = threading.Event()
+    toggler = threading.Thread(target=button_toggler, args=(button, stop))
+    toggler.start()
+    await asyncio.sleep(duration)
+    stop.set()
+    toggler.join()
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    asleep_ms, awake_ms = sleep.report()
+    if idle:
+        tickless_idle.uninstall(loop)
+    button.irq(handler=None)
+
+    lateness.sort()
+    latencies = sorted(t * 1000000 for t in sleep.wake_latencies)
+    return {
+        'asleep': 100 * asleep_ms / (asleep_ms + awake_ms),
+        'sleeps_per_sec': sleep.sleeps * 1000 / (asleep_ms + awake_ms),
+        'lateness_p50': benchlib.percentile(lateness, 50),
+        'lateness_p99': benchlib.percentile(lateness, 99),
+        'lateness_max': lateness[-1],
+        'irq_wake_p99': benchlib.percentile(latencies, 99) if latencies else 0,
+        }
+
+##============================================================================
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_tickless_idle')
+    duration = DURATION_S * opts['scale']
+    results = benchlib.Results()
+
+    variants = [
+        ('off', False, 0),
+        ('tickless', True, 0),
+        ('tickless_late1ms', True, 1),
+        ('tickless_late5ms', True, 5),
+        ]
+    failed = []
+    for workload in ('keypad', 'leds'):
+        for name, hook, overshoot_ms in variants:
+            res = benchlib.run_async(run_workload(workload, hook, overshoot_ms, duration))
+            prefix = '{}.{}'.format(workload, name)
+            if not hook:
+                off_p99 = res['lateness_p99']
+            else:
+                bound = off_p99 + (max(0, overshoot_ms - tickless_idle.MARGIN_MS_DEFAULT) + TOLERANCE_MS) * 1000
+                if res['lateness_p99'] > bound:
+                    failed.append('{}: lateness p99 {:.0f}us > bound {:.0f}us'.format(prefix, res['lateness_p99'], bound))
+            results.add(prefix + '.asleep', res['asleep'], '%', better='higher')
+            results.add(prefix + '.sleeps_per_sec', res['sleeps_per_sec'], 'sleeps/s', better='higher')
+            results.add(prefix + '.lateness_p50', res['lateness_p50'], 'us')
+            results.add(prefix + '.lateness_p99', res['lateness_p99'], 'us')
+            results.add(prefix + '.lateness_max', res['lateness_max'], 'us')
+            if hook:
+                results.add(prefix + '.irq_wake_p99', res['irq_wake_p99'], 'us')
+
+    if failed:
+        raise SystemExit('accuracy bound exceeded:\n    ' + '\n    '.join(failed))
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+asyncio/GUI loop integration benchmark (headless, CPython only)
+===============================================================
+
+Compares the deadline driven `wx_asyncio_loop.GuiEventLoop` with the old
+approach of running the asyncio loop from a 1ms GUI timer, both on the
+headless `FakeBackend`:
+
+    * wakeups per second of the GUI thread while idle and while running
+      three gauge style tasks (sleeping 100, 200 and 300ms),
+    * coroutine wake accuracy (actual - requested `asyncio.sleep()` time),
+    * latency of `call_soon_threadsafe()` from another thread,
+    * latency of I/O readiness (a socket written by another thread),
+    * lateness of `call_later()` made from a GUI event handler (outside a
+      loop iteration) while the loop is idle; the benchmark fails if the
+      callback never fires.
+
+Notes
+-----
+
+    * To run, from the repo root:
+        $ python3 bench/bench_wx_asyncio_loop.py
+
+"""
+
+##============================================================================
+
+import asyncio
+import socket
+import threading
+import time
+
+import benchlib
+
+benchlib.setup(hwconfig=None)
+
+from wx_asyncio_loop import FakeBackend, GuiEventLoop
+
+##============================================================================
+
+class Polling1ms():
+    """The old scheme: run one asyncio iteration from a 1ms GUI timer."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.loop = asyncio.new_event_loop()
+        self.backend.start_timer(0.001, self.tick)
+
+    def tick(self):
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+        self.backend.start_timer(0.001, self.tick)
+
+    def close(self):
+        self.backend.stop_timer()
+        self.loop.close()
+
+#-----------------------------------------------------------------------------
+
+class Deadline():
+    """The new scheme: `GuiEventLoop`."""
+
+    def __init__(self, backend):
+        self.loop = GuiEventLoop(backend)
+
+    def close(self):
+        self.loop.close()
+
+##============================================================================
+
+def run_case(scheme, duration, tasks, threadsafe_calls=0):
+    """Run `tasks` (sleep periods, s) for `duration` s; return stats."""
+
+    backend = FakeBackend()
+    driver = scheme(backend)
+    loop = driver.loop
+    asyncio.set_event_loop(loop)
+    lateness = []
+    threadsafe_latency = []
+    io_latency = []
+    io_sent = [ 0 ]
+    rsock, wsock = socket.socketpair()
+    rsock.setblocking(False)
+
+    def readable():
+        rsock.recv(64)
+        io_latency.append(time.monotonic() - io_sent[0])
+
+    loop.add_reader(rsock.fileno(), readable)
+
+    async def gauge(period):
+        while True:
+            start = loop.time()
+            await asyncio.sleep(period)
+            lateness.append(loop.time() - start - period)
+
+    for period in tasks:
+        loop.create_task(gauge(period))
+
+    def poke():
+        step = duration / (2 * (threadsafe_calls + 1))
+        for _ in range(threadsafe_calls):
+            time.sleep(step)
+            sent = time.monotonic()
+            loop.call_soon_threadsafe(lambda sent=sent: threadsafe_latency.append(time.monotonic() - sent))
+            time.sleep(step)
+            io_sent[0] = time.monotonic()
+            wsock.send(b'x')
+
+    thread = threading.Thread(target=poke)
+    thread.start()
+    backend.run(duration)
+    thread.join()
+
+    loop.remove_reader(rsock.fileno())
+    rsock.close()
+    wsock.close()
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    driver.close()
+    asyncio.set_event_loop(None)
+
+    lateness.sort()
+    threadsafe_latency.sort()
+    return {
+        'wakeups_per_sec': backend.wakeups / duration,
+        'lateness_p50_ms': benchlib.percentile(lateness, 50) * 1000,
+        'lateness_p99_ms': benchlib.percentile(lateness, 99) * 1000,
+        'threadsafe_p50_ms': benchlib.percentile(threadsafe_latency, 50) * 1000,
+        'threadsafe_max_ms': (threadsafe_latency[-1] if threadsafe_latency else 0) * 1000,
+        'io_p50_ms': benchlib.percentile(sorted(io_latency), 50) * 1000,
+        }
+
+def run_gui_call_later(scheme, delays):
+    """Schedule `call_later(delay)` from GUI callbacks on an idle loop; return the lateness (s) of each."""
+
+    backend = FakeBackend()
+    driver = scheme(backend)
+    loop = driver.loop
+    asyncio.set_event_loop(loop)
+    lateness = []
+
+    def fired(target):
+        lateness.append(time.monotonic() - target)
+        if len(lateness) == len(delays):
+            backend.stop()
+        else:
+            backend.call_after(schedule)
+
+    def schedule():
+        ## Runs as a GUI callback, not from the asyncio loop.
+        delay = delays[len(lateness)]
+        loop.call_later(delay, fired, time.monotonic() + delay)
+
+    ## Let the loop go idle first.
+    timer = threading.Timer(0.05, backend.call_after, (schedule,))
+    timer.start()
+    backend.run(0.05 + 2 * sum(delays))
+    timer.join()
+    driver.close()
+    asyncio.set_event_loop(None)
+    return lateness
+
+##============================================================================
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_wx_asyncio_loop')
+    duration = 2 * opts['scale']
+    results = benchlib.Results()
+
+    for name, scheme in (('poll_1ms', Polling1ms), ('deadline', Deadline)):
+        idle = run_case(scheme, duration, [])
+        results.add('{}.idle.wakeups_per_sec'.format(name), idle['wakeups_per_sec'], 'wakeups/s')
+
+        busy = run_case(scheme, duration, [ 0.1, 0.2, 0.3 ], threadsafe_calls=20)
+        results.add('{}.gauges.wakeups_per_sec'.format(name), busy['wakeups_per_sec'], 'wakeups/s')
+        results.add('{}.gauges.lateness_p50'.format(name), busy['lateness_p50_ms'], 'ms')
+        results.add('{}.gauges.lateness_p99'.format(name), busy['lateness_p99_ms'], 'ms')
+        results.add('{}.threadsafe.latency_p50'.format(name), busy['threadsafe_p50_ms'], 'ms')
+        results.add('{}.threadsafe.latency_max'.format(name), busy['threadsafe_max_ms'], 'ms')
+        results.add('{}.io.latency_p50'.format(name), busy['io_p50_ms'], 'ms')
+
+        delays = [ 0.02, 0.05, 0.01 ]
+        lateness = run_gui_call_later(scheme, delays)
+        if len(lateness) != len(delays):
+            raise SystemExit('{}: call_later() from a GUI handler did not fire'.format(name))
+        results.add('{}.gui_call_later.lateness_max'.format(name), max(lateness) * 1000, 'ms')
+
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Gauge dashboard update benchmark (headless, CPython only)
+=========================================================
+
+Runs hundreds of simulated gauges, each updated by its own asyncio task at
+its own period (like `wx_asyncio_test_1.update_gauge*_task`), on a
+`wx_asyncio_loop.GuiEventLoop` with the headless `FakeBackend`, and counts
+the calls made on the (counting) widgets.
+
+Schemes:
+
+    * direct    -- each task calls `SetValue()` on its gauge (one repaint
+                   per call).
+    * fps30     -- tasks write to a `wx_gauge_store.GaugeStore`, a
+    * fps60        `FrameUpdater` applies changed values at 30/60 FPS inside
+                   `Freeze()`/`Thaw()`.
+
+Reports widget calls, repaints and GUI wakeups per second, and the lag
+from a value being written to it reaching its widget.  Also checks that
+writes from GUI callbacks (outside a loop iteration, as the wx timer
+handler of `wx_asyncio_test_1`) reach the widget while the loop is idle
+(the benchmark fails if not).
+
+Notes
+-----
+
+    * To run, from the repo root:
+        $ python3 bench/bench_wx_gauges.py [-n SCALE]
+
+"""
+
+##============================================================================
+
+import asyncio
+import random
+import threading
+
+import benchlib
+
+benchlib.setup(hwconfig=None)
+
+from wx_asyncio_loop import FakeBackend, GuiEventLoop
+from wx_gauge_store import GaugeStore, FrameUpdater, CountingWidget, CountingWindow
+
+##============================================================================
+
+GAUGE_RANGE = 40
+
+class LagWidget(CountingWidget):
+    """Counting widget which also records the write -> widget lag."""
+
+    def __init__(self, window, loop, written, lag):
+        super().__init__(window)
+        self.loop = loop
+        self.written = written
+        self.lag = lag
+
+    def SetValue(self, value):
+        super().SetValue(value)
+        self.lag.append(self.loop.time() - self.written[0])
+
+##============================================================================
+
+def run_case(fps, ngauges, duration):
+    """Run `ngauges` gauges for `duration` s; `fps` None updates widgets directly."""
+
+    backend = FakeBackend()
+    loop = GuiEventLoop(backend)
+    asyncio.set_event_loop(loop)
+    window = CountingWindow()
+    lag = []
+
+    store = None
+    updater = None
+    if fps:
+        store = GaugeStore()
+        updater = FrameUpdater(store, fps=fps, freeze=window, loop=loop)
+
+    async def gauge(name, period, step):
+        written = [ 0 ]
+        widget = LagWidget(window, loop, written, lag)
+        if updater:
+            updater.bind(name, widget)
+        level = 0.0
+        while True:
+            ## A slowly varying level, shown on a coarse gauge: many writes
+            ## do not change the displayed value.
+            level = (level + step) % GAUGE_RANGE
+            value = int(level)
+            if store:
+                if store.get(name) != value:
+                    written[0] = loop.time()
+                store.set(name, value)
+            else:
+                written[0] = loop.time()
+                widget.SetValue(value)
+            await asyncio.sleep(period)
+
+    rand = random.Random(1)
+    for i in range(ngauges):
+        loop.create_task(gauge('gauge{}'.format(i), rand.uniform(0.01, 0.3), rand.uniform(0.1, 2)))
+
+    backend.run(duration)
+
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    if updater:
+        updater.close()
+    loop.close()
+    asyncio.set_event_loop(None)
+
+    lag.sort()
+    return {
+        'widget_calls': len(lag),       ## one lag sample per widget call
+        'repaints': window.repaints,
+        'wakeups': backend.wakeups,
+        'lag_p50': benchlib.percentile(lag, 50),
+        'lag_max': lag[-1] if lag else 0,
+        }
+
+def run_gui_writes(fps, writes):
+    """Write `writes` values from GUI callbacks on an idle loop; return the values applied."""
+
+    backend = FakeBackend()
+    loop = GuiEventLoop(backend)
+    asyncio.set_event_loop(loop)
+    store = GaugeStore()
+    updater = FrameUpdater(store, fps=fps, loop=loop)
+    widget = CountingWidget()
+    applied = []
+    widget_set = widget.SetValue
+
+    def set_value(value):
+        widget_set(value)
+        applied.append(value)
+        if value < writes:
+            ## the next write, from a GUI callback after the loop is idle
+            timer = threading.Timer(2 / fps, backend.call_after, (lambda: store.set('gauge1', value + 1),))
+            timer.start()
+        else:
+            backend.stop()
+
+    widget.SetValue = set_value
+    updater.bind('gauge1', widget)
+    backend.call_after(lambda: store.set('gauge1', 1))
+    backend.run(writes * 4 / fps + 1)
+    updater.close()
+    loop.close()
+    asyncio.set_event_loop(None)
+    return applied
+
+##============================================================================
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_wx_gauges')
+    ngauges = int(300 * opts['scale'])
+    duration = 2
+    results = benchlib.Results()
+
+    for name, fps in (('direct', None), ('fps30', 30), ('fps60', 60)):
+        stats = run_case(fps, ngauges, duration)
+        results.add('{}.widget_calls_per_sec'.format(name), stats['widget_calls'] / duration, 'calls/s')
+        results.add('{}.repaints_per_sec'.format(name), stats['repaints'] / duration, 'repaints/s')
+        results.add('{}.gui_wakeups_per_sec'.format(name), stats['wakeups'] / duration, 'wakeups/s')
+        results.add('{}.lag_p50'.format(name), stats['lag_p50'] * 1000, 'ms')
+        results.add('{}.lag_max'.format(name), stats['lag_max'] * 1000, 'ms')
+
+        if fps:
+            applied = run_gui_writes(fps, 5)
+            if applied != [ 1, 2, 3, 4, 5 ]:
+                raise SystemExit('{}: writes from GUI callbacks not applied: {}'.format(name, applied))
+
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+GUI thread offload benchmark (headless, CPython only)
+=====================================================
+
+Runs a load of blocking I/O style jobs and CPU heavy jobs (decoding
+`key_stream` frames) from asyncio tasks on a `wx_asyncio_loop.GuiEventLoop`
+with the headless `FakeBackend`, and measures how long the GUI thread is
+stalled: a 10ms heartbeat task records how late it wakes up.
+
+Schemes:
+
+    * inline           -- jobs run on the GUI thread (the current app).
+    * call_after       -- a thread pool, each result posted to the GUI
+                          thread with its own `backend.call_after()` (as
+                          `wx.CallAfter` per result): one GUI wakeup each.
+    * executor         -- `loop.run_in_executor()` on a thread pool (its
+                          `call_soon_threadsafe()` wakeups are coalesced by
+                          `GuiEventLoop` while one is pending).
+    * offload_threads  -- `wx_offload.Offloader` on a thread pool (batched).
+    * offload_procs    -- `wx_offload.Offloader` on a process pool (batched).
+
+Reports elapsed time, heartbeat stall percentiles and the number of GUI
+thread wakeups for each.  The benchmark fails unless the batched offload
+takes fewer GUI wakeups than `call_after`.  On a `GuiEventLoop` it is
+about level with `executor`, whose wakeups the loop already coalesces.  Also checks that a callback raising an exception
+does not stop later results being delivered (the benchmark fails if so).
+
+Notes
+-----
+
+    * To run, from the repo root:
+        $ python3 bench/bench_wx_offload.py
+
+"""
+
+##============================================================================
+
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import time
+
+import benchlib
+
+benchlib.setup(hwconfig=None)
+
+from wx_asyncio_loop import FakeBackend, GuiEventLoop
+from wx_offload import Offloader
+from key_stream import KeyStream, decode_frame
+
+##============================================================================
+
+HEARTBEAT_S = 0.010
+CONCURRENCY = 8
+
+##============================================================================
+
+def blocking_job(n):
+    """A blocking I/O style job (e.g. a file read)."""
+
+    time.sleep(0.002)
+    return n
+
+#-----------------------------------------------------------------------------
+
+class _Sink():
+    def __init__(self):
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(bytes(data))
+
+def _make_frames():
+    stream = KeyStream(_Sink(), batch_events=16)
+    for i in range(200):
+        for j in range(16):
+            stream.add((i + j) & 15, j & 3)
+        n = stream.encode()
+        stream.writer.write(stream.out[:n - 1])
+    return stream.writer.frames
+
+FRAMES = _make_frames()
+
+def cpu_job(n):
+    """A CPU heavy job: decode a batch of device stream frames."""
+
+    events = 0
+    for frame in FRAMES[:20]:
+        events += len(decode_frame(frame)[2])
+    return events
+
+##============================================================================
+
+def run_case(scheme, job, njobs):
+    """Run `njobs` jobs under `scheme`; return (elapsed, stalls, gui_wakeups)."""
+
+    backend = FakeBackend()
+    loop = GuiEventLoop(backend)
+    asyncio.set_event_loop(loop)
+    stalls = []
+    done = [ False ]
+
+    offload = None
+    pool = None
+    if scheme in ('call_after', 'executor'):
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=CONCURRENCY)
+    elif scheme == 'offload_threads':
+        offload = Offloader(max_workers=CONCURRENCY, loop=loop)
+    elif scheme == 'offload_procs':
+        offload = Offloader(max_workers=4, processes=True, loop=loop)
+        ## start the worker processes before timing
+        list(offload.executor.map(job, range(8)))
+
+    async def heartbeat():
+        while not done[0]:
+            start = loop.time()
+            await asyncio.sleep(HEARTBEAT_S)
+            stalls.append(loop.time() - start - HEARTBEAT_S)
+
+    def call_after_job(n):
+        result = loop.create_future()
+
+        def deliver(future):
+            result.set_result(future.result())
+
+        pool.submit(job, n).add_done_callback(lambda f: backend.call_after(lambda: deliver(f)))
+        return result
+
+    async def worker(jobs):
+        for n in jobs:
+            if scheme == 'inline':
+                await asyncio.sleep(0)
+                job(n)
+            elif scheme == 'call_after':
+                await call_after_job(n)
+            elif scheme == 'executor':
+                await loop.run_in_executor(pool, job, n)
+            else:
+                await offload.run(job, n)
+
+    async def main():
+        start = loop.time()
+        await asyncio.gather(*[ worker(range(i, njobs, CONCURRENCY)) for i in range(CONCURRENCY) ])
+        done[0] = True
+        backend.stop()
+        return loop.time() - start
+
+    hb = loop.create_task(heartbeat())
+    task = loop.create_task(main())
+    wakeups = backend.wakeups
+    backend.run(600)
+    elapsed = task.result()
+    wakeups = backend.wakeups - wakeups
+
+    hb.cancel()
+    loop.run_until_complete(asyncio.gather(hb, return_exceptions=True))
+    if offload:
+        offload.shutdown()
+    if pool:
+        pool.shutdown()
+    loop.close()
+    asyncio.set_event_loop(None)
+
+    stalls.sort()
+    return elapsed, stalls, wakeups
+
+def check_callback_error():
+    """Return True if results are still delivered after a callback raises."""
+
+    backend = FakeBackend()
+    offload = Offloader(backend, max_workers=1)
+    delivered = []
+
+    def bad(future):
+        raise RuntimeError("bench_wx_offload: deliberate callback error")
+
+    def good(future):
+        delivered.append(future.result())
+        if len(delivered) == 2:
+            backend.stop()
+
+    with contextlib.redirect_stderr(io.StringIO()):     ## the expected traceback
+        offload.submit(bad, blocking_job, 0).result()
+        offload.submit(good, blocking_job, 1)
+        backend.run(1)
+        ## after a flush which hit the error, a later result needs a new flush
+        offload.submit(good, blocking_job, 2)
+        backend.run(1)
+    offload.shutdown()
+    return delivered == [ 1, 2 ] and offload.callback_errors == 1
+
+##============================================================================
+
+def main():
+    """Run the benchmark."""
+
+    opts = benchlib.parse_args('bench_wx_offload')
+    njobs = int(400 * opts['scale'])
+    results = benchlib.Results()
+
+    for job_name, job in (('blocking', blocking_job), ('cpu', cpu_job)):
+        wakeups_by_scheme = {}
+        for scheme in ('inline', 'call_after', 'executor', 'offload_threads', 'offload_procs'):
+            elapsed, stalls, wakeups = run_case(scheme, job, njobs)
+            wakeups_by_scheme[scheme] = wakeups
+            name = '{}.{}'.format(job_name, scheme)
+            results.add(name + '.elapsed', elapsed * 1000, 'ms')
+            results.add(name + '.stall_p50', benchlib.percentile(stalls, 50) * 1000, 'ms')
+            results.add(name + '.stall_p99', benchlib.percentile(stalls, 99) * 1000, 'ms')
+            results.add(name + '.stall_max', (stalls[-1] if stalls else 0) * 1000, 'ms')
+            results.add(name + '.gui_wakeups', wakeups, 'wakeups')
+        if wakeups_by_scheme['offload_threads'] >= wakeups_by_scheme['call_after']:
+            raise SystemExit('{}: batched offload takes no fewer GUI wakeups than call_after per result'.format(job_name))
+
+    if not check_callback_error():
+        raise SystemExit('offload: results lost after a callback error')
+
+    benchlib.finish(results, opts)
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Common helpers for the benchmarks
+=================================
+
+Works on both the MicroPython unix port and CPython.
+
+Notes
+-----
+
+    * `setup()` puts the repo's module directories on `sys.path` and installs
+      the simulated board (`hwapi/hwconfig_SIM.py`) as the `hwconfig` module,
+      so the examples run against simulated pins.
+
+    * Results are collected in a `Results` instance and written as JSON:
+
+        {
+          "platform": "...",
+          "implementation": "...",
+          "results": {
+            "<name>": { "value": 1.23, "unit": "us", "better": "lower" },
+            ...
+          }
+        }
+
+    * When a baseline file is given, each result is compared with it and
+      any result which is worse by more than the threshold is reported as a
+      regression (and the benchmark exits with status 1).
+
+    * Command line options common to all benchmarks:
+
+        -o FILE     write results to FILE (default: <name>_results.json)
+        -b FILE     compare with baseline FILE
+        -t PERCENT  regression threshold (default: 10)
+        -n COUNT    scale the iteration counts
+
+"""
+
+##============================================================================
+
+import sys
+import gc
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+##============================================================================
+
+THRESHOLD_DEFAULT = 10
+
+## Module directories of this repo, relative to the repo root.
+MODULE_DIRS = [ 'hwapi', 'keypad', 'keypad_lcd', 'leds', 'monitor', 'power', 'lcd/python_lcd_dhylands_fork' ]
+
+##============================================================================
+
+def _dirname(path):
+    """`os.path.dirname()` (not available on MicroPython)."""
+
+    i = path.rfind('/')
+    if i < 0:
+        return '.'
+    return path[:i] or '/'
+
+#-----------------------------------------------------------------------------
+
+def repo_root():
+    """Return the path of the repo root directory."""
+
+    try:
+        bench_dir = _dirname(__file__)
+    except NameError:
+        bench_dir = 'bench'
+    return bench_dir + '/..'
+
+#-----------------------------------------------------------------------------
+
+def setup(hwconfig='hwconfig_SIM'):
+    """Set up `sys.path` and the `hwconfig` module for the benchmarks."""
+
+    root = repo_root()
+    for path in MODULE_DIRS:
+        path = root + '/' + path
+        if path not in sys.path:
+            sys.path.append(path)
+
+    if hwconfig:
+        sys.modules['hwconfig'] = __import__(hwconfig)
+
+##============================================================================
+
+def run_async(coro):
+    """Run a coroutine to completion on uasyncio or asyncio."""
+
+    try:
+        import uasyncio as asyncio
+    except ImportError:
+        import asyncio
+
+    if hasattr(asyncio, 'run'):
+        return asyncio.run(coro)
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(coro)
+
+#-----------------------------------------------------------------------------
+
+def time_per_call(fun, count):
+    """Return the average time (us) of `count` calls of `fun()`."""
+
+    gc.collect()
+    start = ticks_us()
+    for _ in range(count):
+        fun()
+    return ticks_diff(ticks_us(), start) / count
+
+#-----------------------------------------------------------------------------
+
+def percentile(sorted_values, pct):
+    """Return the `pct` percentile of a sorted list (nearest rank)."""
+
+    if not sorted_values:
+        return 0
+    i = (len(sorted_values) * pct + 99) // 100 - 1
+    return sorted_values[max(0, min(i, len(sorted_values) - 1))]
+
+##============================================================================
+
+class Results():
+    """A set of named benchmark results."""
+
+    def __init__(self):
+        """Constructor."""
+
+        self.results = {}
+
+    #-------------------------------------------------------------------------
+
+    def add(self, name, value, unit, better='lower'):
+        """Add a result.  `better` is 'lower' or 'higher'."""
+
+        self.results[name] = { 'value': value, 'unit': unit, 'better': better }
+        print('{:40s} {:>14.3f} {}'.format(name, value, unit))
+
+    #-------------------------------------------------------------------------
+
+    def dump(self, path):
+        """Write the results to a JSON file."""
+
+        doc = {
+            'platform': sys.platform,
+            'implementation': sys.implementation.name,
+            'results': self.results,
+            }
+        with open(path, 'w') as f:
+            f.write(json.dumps(doc))
+
+    #-------------------------------------------------------------------------
+
+    def compare(self, path, threshold=THRESHOLD_DEFAULT):
+        """Compare with a baseline file and return a list of regressions."""
+
+        with open(path) as f:
+            baseline = json.loads(f.read())['results']
+
+        regressions = []
+        print('--- compared with baseline {} (threshold {}%)'.format(path, threshold))
+        for name in sorted(self.results):
+            if name not in baseline:
+                continue
+            new = self.results[name]['value']
+            old = baseline[name]['value']
+            if not old:
+                continue
+            change = (new - old) * 100 / old
+            if self.results[name]['better'] == 'higher':
+                change = -change
+            flag = 'REGRESSION' if change > threshold else ''
+            print('{:40s} {:>+9.1f}% {}'.format(name, change, flag))
+            if flag:
+                regressions.append(name)
+        return regressions
+
+##============================================================================
+
+def parse_args(name, argv=None):
+    """Parse the common command line options (see module docstring)."""
+
+    argv = sys.argv[1:] if argv is None else argv
+    opts = { 'output': name + '_results.json', 'baseline': None, 'threshold': THRESHOLD_DEFAULT, 'scale': 1, 'args': [] }
+    names = { '-o': 'output', '-b': 'baseline', '-t': 'threshold', '-n': 'scale' }
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in names:
+            value = argv[i + 1]
+            opts[names[arg]] = value if names[arg] in ('output', 'baseline') else float(value)
+            i += 2
+        else:
+            opts['args'].append(arg)
+            i += 1
+    return opts
+
+#-----------------------------------------------------------------------------
+
+def finish(results, opts):
+    """Write the results, compare with any baseline and exit."""
+
+    results.dump(opts['output'])
+    print('--- results written to', opts['output'])
+    if opts['baseline']:
+        if results.compare(opts['baseline'], opts['threshold']):
+            sys.exit(1)
@@ -0,0 +1,73 @@
+"""
+Start up probe, run in a fresh interpreter by `bench_boot.py`
+=============================================================
+
+    $ micropython bench/boot_probe.py [--heap] DIR ...
+
+Puts DIRs on `sys.path`, installs the simulated board as `hwconfig`,
+imports `keypad_lcd_uasyncio` and runs the first keypad scan, then prints
+one JSON line with the times (us, from the start of this script) and heap
+use (bytes).  With `--heap` on CPython the heap is traced with
+`tracemalloc` (which slows everything down, so times are measured
+separately without it).  On CPython the stdlib `asyncio` is imported
+before the clock starts, as its (large) cost is not what is measured.
+
+"""
+
+import sys
+import gc
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+if sys.implementation.name != 'micropython':
+    import asyncio
+
+T0 = ticks_us()
+
+args = sys.argv[1:]
+trace = args[:1] == [ '--heap' ]
+if trace:
+    args = args[1:]
+
+try:
+    mem_alloc = gc.mem_alloc
+except AttributeError:
+    import tracemalloc
+
+    def mem_alloc():
+        return tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+
+    if trace:
+        tracemalloc.start()
+
+for i in range(len(args)):
+    sys.path.insert(i, args[i])
+
+import hwconfig_SIM
+sys.modules['hwconfig'] = hwconfig_SIM
+
+import keypad_lcd_uasyncio as app
+
+t_import = ticks_diff(ticks_us(), T0)
+heap_import = mem_alloc()
+
+keypad = app.Keypad_uasyncio(start=True)
+keys = []
+keypad.scan_frame(keys)
+
+t_scan = ticks_diff(ticks_us(), T0)
+heap_scan = mem_alloc()
+gc.collect()
+heap_live = mem_alloc()
+
+print('{{"import_us": {}, "first_scan_us": {}, "heap_import": {}, "heap_first_scan": {}, "heap_live": {}}}'.format(
+    t_import, t_scan, heap_import, heap_scan, heap_live))
@@ -0,0 +1,333 @@
+"""
+Board profile registry for `hwconfig` modules
+=============================================
+
+A board's `hwconfig` module declares what is wired to the board (pins,
+keypad matrices, LED banks, I2C buses, LCDs, ...) in a `Board` instance,
+and each object is only constructed the first time an app uses it.  So
+start up time and RAM depend on the peripherals an app uses, not on
+everything the board declares.
+
+Notes
+-----
+
+    * Declaring a peripheral only stores its factory and arguments (pin
+      names, bus ids, ...):
+        >>> BOARD = Board('OLIMEX_E407', Pin, Signal)
+        >>> BOARD.pin('LED', 'C13', Pin.OUT)
+        >>> BOARD.keypad('KEYPAD', rows=('PD1', 'PD3'), cols=('PD9', 'PD11'))
+        >>> BOARD.leds('LEDS', ('E15', 'E14'), inverted=True)
+        >>> BOARD.declare('I2C1', I2C, 1, I2C.MASTER)
+        >>> BOARD.lcd('LCD', make_lcd, 'I2C1', 0x27, 4, 20)
+
+      and it is constructed (once) on first use:
+        >>> keypad = BOARD.KEYPAD              ## or BOARD.get('KEYPAD')
+
+    * A `hwconfig` module can pass attribute lookups on to its board with a
+      module level `__getattr__`, so `from hwconfig import LED` keeps working
+      and constructs only `LED` (needs a port built with
+      `MICROPY_MODULE_GETATTR`; otherwise use `hwconfig.BOARD.LED`).
+
+    * A keypad behind an I2C GPIO expander (MCP23017/PCF8574) is declared
+      with the names of its bus and INT pin:
+        >>> BOARD.pin('KEYPAD_INT', 'PE2', Pin.IN, Pin.PULL_UP)
+        >>> BOARD.expander_keypad('KEYPAD_EXP', 'I2C2', 0x20, int_pin='KEYPAD_INT')
+
+      and scanned by `keypad_expander.Keypad_expander`.
+
+    * Keypad matrices and LED banks carry `PortMap` tables (GPIO port and bit
+      of each pin, and the port bitmask if all pins share a port) for bulk
+      I/O through the port registers, built when the object is constructed.
+
+"""
+
+##============================================================================
+
+try:
+    import stm
+except ImportError:
+    stm = None
+
+try:
+    from array import array
+except ImportError:
+    from uarray import array
+
+##============================================================================
+
+PORTS = 'ABCDEFGHIJK'
+
+def pin_port_bit(name):
+    """Return `(port, bit)` of an STM32 style pin name ('PD1', 'E8'), or (-1, -1)."""
+
+    if name[:1] == 'P' and len(name) > 2:
+        name = name[1:]
+    port = PORTS.find(name[:1])
+    if port < 0:
+        return -1, -1
+    try:
+        return port, int(name[1:])
+    except ValueError:
+        return -1, -1
+
+##============================================================================
+
+class PortMap():
+    """Precomputed GPIO port/bit tables for a list of pins (pin i = logical bit i)."""
+
+    def __init__(self, names):
+        """Constructor."""
+
+        n = len(names)
+        self.ports = bytearray(n)
+        self.bits = bytearray(n)
+        port = -2
+        mask = 0
+        for i in range(n):
+            p, bit = pin_port_bit(names[i])
+            if p < 0:
+                port = -1
+                break
+            self.ports[i] = p
+            self.bits[i] = bit
+            if port == -2:
+                port = p
+            elif port != p:
+                port = -1
+            mask |= 1 << bit
+
+        ## The port of all the pins (-1 if they are not on one port), and
+        ## the port bitmask of the pins.
+        self.port = port if port >= 0 else -1
+        self.mask = mask if self.port >= 0 else 0
+
+    #-------------------------------------------------------------------------
+
+    def port_mask(self, mask):
+        """Return the port bitmask for a logical bitmask."""
+
+        bits = self.bits
+        port_mask = 0
+        for i in range(len(bits)):
+            if (mask >> i) & 1:
+                port_mask |= 1 << bits[i]
+        return port_mask
+
+    #-------------------------------------------------------------------------
+
+    def gather(self, port_value):
+        """Return the logical bitmask for a port value (e.g. an IDR read)."""
+
+        bits = self.bits
+        mask = 0
+        for i in range(len(bits)):
+            mask |= ((port_value >> bits[i]) & 1) << i
+        return mask
+
+##============================================================================
+
+class KeypadMatrix():
+    """Row (output) and column (input, pulled down) pins of a keypad matrix."""
+
+    def __init__(self, pin, rows, cols):
+        """Constructor.  `pin` is the `Pin` class."""
+
+        self.rows = list(rows)
+        self.cols = list(cols)
+        self.nrows = len(self.rows)
+        self.ncols = len(self.cols)
+
+        self.row_pins = [ pin(name, mode=pin.OUT) for name in self.rows ]
+        self.col_pins = [ pin(name, mode=pin.IN, pull=pin.PULL_DOWN) for name in self.cols ]
+
+        self.row_map = PortMap(self.rows)
+        self.col_map = PortMap(self.cols)
+
+##============================================================================
+
+class ExpanderKeypad():
+    """A keypad wired to an I2C GPIO expander (see `keypad_expander.py`).
+
+       `wiring` is 'matrix' (rows on the low pins, columns on the next pins)
+       or 'direct' (one key per pin, key code = pin number).
+    """
+
+    def __init__(self, i2c, addr, chip, int_pin, nrows, ncols, wiring):
+        """Constructor.  `i2c` is the bus, `int_pin` the INT input pin (or None)."""
+
+        self.i2c = i2c
+        self.addr = addr
+        self.chip = chip
+        self.int_pin = int_pin
+        self.nrows = nrows
+        self.ncols = ncols
+        self.wiring = wiring
+
+##============================================================================
+
+BSRR_TABLE_BITS_MAX = 8
+
+class LedBank():
+    """A bank of LEDs, indexable like a list of `Signal`s, with bulk writes."""
+
+    def __init__(self, pin, signal, pins, inverted=False):
+        """Constructor.  `pin`, `signal` are the `Pin` and `Signal` classes."""
+
+        self.leds = [ signal(pin(name, pin.OUT), inverted=inverted) for name in pins ]
+        self.map = PortMap(pins)
+        self.inverted = inverted
+        self.all = (1 << len(self.leds)) - 1
+
+        ## With all LEDs on one STM32 port, `write()` is one store to the
+        ## port's bit set/reset register, from a table built on first use.
+        self._bsrr_addr = 0
+        self._bsrr = None
+        if stm and self.map.port >= 0 and len(self.leds) <= BSRR_TABLE_BITS_MAX:
+            bsrr = getattr(stm, 'GPIO_BSRR', None)
+            if bsrr is None:
+                bsrr = stm.GPIO_BSRRL       ## F4: 16 bit halves, same address
+            self._bsrr_addr = getattr(stm, 'GPIO' + PORTS[self.map.port]) + bsrr
+
+    #-------------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.leds)
+
+    def __getitem__(self, i):
+        return self.leds[i]
+
+    def __iter__(self):
+        return iter(self.leds)
+
+    #-------------------------------------------------------------------------
+
+    def _bsrr_word(self, mask):
+        """Return the BSRR word which sets the LEDs to a logical bitmask."""
+
+        if self.inverted:
+            mask = ~mask & self.all
+        high = self.map.port_mask(mask)
+        low = self.map.mask & ~high
+        return high | (low << 16)
+
+    #-------------------------------------------------------------------------
+
+    def write(self, mask):
+        """Switch the LEDs on/off from a bitmask (bit i = LED i)."""
+
+        if self._bsrr_addr:
+            if self._bsrr is None:
+                self._bsrr = array('I', [ self._bsrr_word(m) for m in range(self.all + 1) ])
+            stm.mem32[self._bsrr_addr] = self._bsrr[mask & self.all]
+            return
+
+        leds = self.leds
+        for i in range(len(leds)):
+            leds[i].value((mask >> i) & 1)
+
+##============================================================================
+
+class Board():
+    """A registry of a board's peripherals, constructed lazily."""
+
+    def __init__(self, name, pin=None, signal=None):
+        """Constructor.  `pin`, `signal` are the port's `Pin` and `Signal` classes."""
+
+        self.name = name
+        self._pin = pin
+        self._signal = signal
+        self._decls = {}
+        self._objs = {}
+
+    #-------------------------------------------------------------------------
+
+    def declare(self, name, factory, *args, **kwargs):
+        """Declare `name`, constructed as `factory(*args, **kwargs)` on first use."""
+
+        self._decls[name] = (factory, args, kwargs)
+        self._objs.pop(name, None)
+
+    #-------------------------------------------------------------------------
+
+    def pin(self, name, pin_id, *args, **kwargs):
+        """Declare a pin."""
+
+        self.declare(name, self._pin, pin_id, *args, **kwargs)
+
+    #-------------------------------------------------------------------------
+
+    def keypad(self, name, rows, cols):
+        """Declare a keypad matrix (a `KeypadMatrix`), given row and column pin names."""
+
+        self.declare(name, KeypadMatrix, self._pin, rows, cols)
+
+    #-------------------------------------------------------------------------
+
+    def leds(self, name, pins, inverted=False):
+        """Declare a bank of LEDs (a `LedBank`), given pin names."""
+
+        self.declare(name, LedBank, self._pin, self._signal, pins, inverted)
+
+    #-------------------------------------------------------------------------
+
+    def expander_keypad(self, name, i2c, addr, chip='MCP23017', int_pin=None, nrows=4, ncols=4, wiring='matrix'):
+        """Declare a keypad on an I2C GPIO expander (an `ExpanderKeypad`).
+
+           `i2c` is the name of a declared bus and `int_pin` the name of a
+           declared pin wired to the expander's INT output (or None).
+        """
+
+        self.declare(name, self._make_expander_keypad, i2c, addr, chip, int_pin, nrows, ncols, wiring)
+
+    def _make_expander_keypad(self, i2c, addr, chip, int_pin, nrows, ncols, wiring):
+        int_pin = self.get(int_pin) if int_pin else None
+        return ExpanderKeypad(self.get(i2c), addr, chip, int_pin, nrows, ncols, wiring)
+
+    #-------------------------------------------------------------------------
+
+    def lcd(self, name, factory, i2c, addr, lines, cols):
+        """Declare an I2C LCD, `factory(i2c, addr, lines, cols)`; `i2c` is the name of a declared bus."""
+
+        self.declare(name, self._make_lcd, factory, i2c, addr, lines, cols)
+
+    def _make_lcd(self, factory, i2c, addr, lines, cols):
+        return factory(self.get(i2c), addr, lines, cols)
+
+    #-------------------------------------------------------------------------
+
+    def get(self, name):
+        """Return peripheral `name`, constructing it on first use."""
+
+        obj = self._objs.get(name)
+        if obj is None:
+            factory, args, kwargs = self._decls[name]
+            obj = factory(*args, **kwargs)
+            self._objs[name] = obj
+        return obj
+
+    #-------------------------------------------------------------------------
+
+    def __getattr__(self, name):
+        ## Only called for names which are not real attributes.
+        if name in self._decls:
+            return self.get(name)
+        raise AttributeError(name)
+
+    #-------------------------------------------------------------------------
+
+    def __contains__(self, name):
+        return name in self._decls
+
+    #-------------------------------------------------------------------------
+
+    def names(self):
+        """Return the declared names."""
+
+        return sorted(self._decls)
+
+    #-------------------------------------------------------------------------
+
+    def constructed(self):
+        """Return the names constructed so far."""
+
+        return sorted(self._objs)
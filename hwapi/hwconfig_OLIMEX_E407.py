@@ -1,11 +1,53 @@
-from machine import Pin
+from machine import Pin, Signal
+
+from board import Board
 
 #
 # Olimex E407 board
 #
+# Peripherals are declared in the board profile, and constructed on first
+# use (see `board.py`), e.g. `hwconfig.LED` or `hwconfig.BOARD.KEYPAD`.
+#
+
+BOARD = Board('OLIMEX_E407', Pin, Signal)
 
 # Green LED on port C, pin 13
-LED = Pin("C13", Pin.OUT)
+BOARD.pin('LED', 'C13', Pin.OUT)
 
 # Push button switch (WKUP) on port A, pin 0
-BUTTON = Pin("A0", Pin.IN)
+BOARD.pin('BUTTON', 'A0', Pin.IN)
+
+# 16-key (4x4 matrix) membrane keypad on port D
+BOARD.keypad('KEYPAD', rows=('PD1', 'PD3', 'PD5', 'PD7'), cols=('PD9', 'PD11', 'PD13', 'PD15'))
+
+# LEDs on Keypad/LED board connection to PE connector (LED 0 is E15)
+BOARD.leds('LEDS', ('E15', 'E14', 'E13', 'E12', 'E11', 'E10', 'E9', 'E8'), inverted=True)
+
+# I2C bus 1 (pyb API, as used by `pyb_i2c_lcd`)
+def _i2c(bus):
+    from pyb import I2C
+    return I2C(bus, I2C.MASTER)
+
+BOARD.declare('I2C1', _i2c, 1)
+
+# 20x4 HD44780 LCD with a PCF8574 I2C backpack
+def _lcd(i2c, addr, lines, cols):
+    from pyb_i2c_lcd import I2cLcd
+    return I2cLcd(i2c, addr, lines, cols)
+
+BOARD.lcd('LCD', _lcd, 'I2C1', 0x27, 4, 20)
+
+# Production panels: the keypad behind an MCP23017 on I2C bus 2 (machine
+# API, for combined write/read transactions), its INT output on PE2
+def _i2c_machine(bus):
+    from machine import I2C
+    return I2C(bus, freq=400000)
+
+BOARD.declare('I2C2', _i2c_machine, 2)
+BOARD.pin('KEYPAD_INT', 'PE2', Pin.IN, Pin.PULL_UP)
+BOARD.expander_keypad('KEYPAD_EXP', 'I2C2', 0x20, int_pin='KEYPAD_INT')
+
+
+def __getattr__(name):
+    # `from hwconfig import LED` constructs LED on first use.
+    return getattr(BOARD, name)
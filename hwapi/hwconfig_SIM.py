@@ -0,0 +1,796 @@
+"""
+Simulated board for running the examples on a host
+==================================================
+
+Provides the same names as a real `hwconfig` module (`Pin`, `Timer`,
+`delay`, `Signal`, `I2C`, `LED`, `BUTTON`) but backed by plain Python
+objects, so the keypad/LCD/LED code can run on the MicroPython unix port
+or CPython.
+
+Notes
+-----
+
+    * The keypad rows/columns are wired to a simulated key matrix
+      (`MATRIX`).  Asserting a row pin drives the column pins of every key
+      pressed in that row, just like the real membrane keypad.
+
+    * Press/release keys from a test/benchmark with
+        >>> import hwconfig_SIM as sim
+        >>> sim.MATRIX.press(key_code)
+        >>> sim.MATRIX.release(key_code)
+
+    * `Timer` never fires by itself; call `Timer.tick()` to run the callback.
+
+    * `LIGHTSLEEP` is a fake `machine.lightsleep()` (used by
+      `tickless_idle`): it really sleeps, ends early on any pin IRQ, and
+      counts the time spent asleep vs awake.
+
+    * `I2C` counts the bytes written so LCD traffic can be measured, and
+      transactions (a write with `stop=False` and the read after it are one
+      transaction, as on the bus).
+
+    * `SimMCP23017` and `SimPCF8574` are register level I2C GPIO expanders
+      wired to `MATRIX` (as a matrix, or one key per pin), driving an INT
+      pin.  The keypad expander (`KEYPAD_EXP`) is an MCP23017 on its own bus
+      (`I2C2`), so it only follows `MATRIX` once it is used.
+
+    * The peripherals (`LED`, `BUTTON`, `KEYPAD`, `LEDS`, `I2C1`, `LCD`) are
+      declared in a `board.Board` profile like a real board's, and
+      constructed on first use.
+
+"""
+
+##============================================================================
+
+import time
+
+try:
+    import threading
+except ImportError:
+    threading = None        ## MicroPython unix port: sleeps are not woken early
+
+from board import Board
+
+##============================================================================
+
+## Pin names for keypad rows and columns (same wiring as the Olimex E407 setup).
+KEYPAD_ROWS = [ 'PD1', 'PD3', 'PD5', 'PD7' ]
+KEYPAD_COLS = [ 'PD9', 'PD11', 'PD13', 'PD15' ]
+
+##============================================================================
+
+class SimMatrix():
+    """A simulated key matrix.
+
+       Key state is held as one column bitmask per row, and the column levels
+       seen by the column pins are recomputed whenever a row pin or a key
+       changes, so reading a column pin is cheap.
+    """
+
+    def __init__(self, nrows, ncols):
+        """Constructor."""
+
+        self.nrows = nrows
+        self.ncols = ncols
+
+        ## Column bitmask of pressed keys, per row.
+        self.pressed = [ 0 ] * nrows
+
+        ## Bitmask of asserted rows.
+        self.row_levels = 0
+
+        ## Bitmask of columns currently driven high.
+        self.col_levels = 0
+
+        ## Functions called after every change (e.g. simulated expanders).
+        self.listeners = []
+
+    #-------------------------------------------------------------------------
+
+    def _update(self):
+        """Recompute the column levels."""
+
+        levels = 0
+        rows = self.row_levels
+        row = 0
+        while rows:
+            if rows & 1:
+                levels |= self.pressed[row]
+            rows >>= 1
+            row += 1
+        self.col_levels = levels
+        for listener in self.listeners:
+            listener()
+
+    #-------------------------------------------------------------------------
+
+    def set_row(self, row, value):
+        """Drive a row line."""
+
+        if value:
+            self.row_levels |= 1 << row
+        else:
+            self.row_levels &= ~(1 << row)
+        self._update()
+
+    #-------------------------------------------------------------------------
+
+    def press(self, key_code):
+        """Press the key with code `key_code` (row * ncols + col)."""
+
+        row, col = divmod(key_code, self.ncols)
+        self.pressed[row] |= 1 << col
+        self._update()
+
+    #-------------------------------------------------------------------------
+
+    def release(self, key_code):
+        """Release the key with code `key_code`."""
+
+        row, col = divmod(key_code, self.ncols)
+        self.pressed[row] &= ~(1 << col)
+        self._update()
+
+    #-------------------------------------------------------------------------
+
+    def set_masks(self, masks):
+        """Set the pressed column masks for all rows at once."""
+
+        pressed = self.pressed
+        for row in range(self.nrows):
+            pressed[row] = masks[row]
+        self._update()
+
+    #-------------------------------------------------------------------------
+
+    def set_frame_mask(self, mask):
+        """Set the pressed keys from a frame mask (bit N = key code N)."""
+
+        ncols = self.ncols
+        col_mask = (1 << ncols) - 1
+        pressed = self.pressed
+        for row in range(self.nrows):
+            pressed[row] = mask & col_mask
+            mask >>= ncols
+        self._update()
+
+    #-------------------------------------------------------------------------
+
+    def release_all(self):
+        """Release all keys."""
+
+        for row in range(self.nrows):
+            self.pressed[row] = 0
+        self._update()
+
+##============================================================================
+
+MATRIX = SimMatrix(len(KEYPAD_ROWS), len(KEYPAD_COLS))
+
+##============================================================================
+
+class Pin():
+    """A simulated `machine.Pin`/`pyb.Pin`."""
+
+    IN          = 0
+    OUT         = 1
+    OPEN_DRAIN  = 2
+
+    PULL_NONE   = None
+    PULL_UP     = 1
+    PULL_DOWN   = 2
+
+    IRQ_FALLING = 1
+    IRQ_RISING  = 2
+
+    #-------------------------------------------------------------------------
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        """Constructor."""
+
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 0 if value is None else value
+        self._handler = None
+        self._trigger = 0
+
+        ## Keypad row/column index, or -1 if not part of the keypad matrix.
+        self._row = KEYPAD_ROWS.index(id) if id in KEYPAD_ROWS else -1
+        self._col = KEYPAD_COLS.index(id) if id in KEYPAD_COLS else -1
+
+    #-------------------------------------------------------------------------
+
+    def value(self, x=None):
+        """Get or set the pin level."""
+
+        if x is None:
+            if self._col >= 0:
+                return (MATRIX.col_levels >> self._col) & 1
+            return self._value
+
+        x = 1 if x else 0
+        if self._row >= 0:
+            MATRIX.set_row(self._row, x)
+        self.set_level(x)
+
+    #-------------------------------------------------------------------------
+
+    def on(self):
+        """Set the pin high."""
+
+        self.value(1)
+
+    #-------------------------------------------------------------------------
+
+    def off(self):
+        """Set the pin low."""
+
+        self.value(0)
+
+    #-------------------------------------------------------------------------
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, wake=None):
+        """Set the interrupt handler, called from `set_level()`."""
+
+        self._handler = handler
+        self._trigger = trigger
+
+    #-------------------------------------------------------------------------
+
+    def set_level(self, x):
+        """Simulate an external signal on the pin (runs any IRQ handler)."""
+
+        old = self._value
+        self._value = x
+        if self._handler and old != x:
+            if (x and self._trigger & self.IRQ_RISING) or (not x and self._trigger & self.IRQ_FALLING):
+                self._handler(self)
+                ## Any IRQ ends a lightsleep.
+                LIGHTSLEEP.wake()
+
+##============================================================================
+
+class Signal():
+    """A simulated `machine.Signal`."""
+
+    def __init__(self, pin, inverted=False):
+        """Constructor."""
+
+        self.pin = pin
+        self.inverted = inverted
+
+    #-------------------------------------------------------------------------
+
+    def value(self, x=None):
+        """Get or set the logical signal level."""
+
+        if x is None:
+            return self.pin.value() ^ self.inverted
+        self.pin.value((1 if x else 0) ^ self.inverted)
+
+    #-------------------------------------------------------------------------
+
+    def on(self):
+        """Activate the signal."""
+
+        self.value(1)
+
+    #-------------------------------------------------------------------------
+
+    def off(self):
+        """Deactivate the signal."""
+
+        self.value(0)
+
+##============================================================================
+
+class Timer():
+    """A simulated `pyb.Timer`.  Call `tick()` to fire the callback."""
+
+    def __init__(self, id, freq=None):
+        """Constructor."""
+
+        self.id = id
+        self.freq = freq
+        self._callback = None
+
+    #-------------------------------------------------------------------------
+
+    def callback(self, fun):
+        """Set the callback."""
+
+        self._callback = fun
+
+    #-------------------------------------------------------------------------
+
+    def tick(self):
+        """Fire the timer once."""
+
+        if self._callback:
+            self._callback(self)
+
+##============================================================================
+
+class I2C():
+    """A simulated `pyb.I2C`/`machine.I2C` which counts bytes written.
+
+       Devices can be attached with `add_device(addr, device)`; a device
+       implements `write(buf)` and `read(nbytes)`.
+    """
+
+    MASTER = 0
+    SLAVE  = 1
+
+    def __init__(self, id=1, mode=MASTER, **kwargs):
+        """Constructor."""
+
+        self.id = id
+        self.devices = {}
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.transactions = 0
+
+        ## True after a write without a stop (a repeated start follows).
+        self._open = False
+
+    #-------------------------------------------------------------------------
+
+    def add_device(self, addr, device):
+        """Attach a simulated device."""
+
+        self.devices[addr] = device
+
+    #-------------------------------------------------------------------------
+
+    def scan(self):
+        """Return the addresses of attached devices."""
+
+        return sorted(self.devices)
+
+    #-------------------------------------------------------------------------
+
+    def _write(self, addr, buf, stop=True):
+        if not self._open:
+            self.transactions += 1
+        self._open = not stop
+        self.bytes_written += len(buf)
+        device = self.devices.get(addr)
+        if device:
+            device.write(buf)
+
+    #-------------------------------------------------------------------------
+
+    def _read(self, addr, nbytes, stop=True):
+        if not self._open:
+            self.transactions += 1
+        self._open = not stop
+        self.bytes_read += nbytes
+        device = self.devices.get(addr)
+        return device.read(nbytes) if device else bytes(nbytes)
+
+    #-------------------------------------------------------------------------
+
+    def send(self, send, addr=0x00, timeout=5000):
+        """pyb.I2C: send data (an int or a buffer)."""
+
+        self._write(addr, bytes([ send ]) if isinstance(send, int) else send)
+
+    #-------------------------------------------------------------------------
+
+    def recv(self, recv, addr=0x00, timeout=5000):
+        """pyb.I2C: receive data (a byte count or a buffer to fill)."""
+
+        if isinstance(recv, int):
+            return self._read(addr, recv)
+        recv[:] = self._read(addr, len(recv))
+        return recv
+
+    #-------------------------------------------------------------------------
+
+    def writeto(self, addr, buf, stop=True):
+        """machine.I2C: write a buffer."""
+
+        self._write(addr, buf, stop)
+        return len(buf)
+
+    #-------------------------------------------------------------------------
+
+    def readfrom(self, addr, nbytes, stop=True):
+        """machine.I2C: read bytes."""
+
+        return self._read(addr, nbytes, stop)
+
+    #-------------------------------------------------------------------------
+
+    def readfrom_into(self, addr, buf, stop=True):
+        """machine.I2C: read into a buffer."""
+
+        buf[:] = self._read(addr, len(buf), stop)
+
+    #-------------------------------------------------------------------------
+
+    def writeto_mem(self, addr, memaddr, buf):
+        """machine.I2C: write to registers from `memaddr` (one transaction)."""
+
+        self._write(addr, bytes([ memaddr ]) + bytes(buf))
+
+    #-------------------------------------------------------------------------
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        """machine.I2C: read registers from `memaddr` (one transaction)."""
+
+        self._write(addr, bytes([ memaddr ]), stop=False)
+        buf[:] = self._read(addr, len(buf))
+
+##============================================================================
+
+class SimMCP23017():
+    """A simulated MCP23017 16-bit I2C GPIO expander (IOCON.BANK = 0).
+
+       Port A is pins 0-7, port B pins 8-15.  With `wiring` 'matrix' the
+       keypad rows are on pins 0.. and the columns on pins 8.., a column
+       reading low when a pressed key's row is driven low; with 'direct'
+       key code N is on pin N, low when pressed.  Interrupt on change (vs
+       the previous level, INTCON = 0) drives `int_pin` low until GPIO or
+       INTCAP of the port is read (INTA/INTB mirrored).
+    """
+
+    IODIR   = 0x00
+    GPINTEN = 0x04
+    DEFVAL  = 0x06
+    INTCON  = 0x08
+    IOCON   = 0x0A
+    GPPU    = 0x0C
+    INTF    = 0x0E
+    INTCAP  = 0x10
+    GPIO    = 0x12
+    OLAT    = 0x14
+    NREGS   = 0x16
+
+    def __init__(self, matrix, int_pin=None, wiring='matrix'):
+        """Constructor."""
+
+        self.matrix = matrix
+        self.int_pin = int_pin
+        self.wiring = wiring
+        self.regs = bytearray(self.NREGS)
+        self.regs[self.IODIR] = self.regs[self.IODIR + 1] = 0xFF
+        self.pointer = 0
+        self.levels = 0xFFFF
+        if int_pin:
+            int_pin.set_level(1)
+        matrix.listeners.append(self.update)
+        self.update()
+
+    #-------------------------------------------------------------------------
+
+    def _reg16(self, reg):
+        return self.regs[reg] | (self.regs[reg + 1] << 8)
+
+    #-------------------------------------------------------------------------
+
+    def update(self):
+        """Recompute the pin levels and interrupt state."""
+
+        iodir = self._reg16(self.IODIR)
+        levels = (self._reg16(self.OLAT) & ~iodir) | iodir      ## inputs pulled up
+        matrix = self.matrix
+        ncols = matrix.ncols
+        if self.wiring == 'matrix':
+            for row in range(matrix.nrows):
+                if not (levels >> row) & 1:
+                    levels &= ~(matrix.pressed[row] << 8)
+        else:
+            for row in range(matrix.nrows):
+                levels &= ~(matrix.pressed[row] << (row * ncols))
+        levels &= 0xFFFF
+
+        changed = (levels ^ self.levels) & self._reg16(self.GPINTEN)
+        self.levels = levels
+        for port in (0, 1):
+            bits = (changed >> (port * 8)) & 0xFF
+            if bits:
+                if not self.regs[self.INTF + port]:
+                    self.regs[self.INTCAP + port] = (levels >> (port * 8)) & 0xFF
+                self.regs[self.INTF + port] |= bits
+        self._update_int()
+
+    #-------------------------------------------------------------------------
+
+    def _update_int(self):
+        if self.int_pin:
+            self.int_pin.set_level(0 if self.regs[self.INTF] | self.regs[self.INTF + 1] else 1)
+
+    #-------------------------------------------------------------------------
+
+    def write(self, buf):
+        """I2C write: register address, then data (sequential)."""
+
+        self.pointer = buf[0] % self.NREGS
+        for b in buf[1:]:
+            reg = self.pointer
+            if reg in (self.GPIO, self.GPIO + 1):
+                reg += self.OLAT - self.GPIO
+            if reg not in (self.INTF, self.INTF + 1, self.INTCAP, self.INTCAP + 1):
+                self.regs[reg] = b
+            self.pointer = (self.pointer + 1) % self.NREGS
+        if len(buf) > 1:
+            self.update()
+
+    #-------------------------------------------------------------------------
+
+    def read(self, nbytes):
+        """I2C read from the register pointer (sequential)."""
+
+        out = bytearray(nbytes)
+        for i in range(nbytes):
+            reg = self.pointer
+            if reg in (self.GPIO, self.GPIO + 1):
+                out[i] = (self.levels >> ((reg - self.GPIO) * 8)) & 0xFF
+            else:
+                out[i] = self.regs[reg]
+            if reg in (self.GPIO, self.GPIO + 1, self.INTCAP, self.INTCAP + 1):
+                self.regs[self.INTF + (reg & 1)] = 0
+            self.pointer = (self.pointer + 1) % self.NREGS
+        self._update_int()
+        return bytes(out)
+
+##============================================================================
+
+class SimPCF8574():
+    """A simulated PCF8574 8-bit quasi-bidirectional I2C GPIO expander.
+
+       A pin written 1 is weakly pulled up (an input), 0 drives it low.
+       With `wiring` 'matrix' the rows are on pins 0.. and the columns on
+       the next pins; with 'direct' key code N is on pin N.  `int_pin` is
+       driven low when an input changes, until the port is read or written.
+    """
+
+    def __init__(self, matrix, int_pin=None, wiring='matrix'):
+        """Constructor."""
+
+        self.matrix = matrix
+        self.int_pin = int_pin
+        self.wiring = wiring
+        self.latch = 0xFF
+        self.levels = 0xFF
+        if int_pin:
+            int_pin.set_level(1)
+        matrix.listeners.append(self.update)
+
+    #-------------------------------------------------------------------------
+
+    def update(self):
+        """Recompute the pin levels and interrupt state."""
+
+        levels = self.latch
+        matrix = self.matrix
+        if self.wiring == 'matrix':
+            for row in range(matrix.nrows):
+                if not (levels >> row) & 1:
+                    levels &= ~(matrix.pressed[row] << matrix.nrows)
+        else:
+            for row in range(matrix.nrows):
+                levels &= ~(matrix.pressed[row] << (row * matrix.ncols))
+        levels &= 0xFF
+
+        changed = (levels ^ self.levels) & self.latch
+        self.levels = levels
+        if changed and self.int_pin:
+            self.int_pin.set_level(0)
+
+    #-------------------------------------------------------------------------
+
+    def _clear_int(self):
+        if self.int_pin:
+            self.int_pin.set_level(1)
+
+    #-------------------------------------------------------------------------
+
+    def write(self, buf):
+        """I2C write: each byte sets the port."""
+
+        self._clear_int()
+        for b in buf:
+            self.latch = b
+        self.update()
+
+    #-------------------------------------------------------------------------
+
+    def read(self, nbytes):
+        """I2C read: the pin levels."""
+
+        self._clear_int()
+        return bytes([ self.levels ] * nbytes)
+
+##============================================================================
+
+class SimLcd():
+    """A stand-in for `I2cLcd` (HD44780 behind a PCF8574 backpack).
+
+       Implements the `LcdApi` calls used by the examples and writes the
+       same number of I2C bytes as the real driver: each command or data
+       byte is sent as two nibbles, each strobed with E high then low.
+    """
+
+    BYTES_PER_WRITE = 4
+
+    def __init__(self, i2c, i2c_addr, num_lines, num_columns):
+        """Constructor."""
+
+        self.i2c = i2c
+        self.i2c_addr = i2c_addr
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self.buf = bytearray(self.BYTES_PER_WRITE)
+
+    #-------------------------------------------------------------------------
+
+    def _write(self):
+        self.i2c.writeto(self.i2c_addr, self.buf)
+
+    #-------------------------------------------------------------------------
+
+    def clear(self):
+        """Clear the display and home the cursor."""
+
+        self._write()
+        self._write()
+        self.cursor_x = 0
+        self.cursor_y = 0
+
+    #-------------------------------------------------------------------------
+
+    def move_to(self, cursor_x=None, cursor_y=None):
+        """Move the cursor."""
+
+        if cursor_x is not None:
+            self.cursor_x = cursor_x
+        if cursor_y is not None:
+            self.cursor_y = cursor_y
+        self._write()
+
+    #-------------------------------------------------------------------------
+
+    def clear_row(self):
+        """Blank the current row and return the cursor to its start."""
+
+        self.move_to(cursor_x=0)
+        for _ in range(self.num_columns):
+            self._write()
+        self.move_to(cursor_x=0)
+
+    #-------------------------------------------------------------------------
+
+    def putchar(self, char):
+        """Write a character at the cursor."""
+
+        if char == '\n':
+            self.cursor_x = self.num_columns
+        else:
+            self._write()
+            self.cursor_x += 1
+        if self.cursor_x >= self.num_columns:
+            self.cursor_y = (self.cursor_y + 1) % self.num_lines
+            self.move_to(0, self.cursor_y)
+
+    #-------------------------------------------------------------------------
+
+    def putstr(self, string):
+        """Write a string at the cursor."""
+
+        for char in string:
+            self.putchar(char)
+
+##============================================================================
+
+def delay(ms):
+    """Blocking delay in milliseconds."""
+
+    time.sleep(ms / 1000)
+
+##============================================================================
+
+class SimSleep():
+    """A fake `machine.lightsleep(ms)`, which counts the time asleep.
+
+       It really sleeps (`lightsleep()` without `ms` sleeps until woken),
+       and `wake()` (called for every pin IRQ, from any thread) ends the
+       sleep, or the next one if not asleep, like a pending interrupt.
+       `overshoot_ms` is added to timed sleeps, as a real lightsleep's wake
+       up latency.
+    """
+
+    def __init__(self, overshoot_ms=0):
+        """Constructor."""
+
+        self.event = threading.Event() if threading else None
+        self.overshoot_ms = overshoot_ms
+        self.reset()
+
+    #-------------------------------------------------------------------------
+
+    def reset(self):
+        """Clear the counters."""
+
+        self.start = time.perf_counter()
+        self.asleep = 0.0
+        self.sleeps = 0
+        self.wakeups = 0
+        self.wake_latencies = []
+        self._wake_at = 0.0
+        if self.event is not None:
+            self.event.clear()
+
+    #-------------------------------------------------------------------------
+
+    def __call__(self, ms=None):
+        start = time.perf_counter()
+        timeout = None if ms is None else (ms + self.overshoot_ms) / 1000
+        if self.event is None:
+            time.sleep(timeout or 0)
+        elif self.event.wait(timeout):
+            self.event.clear()
+            self.wakeups += 1
+            self.wake_latencies.append(max(0.0, time.perf_counter() - max(start, self._wake_at)))
+        self.asleep += time.perf_counter() - start
+        self.sleeps += 1
+
+    #-------------------------------------------------------------------------
+
+    def wake(self):
+        """End the (next) sleep."""
+
+        if self.event is not None:
+            self._wake_at = time.perf_counter()
+            self.event.set()
+
+    #-------------------------------------------------------------------------
+
+    def report(self):
+        """Return `(asleep_ms, awake_ms)` since the last `reset()`."""
+
+        total = time.perf_counter() - self.start
+        return self.asleep * 1000, (total - self.asleep) * 1000
+
+LIGHTSLEEP = SimSleep()
+
+##============================================================================
+
+## The board profile, as the Olimex E407 setup.
+BOARD = Board('SIM', Pin, Signal)
+
+## Green LED and push button.
+BOARD.pin('LED', 'C13', Pin.OUT)
+BOARD.pin('BUTTON', 'A0', Pin.IN)
+
+## Keypad (wired to `MATRIX`) and LED bank.
+BOARD.keypad('KEYPAD', rows=KEYPAD_ROWS, cols=KEYPAD_COLS)
+BOARD.leds('LEDS', ('E15', 'E14', 'E13', 'E12', 'E11', 'E10', 'E9', 'E8'), inverted=True)
+
+## I2C bus and LCD.
+BOARD.declare('I2C1', I2C, 1, I2C.MASTER)
+BOARD.lcd('LCD', SimLcd, 'I2C1', 0x27, 4, 20)
+
+## Keypad (also wired to `MATRIX`) behind an MCP23017 on its own bus, as on
+## the production panels.
+EXPANDER_ADDR = 0x20
+
+def _expander_bus(bus):
+    i2c = I2C(bus, I2C.MASTER)
+    i2c.add_device(EXPANDER_ADDR, SimMCP23017(MATRIX, BOARD.get('KEYPAD_INT')))
+    return i2c
+
+BOARD.pin('KEYPAD_INT', 'PE2', Pin.IN, Pin.PULL_UP)
+BOARD.declare('I2C2', _expander_bus, 2)
+BOARD.expander_keypad('KEYPAD_EXP', 'I2C2', EXPANDER_ADDR, int_pin='KEYPAD_INT')
+
+#-----------------------------------------------------------------------------
+
+def __getattr__(name):
+    """Construct board peripherals on first use (`hwconfig.LED`, ...)."""
+
+    return getattr(BOARD, name)
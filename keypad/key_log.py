@@ -0,0 +1,445 @@
+"""
+Persistent key event log (audit trail) on the flash filesystem
+==============================================================
+
+Logs key events to flash so they survive power cycles, without writing (and
+wearing) a flash sector per event.
+
+Notes
+-----
+
+    * Events are added with `add()` (e.g. as a `Keypad_uasyncio` event hook),
+      which never blocks or allocates: each event is packed into a
+      preallocated sector sized block buffer in RAM.  A full block is sealed
+      and a new one started; `nbuffers` blocks can wait to be written.  If
+      they are all waiting, further events are counted as dropped rather
+      than stalling the keypad scan.
+
+    * The low priority `run()` task writes the sealed blocks, one sector
+      sized write per block (yielding between blocks), every `interval_ms`.
+      A partly filled block is sealed and written once its oldest event is
+      `max_age_ms` old, which bounds what is lost on a power cut.
+
+    * Block format (`SECTOR_SIZE` bytes, little endian):
+
+        uint16  magic       -- `MAGIC`
+        uint16  boot        -- boot number (incremented on every open)
+        uint32  first_seq   -- sequence number of the first record
+        uint16  count       -- number of records
+        count * record:
+            uint32  t_ms        -- ticks_ms() when the event was seen
+            uint8   key_code
+            uint8   key_event   -- Keypad_uasyncio.KEY_* event
+        ...     padding (0xFF)
+        uint16  crc         -- CRC-16/CCITT-FALSE of all the above
+
+      Sequence numbers continue across boots, so gaps show lost events.
+
+    * The log rotates over a fixed set of `nsegments` segment files of
+      `segment_blocks` blocks each.  Blocks are only ever appended, and when
+      the log wraps around to a segment it is overwritten from the start, so
+      writes are spread over the segments and no index or header is
+      rewritten in place.  (On littlefs the filesystem also wear levels
+      within files; on FAT it does not, so the rotation matters more.)
+      Segments are not truncated, which would free and reallocate their
+      clusters (and takes ~50ms on ext4): the old blocks left after the new
+      ones end at a sequence number gap.
+
+    * Recovery: on open, the segment holding the newest first block is the
+      current one, and its blocks are checked up to the first bad one (bad
+      magic/CRC or a sequence number gap), which is a torn write.  Appending
+      continues at that block, overwriting the torn block with a whole
+      sector, so nothing needs truncating.  Readers stop at the same point.
+
+    * To log the keypad:
+        >>> log = KeyLog('/flash/keylog')
+        >>> keypad.add_event_hook(log.add)
+        >>> loop.create_task(log.run())
+
+      and to read it back:
+        >>> for seq, boot, t_ms, key_code, key_event in KeyLog.read('/flash/keylog'):
+
+    * See `bench/bench_key_log.py` for write amplification, flush latency
+      and a torn write recovery check.
+
+"""
+
+##============================================================================
+
+import struct
+
+try:
+    import os
+except ImportError:
+    import uos as os
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    sleep_ms = asyncio.sleep_ms
+except AttributeError:
+    ## CPython asyncio has no sleep_ms().
+    def sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
+
+from key_stream import crc16
+
+##============================================================================
+
+MAGIC = 0x4C4B          ## 'KL'
+SECTOR_SIZE = 512
+
+HEADER_FORMAT = '<HHIH'
+HEADER_SIZE = 10
+RECORD_FORMAT = '<IBB'
+RECORD_SIZE = 6
+CRC_SIZE = 2
+
+NSEGMENTS_DEFAULT = 4
+SEGMENT_BLOCKS_DEFAULT = 64
+NBUFFERS_DEFAULT = 4
+INTERVAL_MS_DEFAULT = 1000
+MAX_AGE_MS_DEFAULT = 10000
+
+##============================================================================
+
+def records_per_block(sector_size=SECTOR_SIZE):
+    """Return the number of records in a block."""
+
+    return (sector_size - HEADER_SIZE - CRC_SIZE) // RECORD_SIZE
+
+#-----------------------------------------------------------------------------
+
+def check_block(block):
+    """Return `(boot, first_seq, count)` of a block, or None if it is bad."""
+
+    size = len(block)
+    if size < HEADER_SIZE + CRC_SIZE:
+        return None
+    magic, boot, first_seq, count = struct.unpack_from(HEADER_FORMAT, block, 0)
+    if magic != MAGIC or count > records_per_block(size):
+        return None
+    n = size - CRC_SIZE
+    if crc16(block, n) != block[n] | (block[n + 1] << 8):
+        return None
+    return boot, first_seq, count
+
+##============================================================================
+
+class KeyLog():
+    """Batched, rotating key event log in a set of segment files."""
+
+    def __init__(self, path, nsegments=NSEGMENTS_DEFAULT, segment_blocks=SEGMENT_BLOCKS_DEFAULT,
+                 nbuffers=NBUFFERS_DEFAULT, interval_ms=INTERVAL_MS_DEFAULT, max_age_ms=MAX_AGE_MS_DEFAULT,
+                 sector_size=SECTOR_SIZE, clock=ticks_ms):
+        """Constructor.  Opens (and recovers) the log in files `<path><n>.bin`."""
+
+        self.path = path
+        self.nsegments = nsegments
+        self.segment_blocks = segment_blocks
+        self.nbuffers = nbuffers
+        self.interval_ms = interval_ms
+        self.max_age_ms = max_age_ms
+        self.sector_size = sector_size
+        self.clock = clock
+        self.records_max = records_per_block(sector_size)
+
+        self.buffers = [ bytearray(sector_size) for _ in range(nbuffers) ]
+        self.fill = 0           ## buffer being filled
+        self.count = 0          ## records in it
+        self.first_t = 0        ## time of its first record
+        self.full = 0           ## sealed buffers waiting to be written
+        self.write_i = 0        ## oldest sealed buffer
+
+        ## Statistics.
+        self.events_logged = 0
+        self.events_dropped = 0
+        self.blocks_written = 0
+        self.bytes_written = 0
+        self.records_written = 0
+        self.rotations = 0
+        self.write_us_max = 0
+        self.write_us_total = 0
+
+        self.file = None
+        self._recover()
+
+    #-------------------------------------------------------------------------
+
+    def segment_path(self, segment):
+        """Return the file path of a segment."""
+
+        return '{}{}.bin'.format(self.path, segment)
+
+    #-------------------------------------------------------------------------
+
+    @staticmethod
+    def _read_blocks(f, sector_size):
+        """Yield `(boot, first_seq, count, block)` for the good blocks of a segment file."""
+
+        next_seq = None
+        while True:
+            block = f.read(sector_size)
+            if not block or len(block) < sector_size:
+                return
+            info = check_block(block)
+            if info is None:
+                return
+            boot, first_seq, count = info
+            if next_seq is not None and first_seq != next_seq:
+                return
+            next_seq = first_seq + count
+            yield boot, first_seq, count, block
+
+    #-------------------------------------------------------------------------
+
+    def _first_block(self, segment):
+        """Return `(boot, first_seq, count)` of a segment's first block, or None."""
+
+        try:
+            with open(self.segment_path(segment), 'rb') as f:
+                return check_block(f.read(self.sector_size))
+        except OSError:
+            return None
+
+    #-------------------------------------------------------------------------
+
+    def _recover(self):
+        """Find the end of the log and open the current segment for appending."""
+
+        segment = 0
+        newest = None
+        for i in range(self.nsegments):
+            info = self._first_block(i)
+            if info is not None and (newest is None or info[1] > newest[1]):
+                segment = i
+                newest = info
+
+        self.segment = segment
+        self.boot = 0
+        self.seq = 0
+        self.segment_used = 0
+        if newest is None:
+            self.file = self._open_segment(segment)
+            return
+
+        ## Find the last good block of the current segment.
+        boot = 0
+        with open(self.segment_path(segment), 'rb') as f:
+            for boot, first_seq, count, _ in self._read_blocks(f, self.sector_size):
+                self.seq = first_seq + count
+                self.segment_used += 1
+                if boot > self.boot:
+                    self.boot = boot
+        self.boot = (self.boot + 1) & 0xFFFF
+
+        ## Append after it (overwriting any torn block).
+        self.file = self._open_segment(segment)
+        self.file.seek(self.segment_used * self.sector_size)
+
+    #-------------------------------------------------------------------------
+
+    def _open_segment(self, segment):
+        """Open a segment for writing from the start, without truncating it."""
+
+        try:
+            return open(self.segment_path(segment), 'r+b')
+        except OSError:
+            return open(self.segment_path(segment), 'wb')
+
+    #-------------------------------------------------------------------------
+
+    def add(self, key_code, key_event):
+        """Add a key event (never blocks)."""
+
+        if self.full >= self.nbuffers:
+            self.events_dropped += 1
+            return
+
+        t = self.clock()
+        if not self.count:
+            self.first_t = t
+        struct.pack_into(RECORD_FORMAT, self.buffers[self.fill], HEADER_SIZE + self.count * RECORD_SIZE,
+                         t & 0xFFFFFFFF, key_code, key_event)
+        self.count += 1
+        self.events_logged += 1
+        if self.count >= self.records_max:
+            self._seal()
+
+    #-------------------------------------------------------------------------
+
+    def _seal(self):
+        """Queue the block being filled for writing, and start the next one."""
+
+        buf = self.buffers[self.fill]
+        count = self.count
+        struct.pack_into(HEADER_FORMAT, buf, 0, MAGIC, self.boot, self.seq & 0xFFFFFFFF, count)
+        self.seq += count
+        self.full += 1
+        self.fill = (self.fill + 1) % self.nbuffers
+        self.count = 0
+
+    #-------------------------------------------------------------------------
+
+    def _write_block(self):
+        """Write the oldest sealed block to flash (one sector write)."""
+
+        start = ticks_us()
+        buf = self.buffers[self.write_i]
+        count = struct.unpack_from(HEADER_FORMAT, buf, 0)[3]
+
+        ## Pad and add the CRC here, not in add().
+        n = self.sector_size - CRC_SIZE
+        for i in range(HEADER_SIZE + count * RECORD_SIZE, n):
+            buf[i] = 0xFF
+        crc = crc16(buf, n)
+        buf[n] = crc & 0xFF
+        buf[n + 1] = crc >> 8
+
+        if self.segment_used >= self.segment_blocks:
+            ## Rotate to the next segment (the oldest), overwriting it.
+            self.file.close()
+            self.segment = (self.segment + 1) % self.nsegments
+            self.file = self._open_segment(self.segment)
+            self.segment_used = 0
+            self.rotations += 1
+
+        self.file.write(buf)
+        self.file.flush()
+        self.segment_used += 1
+
+        self.write_i = (self.write_i + 1) % self.nbuffers
+        self.full -= 1
+
+        self.blocks_written += 1
+        self.bytes_written += self.sector_size
+        self.records_written += count
+        us = ticks_diff(ticks_us(), start)
+        self.write_us_total += us
+        if us > self.write_us_max:
+            self.write_us_max = us
+
+    #-------------------------------------------------------------------------
+
+    def due(self):
+        """Return True if the block being filled is old enough to be written."""
+
+        return self.count and ticks_diff(self.clock(), self.first_t) >= self.max_age_ms
+
+    #-------------------------------------------------------------------------
+
+    def flush(self):
+        """Write all pending events now (e.g. before a planned power down)."""
+
+        if self.count:
+            self._seal()
+        while self.full:
+            self._write_block()
+        if hasattr(os, 'sync'):
+            os.sync()
+
+    #-------------------------------------------------------------------------
+
+    async def run(self):
+        """A low priority task to write sealed blocks every `interval_ms`."""
+
+        while True:
+            await sleep_ms(self.interval_ms)
+            if self.due():
+                self._seal()
+            while self.full:
+                self._write_block()
+                await sleep_ms(0)
+
+    #-------------------------------------------------------------------------
+
+    def close(self):
+        """Flush and close the log."""
+
+        self.flush()
+        self.file.close()
+
+    #-------------------------------------------------------------------------
+
+    def write_amplification(self):
+        """Return bytes written to flash per byte of event records."""
+
+        if not self.records_written:
+            return 0
+        return self.bytes_written / (self.records_written * RECORD_SIZE)
+
+    #-------------------------------------------------------------------------
+
+    @classmethod
+    def read(cls, path, nsegments=NSEGMENTS_DEFAULT, sector_size=SECTOR_SIZE):
+        """Yield `(seq, boot, t_ms, key_code, key_event)` for every logged event, oldest first."""
+
+        segments = []
+        for i in range(nsegments):
+            try:
+                with open('{}{}.bin'.format(path, i), 'rb') as f:
+                    info = check_block(f.read(sector_size))
+            except OSError:
+                continue
+            if info is not None:
+                segments.append((info[1], i))
+        segments.sort()
+
+        for _, i in segments:
+            with open('{}{}.bin'.format(path, i), 'rb') as f:
+                for boot, first_seq, count, block in cls._read_blocks(f, sector_size):
+                    for j in range(count):
+                        t_ms, key_code, key_event = struct.unpack_from(RECORD_FORMAT, block, HEADER_SIZE + j * RECORD_SIZE)
+                        yield first_seq + j, boot, t_ms, key_code, key_event
+
+##============================================================================
+
+async def _drain_keys(keypad):
+    """A task to empty the keypad queue (the events are logged via the hook)."""
+
+    while True:
+        key = await keypad.get_key()
+        print("key:", key)
+
+#-----------------------------------------------------------------------------
+
+def main(path='/flash/keylog'):
+    """Log keypad events to flash."""
+
+    from keypad_uasyncio import Keypad_uasyncio
+
+    print("main(): start")
+
+    for event in KeyLog.read(path):
+        print("logged:", event)
+
+    keypad = Keypad_uasyncio(queue_size=4, start=True)
+    log = KeyLog(path)
+    keypad.add_event_hook(log.add)
+
+    loop = asyncio.get_event_loop()
+    loop.create_task(keypad.scan_coro())
+    loop.create_task(_drain_keys(keypad))
+    loop.create_task(log.run())
+    loop.run_forever()
+
+##============================================================================
+
+run = main
@@ -0,0 +1,307 @@
+"""
+Binary key event stream (device side)
+=====================================
+
+Streams key events over a UART/USB VCP as small binary frames instead of
+printed text.  See `key_stream_reader.py` for the host side reader.
+
+Notes
+-----
+
+    * Frame format (before COBS encoding):
+
+        uint16  seq         -- frame sequence number (wraps)
+        uint8   dropped     -- events dropped on the device since the last frame
+        uint8   count       -- number of events
+        count * event:
+            uint8   key_code
+            uint8   key_event   -- Keypad_uasyncio.KEY_* event
+            uint16  t_ms        -- ticks_ms() & 0xFFFF when the event was seen
+        uint16  crc         -- CRC-16/CCITT-FALSE of all the above
+
+      all little endian.  Each frame is COBS encoded and terminated with a
+      0x00 byte, so a reader can resynchronise at any 0x00.
+
+    * Events are added with `add()` (e.g. as a `Keypad_uasyncio` event hook),
+      which never blocks or allocates: events go into a preallocated batch
+      buffer.  Every `interval_ms` the `run()` task encodes the batch into a
+      preallocated output buffer, empties the batch and writes the frame, so
+      events keep being batched while the write is in progress.  If a batch
+      fills up before it is sent, further events are counted as dropped
+      rather than stalling the keypad scan.
+
+    * To stream the keypad over UART 2 type:
+        >>> import key_stream
+        >>> key_stream.run()
+
+      or, in an app:
+        >>> stream = KeyStream(asyncio.StreamWriter(UART(2, 115200), {}))
+        >>> keypad.add_event_hook(stream.add)
+        >>> loop.create_task(stream.run())
+
+"""
+
+##============================================================================
+
+from array import array
+
+try:
+    from time import ticks_ms
+except ImportError:
+    from time import perf_counter
+
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    sleep_ms = asyncio.sleep_ms
+except AttributeError:
+    ## CPython asyncio has no sleep_ms().
+    def sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
+
+##============================================================================
+
+HEADER_SIZE = 4
+EVENT_SIZE = 4
+CRC_SIZE = 2
+
+BATCH_EVENTS_DEFAULT = 16
+INTERVAL_MS_DEFAULT = 20
+
+##============================================================================
+
+def _crc16_table():
+    table = array('H', [ 0 ] * 256)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[i] = crc & 0xFFFF
+    return table
+
+CRC16_TABLE = _crc16_table()
+
+#-----------------------------------------------------------------------------
+
+def crc16(buf, n=None, crc=0xFFFF):
+    """CRC-16/CCITT-FALSE of the first `n` bytes of `buf`."""
+
+    table = CRC16_TABLE
+    for i in range(len(buf) if n is None else n):
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ buf[i]]
+    return crc
+
+#-----------------------------------------------------------------------------
+
+def cobs_encode_into(src, n, dst):
+    """COBS encode the first `n` bytes of `src` into `dst`, adding the 0x00
+       terminator.  Returns the encoded length.  `dst` needs at least
+       `n + n // 254 + 2` bytes.
+    """
+
+    code_i = 0
+    code = 1
+    out = 1
+    for i in range(n):
+        b = src[i]
+        if b:
+            dst[out] = b
+            out += 1
+            code += 1
+        if not b or code == 0xFF:
+            dst[code_i] = code
+            code_i = out
+            out += 1
+            code = 1
+    dst[code_i] = code
+    dst[out] = 0
+    return out + 1
+
+#-----------------------------------------------------------------------------
+
+def cobs_decode(data):
+    """Decode a COBS frame (without the 0x00 terminator).  Raises ValueError."""
+
+    out = bytearray()
+    i = 0
+    n = len(data)
+    while i < n:
+        code = data[i]
+        if code == 0 or i + code > n:
+            raise ValueError("bad COBS frame")
+        out += data[i + 1:i + code]
+        i += code
+        if code != 0xFF and i < n:
+            out.append(0)
+    return bytes(out)
+
+#-----------------------------------------------------------------------------
+
+def decode_frame(data):
+    """Decode a frame (without the 0x00 terminator).
+
+       Returns `(seq, dropped, events)`, `events` being a list of
+       `(key_code, key_event, t_ms)`.  Raises ValueError on a bad frame.
+    """
+
+    payload = cobs_decode(data)
+    if len(payload) < HEADER_SIZE + CRC_SIZE:
+        raise ValueError("short frame")
+    n = len(payload) - CRC_SIZE
+    if crc16(payload, n) != payload[n] | (payload[n + 1] << 8):
+        raise ValueError("bad CRC")
+    seq = payload[0] | (payload[1] << 8)
+    dropped = payload[2]
+    count = payload[3]
+    if HEADER_SIZE + count * EVENT_SIZE != n:
+        raise ValueError("bad event count")
+    events = []
+    for i in range(HEADER_SIZE, n, EVENT_SIZE):
+        events.append((payload[i], payload[i + 1], payload[i + 2] | (payload[i + 3] << 8)))
+    return seq, dropped, events
+
+##============================================================================
+
+class KeyStream():
+    """Batches key events into binary frames and writes them to a stream."""
+
+    def __init__(self, writer, batch_events=BATCH_EVENTS_DEFAULT, interval_ms=INTERVAL_MS_DEFAULT):
+        """Constructor.
+
+           `writer` is a uasyncio/asyncio StreamWriter (or anything with
+           `write()` and an async `drain()`/`awrite()`).
+        """
+
+        self.writer = writer
+        self.batch_events = batch_events
+        self.interval_ms = interval_ms
+
+        size = HEADER_SIZE + batch_events * EVENT_SIZE + CRC_SIZE
+        self.batch = bytearray(size)
+        self.out = bytearray(size + size // 254 + 2)
+        self.out_mv = memoryview(self.out)
+
+        self.count = 0          ## events in the batch
+        self.seq = 0
+        self.dropped = 0        ## events dropped since the last frame
+
+        ## Statistics.
+        self.frames_sent = 0
+        self.events_sent = 0
+        self.bytes_sent = 0
+        self.events_dropped = 0
+
+    #-------------------------------------------------------------------------
+
+    def add(self, key_code, key_event):
+        """Add a key event to the current batch (never blocks)."""
+
+        if self.count >= self.batch_events:
+            self.dropped += 1
+            self.events_dropped += 1
+            return
+
+        buf = self.batch
+        i = HEADER_SIZE + self.count * EVENT_SIZE
+        t = ticks_ms()
+        buf[i] = key_code
+        buf[i + 1] = key_event
+        buf[i + 2] = t & 0xFF
+        buf[i + 3] = (t >> 8) & 0xFF
+        self.count += 1
+
+    #-------------------------------------------------------------------------
+
+    def encode(self):
+        """Encode the batch into the output buffer and empty the batch.
+
+           Returns the frame length (0 if there are no events).
+        """
+
+        count = self.count
+        if not count:
+            return 0
+
+        buf = self.batch
+        self.count = 0
+
+        seq = self.seq
+        dropped = self.dropped if self.dropped < 0xFF else 0xFF
+        self.seq = (seq + 1) & 0xFFFF
+        self.dropped = 0
+
+        buf[0] = seq & 0xFF
+        buf[1] = seq >> 8
+        buf[2] = dropped
+        buf[3] = count
+        n = HEADER_SIZE + count * EVENT_SIZE
+        crc = crc16(buf, n)
+        buf[n] = crc & 0xFF
+        buf[n + 1] = crc >> 8
+
+        self.events_sent += count
+        return cobs_encode_into(buf, n + CRC_SIZE, self.out)
+
+    #-------------------------------------------------------------------------
+
+    async def write(self, n):
+        """Write the first `n` bytes of the output buffer."""
+
+        writer = self.writer
+        data = self.out_mv[:n]
+        if hasattr(writer, 'drain'):
+            writer.write(data)
+            await writer.drain()
+        else:
+            await writer.awrite(data)
+        self.frames_sent += 1
+        self.bytes_sent += n
+
+    #-------------------------------------------------------------------------
+
+    async def run(self):
+        """A task to send a frame every `interval_ms` when there are events."""
+
+        while True:
+            await sleep_ms(self.interval_ms)
+            n = self.encode()
+            if n:
+                await self.write(n)
+
+##============================================================================
+
+async def _drain_keys(keypad):
+    """A task to empty the keypad queue (the events go out via the stream)."""
+
+    while True:
+        await keypad.get_key()
+
+#-----------------------------------------------------------------------------
+
+def main(uart_id=2, baudrate=115200):
+    """Stream keypad events over a UART."""
+
+    from machine import UART
+    from keypad_uasyncio import Keypad_uasyncio
+
+    print("main(): start")
+
+    keypad = Keypad_uasyncio(queue_size=4, start=True)
+    stream = KeyStream(asyncio.StreamWriter(UART(uart_id, baudrate), {}))
+    keypad.add_event_hook(stream.add)
+
+    loop = asyncio.get_event_loop()
+    loop.create_task(keypad.scan_coro())
+    loop.create_task(_drain_keys(keypad))
+    loop.create_task(stream.run())
+    loop.run_forever()
+
+##============================================================================
+
+run = main
@@ -0,0 +1,238 @@
+"""
+Binary key event stream reader (host side, CPython asyncio)
+===========================================================
+
+Reads the frames written by `key_stream.KeyStream` from any asyncio
+`StreamReader` (serial port, pty, TCP socket, ...), checks the CRC and
+sequence numbers and reports throughput and dropped frames.
+
+Notes
+-----
+
+    * To read a serial device (e.g. the board's USB VCP):
+        $ python3 key_stream_reader.py /dev/ttyACM0
+
+    * To run a self test over a pty pair (a simulated device writes random
+      key events into the slave side while the reader reads the master):
+        $ python3 key_stream_reader.py --selftest [EVENTS]
+
+    * Frames that fail to decode (bad COBS/CRC) are counted in
+      `bad_frames`, and frames missing altogether (gaps in the sequence
+      numbers not explained by bad frames) in `dropped_frames`, so a lost
+      frame is counted once.  Events the device had to drop (batch full)
+      are reported separately.
+
+    * A run of noise longer than the reader's limit without a 0x00
+      delimiter is discarded and counted as one bad frame.
+
+"""
+
+##============================================================================
+
+import asyncio
+import os
+import sys
+import time
+
+from key_stream import decode_frame, KeyStream
+
+##============================================================================
+
+class KeyStreamReader():
+    """Reads and decodes key event frames from an asyncio StreamReader."""
+
+    def __init__(self, reader):
+        """Constructor."""
+
+        self.reader = reader
+        self.next_seq = None
+        self.bad_since_good = 0     ## bad frames since the last good frame
+
+        ## Statistics.
+        self.frames = 0
+        self.events = 0
+        self.bytes = 0
+        self.bad_frames = 0
+        self.dropped_frames = 0
+        self.device_dropped_events = 0
+        self.start = None
+
+    #-------------------------------------------------------------------------
+
+    async def frames_iter(self):
+        """Yield `(seq, events)` for each good frame until EOF."""
+
+        while True:
+            try:
+                data = await self.reader.readuntil(b'\x00')
+            except asyncio.IncompleteReadError:
+                return
+            except asyncio.LimitOverrunError as exc:
+                ## Noise without a delimiter: drop it and resync.
+                data = await self.reader.read(max(1, exc.consumed))
+                self.bytes += len(data)
+                self.bad_frames += 1
+                self.bad_since_good += 1
+                continue
+            if self.start is None:
+                self.start = time.monotonic()
+            self.bytes += len(data)
+            if len(data) == 1:
+                continue            ## empty frame (resync)
+
+            try:
+                seq, dropped, events = decode_frame(data[:-1])
+            except ValueError:
+                self.bad_frames += 1
+                self.bad_since_good += 1
+                continue
+
+            if self.next_seq is not None and seq != self.next_seq:
+                ## (the bad frames in the gap are counted already)
+                self.dropped_frames += max(0, ((seq - self.next_seq) & 0xFFFF) - self.bad_since_good)
+            self.next_seq = (seq + 1) & 0xFFFF
+            self.bad_since_good = 0
+
+            self.frames += 1
+            self.events += len(events)
+            self.device_dropped_events += dropped
+            yield seq, events
+
+    #-------------------------------------------------------------------------
+
+    async def events_iter(self):
+        """Yield `(key_code, key_event, t_ms)` for each event until EOF."""
+
+        async for _, events in self.frames_iter():
+            for event in events:
+                yield event
+
+    #-------------------------------------------------------------------------
+
+    def report(self):
+        """Return a one line summary of the statistics."""
+
+        elapsed = time.monotonic() - self.start if self.start is not None else 0
+        rate = (lambda n: n / elapsed) if elapsed else (lambda n: 0)
+        return ("frames={} events={} bytes={} bad_frames={} dropped_frames={} device_dropped_events={} "
+                "| {:.1f} frames/s {:.1f} events/s {:.1f} bytes/s").format(
+                    self.frames, self.events, self.bytes, self.bad_frames, self.dropped_frames,
+                    self.device_dropped_events, rate(self.frames), rate(self.events), rate(self.bytes))
+
+##============================================================================
+
+async def open_fd_reader(fd):
+    """Return an asyncio StreamReader for a (tty/pty/pipe) file descriptor."""
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    protocol = asyncio.StreamReaderProtocol(reader)
+    await loop.connect_read_pipe(lambda: protocol, os.fdopen(fd, 'rb', buffering=0))
+    return reader
+
+#-----------------------------------------------------------------------------
+
+def set_raw(fd):
+    """Put a tty in raw mode (no echo, no line editing, no translation)."""
+
+    import tty
+    tty.setraw(fd)
+
+##============================================================================
+
+class _FdWriter():
+    """Minimal asyncio style writer for a file descriptor (simulated device side)."""
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def write(self, data):
+        data = bytes(data)
+        while data:
+            n = os.write(self.fd, data)
+            data = data[n:]
+
+    async def drain(self):
+        await asyncio.sleep(0)
+
+#-----------------------------------------------------------------------------
+
+async def selftest(nevents=20000):
+    """Stream random key events through a pty pair and read them back."""
+
+    import pty
+    import random
+
+    master, slave = pty.openpty()
+    set_raw(master)
+    set_raw(slave)
+
+    reader = KeyStreamReader(await open_fd_reader(master))
+    stream = KeyStream(_FdWriter(slave), interval_ms=1)
+
+    async def device():
+        sent = 0
+        rand = random.Random(1)
+        while sent < nevents:
+            for _ in range(rand.randint(1, 8)):
+                stream.add(rand.randrange(16), rand.randrange(4))
+                sent += 1
+            n = stream.encode()
+            if n:
+                await stream.write(n)
+            await asyncio.sleep(0)
+        os.close(slave)
+
+    task = asyncio.get_running_loop().create_task(device())
+    try:
+        async for _ in reader.events_iter():
+            if reader.events >= nevents:
+                break
+    finally:
+        await task
+
+    print("sent:", stream.frames_sent, "frames,", stream.events_sent, "events,", stream.bytes_sent, "bytes")
+    print("read:", reader.report())
+    ok = reader.events == stream.events_sent and not reader.bad_frames and not reader.dropped_frames
+    print("selftest:", "OK" if ok else "FAILED")
+    return ok
+
+#-----------------------------------------------------------------------------
+
+async def read_device(path):
+    """Print key events read from a device, with a summary every second."""
+
+    fd = os.open(path, os.O_RDONLY | os.O_NOCTTY)
+    if os.isatty(fd):
+        set_raw(fd)
+    reader = KeyStreamReader(await open_fd_reader(fd))
+
+    last = time.monotonic()
+    async for key_code, key_event, t_ms in reader.events_iter():
+        print("key_code={:2d} key_event={} t_ms={}".format(key_code, key_event, t_ms))
+        if time.monotonic() - last >= 1:
+            last = time.monotonic()
+            print(reader.report())
+    print(reader.report())
+
+##============================================================================
+
+def main(argv=None):
+    """Main function."""
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("usage: key_stream_reader.py DEVICE | --selftest [EVENTS]")
+        return 2
+    if argv[0] == '--selftest':
+        ok = asyncio.run(selftest(*[ int(arg) for arg in argv[1:2] ]))
+        return 0 if ok else 1
+    asyncio.run(read_device(argv[0]))
+    return 0
+
+##============================================================================
+
+run = main
+
+if __name__ == '__main__':
+    sys.exit(main())
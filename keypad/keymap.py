@@ -0,0 +1,321 @@
+"""
+Compiled multi-layer keymaps
+============================
+
+Turns a declarative keypad layout, with layers (e.g. shift, function,
+numeric) and action codes, into one flat `bytes` table, so resolving a key
+event to an action is a single indexed lookup, and switching layers at
+runtime just changes an offset into the table.
+
+Notes
+-----
+
+    * Action codes (one byte):
+
+        0               NONE
+        0x01 .. 0x7F    an ASCII char (the action is its ordinal)
+        0x80 .. 0xBF    app actions (`BACKSPACE`, `ENTER`, `CLEAR_LINE`, ...)
+        0xC0 | n        switch to layer n
+        0xD0 | n        toggle layer n (on/off, back to the base layer 0)
+        0xE0 | n        one-shot layer n (for the next action only)
+        0xF0 | n        momentary layer n (while the key is held)
+
+      Layer actions are handled by `Keymap.resolve()` itself and resolve to
+      NONE, so apps only see chars and app actions.
+
+    * A layout is a list of `(layer_name, layer)` pairs, the first being the
+      base layer.  A layer maps event names ('up', 'down', 'long',
+      'up_long', see `EVENTS`) to a list of entries, one per key code:
+
+        'x'             the char action for 'x'
+        an int          an action code (e.g. `ENTER`)
+        toggle('name')  a layer action (also `layer()`, `oneshot()`,
+                        `momentary()`)
+        None            the same as the base layer (NONE in the base layer)
+
+      Events not given in a layer are the same as in the base layer.
+
+    * `momentary()` goes on a key's 'down' event; the compiler makes the
+      key's release events ('up', 'up_long') in the target layer switch
+      back, so holding the key (however long) acts as a modifier.
+
+    * Usage:
+        >>> keymap = Keymap(LCD_LAYOUT)
+        >>> keypad = Keypad_uasyncio(keymap=keymap)     ## queue gets action codes
+        >>> keymap.set_layer(keymap.layer_index('numeric'))
+
+    * Compiling is done once (at start up); `Keymap(table=..., nkeys=...,
+      names=...)` takes a table compiled earlier (e.g. frozen as a bytes
+      constant).
+
+"""
+
+##============================================================================
+
+NONE            = 0x00
+
+## App actions.
+ACTION_FIRST    = 0x80
+BACKSPACE       = 0x80
+ENTER           = 0x81
+CLEAR_LINE      = 0x82
+CLEAR_SCREEN    = 0x83
+CURSOR_LEFT     = 0x84
+CURSOR_RIGHT    = 0x85
+CURSOR_UP       = 0x86
+CURSOR_DOWN     = 0x87
+HOME            = 0x88
+
+## Layer actions (| layer number).
+LAYER_FIRST     = 0xC0
+LAYER_SET       = 0xC0
+LAYER_TOGGLE    = 0xD0
+LAYER_ONESHOT   = 0xE0
+LAYER_MOMENTARY = 0xF0
+LAYERS_MAX      = 16
+
+## Key events, as `Keypad_uasyncio.KEY_*` (the event is the table index).
+EVENTS = { 'up': 0, 'down': 1, 'long': 2, 'up_long': 3 }
+NEVENTS = 4
+EVENT_UP        = 0
+EVENT_DOWN      = 1
+EVENT_LONG      = 2
+EVENT_UP_LONG   = 3
+
+NKEYS_DEFAULT = 16
+
+##============================================================================
+
+## Layer action entries, resolved to layer numbers by `compile_layout()`.
+
+def layer(name):
+    """Switch to layer `name`."""
+    return (LAYER_SET, name)
+
+def toggle(name):
+    """Toggle layer `name` on/off."""
+    return (LAYER_TOGGLE, name)
+
+def oneshot(name):
+    """Use layer `name` for the next action only."""
+    return (LAYER_ONESHOT, name)
+
+def momentary(name):
+    """Use layer `name` while the key is held (put on the 'down' event)."""
+    return (LAYER_MOMENTARY, name)
+
+##============================================================================
+
+## The original keypad chars: a char when a key is released, and another
+## when it is held down for a long time.
+CHAR_LAYOUT = [
+    ('base', {
+        'up': [
+            '1', '2', '3', 'A',
+            '4', '5', '6', 'B',
+            '7', '8', '9', 'C',
+            '*', '0', '#', 'D',
+            ],
+        'long': [
+            'm', 'i', 'e', 'a',
+            'n', 'j', 'f', 'b',
+            'o', 'k', 'g', 'c',
+            'p', 'l', 'h', 'd',
+            ],
+        }),
+    ]
+
+## The LCD app layout: the original keys, with '*', '#', long '*' and long
+## 'D' as editing actions, and long 'A'/'B'/'C' toggling the shift, numeric
+## and function layers.  Unlike the original (`CHAR_LAYOUT`), long 'A'/'B'/
+## 'C' do not type 'a'/'b'/'c': those are 'A'/'B'/'C' in the shift layer.
+LCD_LAYOUT = [
+    ('base', {
+        'up': [
+            '1', '2', '3', 'A',
+            '4', '5', '6', 'B',
+            '7', '8', '9', 'C',
+            BACKSPACE, '0', ENTER, 'D',
+            ],
+        'long': [
+            'm', 'i', 'e', toggle('shift'),
+            'n', 'j', 'f', toggle('numeric'),
+            'o', 'k', 'g', toggle('function'),
+            CLEAR_LINE, 'l', 'h', CLEAR_SCREEN,
+            ],
+        }),
+    ('shift', {
+        'up': [
+            None, None, None, 'a',
+            None, None, None, 'b',
+            None, None, None, 'c',
+            None, None, None, 'd',
+            ],
+        'long': [
+            'M', 'I', 'E', None,
+            'N', 'J', 'F', toggle('numeric'),
+            'O', 'K', 'G', toggle('function'),
+            None, 'L', 'H', None,
+            ],
+        }),
+    ('numeric', {
+        'up': [
+            None, None, None, '+',
+            None, None, None, '-',
+            None, None, None, '.',
+            BACKSPACE, None, ENTER, '=',
+            ],
+        'long': [
+            None, None, None, toggle('shift'),
+            None, None, None, None,
+            None, None, None, toggle('function'),
+            None, None, None, None,
+            ],
+        }),
+    ('function', {
+        'up': [
+            HOME,        CURSOR_UP,   NONE,         NONE,
+            CURSOR_LEFT, NONE,        CURSOR_RIGHT, NONE,
+            NONE,        CURSOR_DOWN, NONE,         NONE,
+            None,        NONE,        None,         NONE,
+            ],
+        'long': [
+            None, None, None, toggle('shift'),
+            None, None, None, toggle('numeric'),
+            None, None, None, None,
+            None, None, None, None,
+            ],
+        }),
+    ]
+
+##============================================================================
+
+def _entry(entry, names):
+    """Return the action code of a layout entry."""
+
+    if isinstance(entry, str):
+        code = ord(entry)
+        if not 0 < code < ACTION_FIRST:
+            raise ValueError("not an ASCII char: {!r}".format(entry))
+        return code
+    if isinstance(entry, tuple):
+        kind, name = entry
+        return kind | names.index(name)
+    if not 0 <= entry <= 0xFF:
+        raise ValueError("bad action: {!r}".format(entry))
+    return entry
+
+#-----------------------------------------------------------------------------
+
+def compile_layout(layout, nkeys=NKEYS_DEFAULT):
+    """Compile a layout; return `(table, names)`.
+
+       `table[(layer * NEVENTS + event) * nkeys + key_code]` is the action.
+    """
+
+    names = [ name for name, _ in layout ]
+    if len(names) > LAYERS_MAX:
+        raise ValueError("too many layers")
+    layer_size = NEVENTS * nkeys
+    table = bytearray(len(names) * layer_size)
+
+    for n in range(len(names)):
+        events = {}
+        spec = layout[n][1]
+        for event_name in spec:
+            entries = spec[event_name]
+            if len(entries) != nkeys:
+                raise ValueError("{}.{}: {} entries, expected {}".format(names[n], event_name, len(entries), nkeys))
+            events[EVENTS[event_name]] = entries
+
+        for event in range(NEVENTS):
+            base = n * layer_size + event * nkeys
+            entries = events.get(event)
+            for key_code in range(nkeys):
+                entry = entries[key_code] if entries else None
+                if entry is not None:
+                    table[base + key_code] = _entry(entry, names)
+                elif n:
+                    ## Inherit from the base layer.
+                    table[base + key_code] = table[event * nkeys + key_code]
+
+    ## Momentary layers: releasing the key switches back (to the first layer
+    ## with the momentary key, normally the base layer).
+    for n in range(len(names) - 1, -1, -1):
+        for key_code in range(nkeys):
+            action = table[n * layer_size + EVENT_DOWN * nkeys + key_code]
+            if action & 0xF0 == LAYER_MOMENTARY:
+                target = action & 0x0F
+                ## Held past the long press time it stays on, until released.
+                for event in (EVENT_UP, EVENT_LONG, EVENT_UP_LONG):
+                    table[target * layer_size + event * nkeys + key_code] = NONE if event == EVENT_LONG else LAYER_SET | n
+                    table[n * layer_size + event * nkeys + key_code] = NONE
+
+    return bytes(table), names
+
+##============================================================================
+
+class Keymap():
+    """Resolves key events to actions through a compiled table."""
+
+    def __init__(self, layout=None, nkeys=NKEYS_DEFAULT, table=None, names=None):
+        """Constructor.  Compiles `layout` (default `CHAR_LAYOUT`), or uses a compiled `table`."""
+
+        if table is None:
+            table, names = compile_layout(CHAR_LAYOUT if layout is None else layout, nkeys)
+        self.table = table
+        self.names = names
+        self.nkeys = nkeys
+        self.layer_size = NEVENTS * nkeys
+
+        self.layer = 0
+        self.offset = 0
+        self.oneshot_return = -1
+
+    #-------------------------------------------------------------------------
+
+    def layer_index(self, name):
+        """Return the number of layer `name`."""
+
+        return self.names.index(name)
+
+    #-------------------------------------------------------------------------
+
+    def set_layer(self, layer):
+        """Switch to a layer (by number)."""
+
+        self.layer = layer
+        self.offset = layer * self.layer_size
+        self.oneshot_return = -1
+
+    #-------------------------------------------------------------------------
+
+    def resolve(self, key_code, key_event):
+        """Return the action for a key event (NONE for none/layer actions)."""
+
+        action = self.table[self.offset + key_event * self.nkeys + key_code]
+        if action < LAYER_FIRST:
+            if action and self.oneshot_return >= 0:
+                self.set_layer(self.oneshot_return)
+            return action
+
+        kind = action & 0xF0
+        target = action & 0x0F
+        if kind == LAYER_TOGGLE:
+            self.set_layer(0 if self.layer == target else target)
+        elif kind == LAYER_ONESHOT:
+            layer = self.layer
+            self.set_layer(target)
+            self.oneshot_return = layer
+        else:
+            ## LAYER_SET, LAYER_MOMENTARY (released by a compiled LAYER_SET)
+            self.set_layer(target)
+        return NONE
+
+    #-------------------------------------------------------------------------
+
+    def char(self, key_code, key_event):
+        """Return the char for a key event, or None (e.g. for `CHAR_LAYOUT`)."""
+
+        action = self.resolve(key_code, key_event)
+        return chr(action) if 0 < action < ACTION_FIRST else None
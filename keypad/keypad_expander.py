@@ -0,0 +1,377 @@
+"""
+Keypad on an I2C GPIO expander (MCP23017/PCF8574), using uasyncio module.
+=========================================================================
+
+Scans a keypad wired to an I2C GPIO expander instead of MCU pins, with the
+same key events, keymap and queue as `Keypad_uasyncio` (which it extends).
+
+Notes
+-----
+
+    * The keypad is declared in the board profile (see hwapi/board.py):
+        >>> BOARD.pin('KEYPAD_INT', 'PE2', Pin.IN, Pin.PULL_UP)
+        >>> BOARD.expander_keypad('KEYPAD_EXP', 'I2C2', 0x20, chip='MCP23017', int_pin='KEYPAD_INT')
+
+      and scanned with
+        >>> import keypad_expander
+        >>> keypad = keypad_expander.Keypad_expander(start=True)   ## BOARD.KEYPAD_EXP
+
+    * Matrix wiring: rows on the low pins (MCP23017 port A, PCF8574 P0..),
+      driven low one at a time, columns on the next pins (MCP23017 port B),
+      pulled up, so a pressed key reads low.  Each row is one I2C
+      transaction: the row write and the column read are combined with a
+      repeated start (on the MCP23017 the register pointer moves on from
+      GPIOA to GPIOB after the write).  The MCP23017 rows are push-pull
+      outputs, like the pin keypad's rows.
+
+    * Direct wiring (one key per pin, up to 16 keys on an MCP23017, 8 on a
+      PCF8574): the whole keypad is one burst read per frame.  A matrix can
+      not be read in one burst, as each row has to be driven in turn.
+
+    * The expander's INT output (open drain, active low) skips scanning
+      while idle: once all keys are up, all rows are driven low and the
+      columns read to re-arm the interrupt, and frames are skipped (no I2C
+      traffic) until a key press pulls INT low.  With `ThreadSafeFlag`
+      (uasyncio v3) the scan task waits on a pin IRQ instead of polling INT
+      every frame.  While any key is down every frame is scanned, as long
+      presses are counted in frames.
+
+    * `frames`, `scans` and `chip.transactions` count frames, scanned frames
+      and I2C transactions; `transactions_per_frame()` reports the average.
+
+    * Needs the `machine.I2C` API (`writeto(..., stop=False)`).
+
+"""
+
+##============================================================================
+
+from keypad_uasyncio import Keypad_uasyncio, BOARD, asyncio, sleep_ms
+from keypad_uasyncio import QUEUE_SIZE_DEFAULT, START_DEFAULT, LONG_KEYPRESS_COUNT_DEFAULT
+
+try:
+    ThreadSafeFlag = asyncio.ThreadSafeFlag
+except AttributeError:
+    ThreadSafeFlag = None       ## older uasyncio, CPython: poll INT every frame
+
+##============================================================================
+
+FRAME_MS_DEFAULT = 40
+
+##============================================================================
+
+class MCP23017():
+    """Keypad I/O on an MCP23017 (IOCON.BANK = 0 register addresses)."""
+
+    IODIRA      = 0x00
+    GPINTENA    = 0x04
+    INTCONA     = 0x08
+    IOCON       = 0x0A
+    GPPUA       = 0x0C
+    GPIOA       = 0x12
+    GPIOB       = 0x13
+
+    IOCON_MIRROR    = 0x40      ## INTA/INTB on both pins
+    IOCON_ODR       = 0x04      ## open drain INT
+
+    #-------------------------------------------------------------------------
+
+    def __init__(self, i2c, addr, nrows, ncols, wiring='matrix'):
+        """Constructor.  Configures the expander."""
+
+        self.i2c = i2c
+        self.addr = addr
+        self.transactions = 0
+        self.buf1 = bytearray(1)
+        self.buf2 = bytearray(2)
+
+        if wiring == 'matrix':
+            row_mask = (1 << nrows) - 1
+            self.col_mask = (1 << ncols) - 1
+            ## GPIOA values with one row (or all rows, for idle) driven low.
+            self.row_bufs = [ bytes([ self.GPIOA, 0xFF & ~(1 << row) ]) for row in range(nrows) ]
+            self.idle_buf = bytes([ self.GPIOA, 0xFF & ~row_mask ])
+            iodir = 0xFF00 | (0xFF & ~row_mask)
+            inputs = self.col_mask << 8
+        else:
+            self.key_mask = (1 << (nrows * ncols)) - 1
+            iodir = 0xFFFF
+            inputs = self.key_mask
+
+        self.write_reg16(self.IOCON, (self.IOCON_MIRROR | self.IOCON_ODR) * 0x0101)
+        self.write_reg16(self.IODIRA, iodir)
+        self.write_reg16(self.GPPUA, inputs)
+        self.write_reg16(self.INTCONA, 0)          ## interrupt on any change
+        self.write_reg16(self.GPINTENA, inputs)
+
+    #-------------------------------------------------------------------------
+
+    def write_reg16(self, reg, value):
+        """Write a register pair (port A, port B)."""
+
+        self.i2c.writeto_mem(self.addr, reg, bytes([ value & 0xFF, value >> 8 ]))
+        self.transactions += 1
+
+    #-------------------------------------------------------------------------
+
+    def _write_read(self, buf):
+        self.i2c.writeto(self.addr, buf, False)
+        self.i2c.readfrom_into(self.addr, self.buf1)
+        self.transactions += 1
+        return ~self.buf1[0] & self.col_mask
+
+    #-------------------------------------------------------------------------
+
+    def read_row(self, row):
+        """Drive `row` and return its column levels (bit set = key pressed)."""
+
+        return self._write_read(self.row_bufs[row])
+
+    #-------------------------------------------------------------------------
+
+    def idle(self):
+        """Drive all rows (so any key press changes a column and raises INT); return the column levels."""
+
+        return self._write_read(self.idle_buf)
+
+    #-------------------------------------------------------------------------
+
+    def read_frame(self):
+        """Direct wiring: read all keys in one burst (bit N = key code N pressed)."""
+
+        buf = self.buf2
+        self.i2c.readfrom_mem_into(self.addr, self.GPIOA, buf)
+        self.transactions += 1
+        return ~(buf[0] | (buf[1] << 8)) & self.key_mask
+
+##============================================================================
+
+class PCF8574():
+    """Keypad I/O on a PCF8574 (quasi-bidirectional: a pin written 1 is an input)."""
+
+    def __init__(self, i2c, addr, nrows, ncols, wiring='matrix'):
+        """Constructor."""
+
+        self.i2c = i2c
+        self.addr = addr
+        self.transactions = 0
+        self.nrows = nrows
+        self.buf1 = bytearray(1)
+
+        if wiring == 'matrix':
+            if nrows + ncols > 8:
+                raise ValueError("PCF8574: more than 8 rows + columns")
+            row_mask = (1 << nrows) - 1
+            self.col_mask = (1 << ncols) - 1
+            self.row_bufs = [ bytes([ 0xFF & ~(1 << row) ]) for row in range(nrows) ]
+            self.idle_buf = bytes([ 0xFF & ~row_mask ])
+        else:
+            if nrows * ncols > 8:
+                raise ValueError("PCF8574: more than 8 keys")
+            self.key_mask = (1 << (nrows * ncols)) - 1
+            self.i2c.writeto(self.addr, b'\xff')
+            self.transactions += 1
+
+    #-------------------------------------------------------------------------
+
+    def _write_read(self, buf):
+        self.i2c.writeto(self.addr, buf, False)
+        self.i2c.readfrom_into(self.addr, self.buf1)
+        self.transactions += 1
+        return (~self.buf1[0] >> self.nrows) & self.col_mask
+
+    #-------------------------------------------------------------------------
+
+    def read_row(self, row):
+        """Drive `row` and return its column levels (bit set = key pressed)."""
+
+        return self._write_read(self.row_bufs[row])
+
+    #-------------------------------------------------------------------------
+
+    def idle(self):
+        """Drive all rows; return the column levels."""
+
+        return self._write_read(self.idle_buf)
+
+    #-------------------------------------------------------------------------
+
+    def read_frame(self):
+        """Direct wiring: read all keys in one transaction."""
+
+        self.i2c.readfrom_into(self.addr, self.buf1)
+        self.transactions += 1
+        return ~self.buf1[0] & self.key_mask
+
+##============================================================================
+
+## `ExpanderKeypad.chip` => driver class.
+CHIPS = { 'MCP23017': MCP23017, 'PCF8574': PCF8574 }
+
+##============================================================================
+
+class Keypad_expander(Keypad_uasyncio):
+    """Class to scan a keypad on an I2C GPIO expander and report key presses."""
+
+    def __init__(self, queue_size=QUEUE_SIZE_DEFAULT, start=START_DEFAULT, long_keypress_count=LONG_KEYPRESS_COUNT_DEFAULT, expander=None, keymap=None):
+        """Constructor.  `expander` is a `board.ExpanderKeypad` (default: the board profile's `KEYPAD_EXP`)."""
+
+        self.init(queue_size=queue_size, start=start, long_keypress_count=long_keypress_count, matrix=expander, keymap=keymap)
+
+    #-------------------------------------------------------------------------
+
+    def init_matrix(self, expander):
+        """Set up the expander (see `Keypad_uasyncio.init()`)."""
+
+        if expander is None:
+            expander = BOARD.KEYPAD_EXP
+        self.matrix = expander
+
+        self.nrows = expander.nrows
+        self.ncols = expander.ncols
+        self.direct = expander.wiring == 'direct'
+        self.chip = CHIPS[expander.chip](expander.i2c, expander.addr, self.nrows, self.ncols, expander.wiring)
+
+        self.frame_ms = FRAME_MS_DEFAULT
+        self.frames = 0
+        self.scans = 0
+
+        ## Scan until all keys are up and the INT line is armed.
+        self.active = True
+        self.int_pin = expander.int_pin
+        self.int_flag = None
+        if self.int_pin and ThreadSafeFlag:
+            self.int_flag = ThreadSafeFlag()
+            self.int_pin.irq(handler=self._int_irq, trigger=self.int_pin.IRQ_FALLING)
+
+    #-------------------------------------------------------------------------
+
+    def _int_irq(self, pin):
+        self.int_flag.set()
+
+    #-------------------------------------------------------------------------
+
+    def scan_levels(self, key_code, levels, nkeys, key_chars):
+        """Process the levels of `nkeys` keys from `key_code` (bit 0 = `key_code`)."""
+
+        key_update = self.key_update
+        for key_code in range(key_code, key_code + nkeys):
+            key_event = key_update(key_code, levels & 1)
+            if key_event is not None:
+                self.key_event_process(key_code, key_event, key_chars)
+            levels >>= 1
+
+    #-------------------------------------------------------------------------
+
+    def scan_matrix(self, key_chars):
+        """Read all keys over I2C; return the frame mask (bit N = key code N pressed)."""
+
+        chip = self.chip
+        if self.direct:
+            mask = chip.read_frame()
+            self.scan_levels(0, mask, self.nrows * self.ncols, key_chars)
+            return mask
+
+        ncols = self.ncols
+        mask = 0
+        key_code = 0
+        for row in range(self.nrows):
+            levels = chip.read_row(row)
+            self.scan_levels(key_code, levels, ncols, key_chars)
+            mask |= levels << key_code
+            key_code += ncols
+        return mask
+
+    #-------------------------------------------------------------------------
+
+    def scan_frame(self, key_chars):
+        """Scan one frame, unless idle (all keys up and INT inactive).
+
+           Appends the chars/actions of any key events to `key_chars` and
+           returns the frame mask (0 for a skipped frame).
+        """
+
+        self.frames += 1
+        int_pin = self.int_pin
+        if self.active or not int_pin or not int_pin.value():
+            self.scans += 1
+            mask = self.scan_matrix(key_chars)
+            if int_pin:
+                ## All keys up: arm INT and go idle (unless a key was just pressed).
+                self.active = bool(mask) or (not self.direct and bool(self.chip.idle()))
+        else:
+            mask = 0
+
+        if self.trace:
+            self.trace.record(mask)
+
+        return mask
+
+    #-------------------------------------------------------------------------
+
+    def transactions_per_frame(self):
+        """Return the average number of I2C transactions per frame."""
+
+        return self.chip.transactions / self.frames if self.frames else 0
+
+    #-------------------------------------------------------------------------
+
+    async def scan_coro(self):
+        """A coroutine to scan a frame every `frame_ms` and push key events."""
+
+        key_chars = []
+
+        while self.running:
+            monitor = self.monitor
+            if monitor:
+                monitor.begin(self.monitor_region)
+
+            self.scan_frame(key_chars)
+
+            if monitor:
+                monitor.end(self.monitor_region)
+
+            ## Push key events.
+            for key_char in key_chars:
+                await self.queue.put(key_char)
+            del key_chars[:]
+
+            if self.int_flag and not self.active:
+                ## Idle: wait for a key press to pull INT low.
+                await self.int_flag.wait()
+            else:
+                await sleep_ms(self.frame_ms)
+
+##============================================================================
+
+def main_test():
+    """Main test function."""
+
+    print("main_test(): start")
+
+    keypad = Keypad_expander(queue_size=4, start=True)
+
+    ## Sleep between frames and while idle (if the tickless_idle module is
+    ## installed); the INT pin IRQ wakes the MCU.  Only saves power on ports
+    ## where ticks_ms() counts in lightsleep (not stm32, see tickless_idle).
+    try:
+        import tickless_idle
+        tickless_idle.install()
+    except ImportError:
+        pass
+
+    async def watcher():
+        while True:
+            key = await keypad.get_key()
+            print("keypad_watcher: got key: {!r} ({:.2f} I2C transactions/frame)".format(key, keypad.transactions_per_frame()))
+
+    loop = asyncio.get_event_loop()
+    loop.create_task(keypad.scan_coro())
+    loop.create_task(watcher())
+    loop.run_forever()
+
+##============================================================================
+
+run = main_test
+
+if __name__ == '__main__':
+    main_test()
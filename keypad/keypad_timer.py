@@ -37,13 +37,25 @@ To Do
 
 #!============================================================================
 
-import micropython
+try:
+    import micropython
+    from micropython import const
+except ImportError:
+    ## host simulation (CPython)
+    micropython = None
+    def const(x):
+        return x
 
 try:
     from hwconfig import Pin
 except ImportError :
     from pyb import Pin
 
+try:
+    from hwconfig import BOARD
+except ImportError :
+    BOARD = None        #! old style hwconfig, pins hard-coded in init()
+
 try:
     from hwconfig import Timer
 except ImportError :
@@ -86,19 +98,24 @@ class Keypad_Timer () :
         #! Initialise all keys to the UP state.
         self.keys = [ { 'char' : key, 'state' : self.KEY_UP } for key in keys ]
 
-        #! Pin names for rows and columns.
-        self.rows = [ 'PD1', 'PD3', 'PD5', 'PD7' ]
-        self.cols = [ 'PD9', 'PD11', 'PD13', 'PD15' ]
-
-        #! Pin names for rows and columns.
-        self.rows = [ 'PD1', 'PD3', 'PD5', 'PD7' ]
-        self.cols = [ 'PD9', 'PD11', 'PD13', 'PD15' ]
-
-        #! Initialise row pins as outputs.
-        self.row_pins = [ Pin(pin_name, mode=Pin.OUT) for pin_name in self.rows ]
-
-        #! Initialise column pins as inputs.
-        self.col_pins = [ Pin(pin_name, mode=Pin.IN, pull=Pin.PULL_DOWN) for pin_name in self.cols ]
+        #! Keypad matrix from the board profile (constructed on first use), if any.
+        self.matrix = BOARD.KEYPAD if BOARD is not None and 'KEYPAD' in BOARD else None
+        if self.matrix :
+            self.rows = self.matrix.rows
+            self.cols = self.matrix.cols
+            #! The board's pins, but a list per keypad (callers may patch it).
+            self.row_pins = list(self.matrix.row_pins)
+            self.col_pins = list(self.matrix.col_pins)
+        else :
+            #! Pin names for rows and columns.
+            self.rows = [ 'PD1', 'PD3', 'PD5', 'PD7' ]
+            self.cols = [ 'PD9', 'PD11', 'PD13', 'PD15' ]
+
+            #! Initialise row pins as outputs.
+            self.row_pins = [ Pin(pin_name, mode=Pin.OUT) for pin_name in self.rows ]
+
+            #! Initialise column pins as inputs.
+            self.col_pins = [ Pin(pin_name, mode=Pin.IN, pull=Pin.PULL_DOWN) for pin_name in self.cols ]
 
         self.timer = Timer( 5, freq=100 )
         self.timer.callback( None )
@@ -0,0 +1,225 @@
+"""
+Keypad_Timer with compiled (viper/native) timer callback hot paths
+==================================================================
+
+Notes
+-----
+
+    * `Keypad_Timer_Fast` is a drop-in replacement for `Keypad_Timer`.  The
+      timer callback reads all columns into one integer bitmask and the
+      column-scan and row-advance logic works on a `bytearray` of key states
+      instead of a dict per key, so there are no method calls per key, no
+      `len()`, no dict lookups and no `%` in the interrupt.
+
+    * The hot path functions come from (best first):
+        1. `keypad_timer_viper`  -- `@micropython.viper`
+        2. `keypad_timer_native` -- `@micropython.native`
+        3. this module           -- plain Python (bytecode)
+      A variant is skipped if it can not be imported (e.g. the port was built
+      without that emitter, or on CPython).  `EMITTER` is the one chosen.
+
+    * With the viper variant on an STM32 (`stm` module available) and all
+      column pins on the same GPIO port, the columns are read straight from
+      the port input data register.
+
+    * To run type:
+        >>> import keypad_timer_fast
+        >>> keypad_timer_fast.run()
+
+    * See `bench/bench_keypad_isr.py` for the time per tick of each variant.
+
+"""
+
+#!============================================================================
+
+try:
+    import micropython
+except ImportError:
+    micropython = None      #! host simulation (CPython)
+
+try:
+    from hwconfig import delay
+except ImportError :
+    from pyb import delay
+
+try:
+    import stm
+except ImportError:
+    stm = None
+
+from keypad_timer import Keypad_Timer
+
+#!============================================================================
+
+def scan_cols ( states, key_code, ncols, col_mask ) :
+    """Update the key states of one row from a column bitmask.
+
+       Returns the key code of the last key which went down, or -1.
+    """
+
+    pressed = -1
+    for col in range( ncols ) :
+        if ( col_mask >> col ) & 1 :
+            if states[ key_code ] == 0 :
+                states[ key_code ] = 1
+                pressed = key_code
+        else :
+            states[ key_code ] = 0
+        key_code += 1
+    return pressed
+
+#-----------------------------------------------------------------------------
+
+def next_row ( row, nrows ) :
+    """Return the next row to scan."""
+
+    row += 1
+    if row >= nrows :
+        row = 0
+    return row
+
+#!============================================================================
+
+#! Available hot path variants, name => (scan_cols, next_row, read_cols_port)
+EMITTERS = { 'python' : ( scan_cols, next_row, None ) }
+EMITTER = 'python'
+
+try :
+    import keypad_timer_native
+    EMITTERS[ 'native' ] = ( keypad_timer_native.scan_cols, keypad_timer_native.next_row, None )
+    EMITTER = 'native'
+except ( ImportError, SyntaxError ) :
+    pass
+
+try :
+    import keypad_timer_viper
+    EMITTERS[ 'viper' ] = ( keypad_timer_viper.scan_cols, keypad_timer_viper.next_row, keypad_timer_viper.read_cols_port )
+    EMITTER = 'viper'
+except ( ImportError, SyntaxError ) :
+    pass
+
+#!============================================================================
+
+class Keypad_Timer_Fast ( Keypad_Timer ) :
+    """
+    Keypad_Timer using compiled hot paths in the timer callback.
+    """
+
+    def __init__ ( self, emitter=None ) :
+        """Constructor.  `emitter` selects a variant from `EMITTERS` (default: best available)."""
+
+        self.emitter = emitter or EMITTER
+        Keypad_Timer.__init__( self )
+
+    #-------------------------------------------------------------------------
+
+    def init ( self ) :
+        """Initialise/Reinitialise the instance."""
+
+        Keypad_Timer.init( self )
+
+        self._scan_cols, self._next_row, read_cols_port = EMITTERS[ self.emitter ]
+
+        self.nrows = len( self.row_pins )
+        self.ncols = len( self.col_pins )
+
+        #! Key states (KEY_UP/KEY_DOWN) and chars, indexed by key code.
+        self.states = bytearray( len( self.keys ) )
+        self.chars = [ key[ 'char' ] for key in self.keys ]
+
+        #! Optional `keypad_trace.TraceRecorder`, fed the column levels of every frame.
+        self.trace = None
+        self._frame_mask = 0
+
+        #! Read columns from the GPIO port register if possible.
+        self._read_cols_port = None
+        if read_cols_port and stm :
+            if self.matrix :
+                #! Precomputed by the board profile.
+                port = self.matrix.col_map.port
+                col_bits = self.matrix.col_map.bits
+            else :
+                ports = [ pin.port() for pin in self.col_pins ]
+                port = ports[ 0 ] if ports.count( ports[ 0 ] ) == len( ports ) else -1
+                col_bits = bytearray( [ pin.pin() for pin in self.col_pins ] )
+            if port >= 0 :
+                gpio = getattr( stm, 'GPIO' + 'ABCDEFGHIJK'[ port ] )
+                self._idr_addr = gpio + stm.GPIO_IDR
+                self._col_bits = col_bits
+                self._read_cols_port = read_cols_port
+
+    #-------------------------------------------------------------------------
+
+    def read_cols ( self ) :
+        """Return the column pin levels as a bitmask."""
+
+        if self._read_cols_port :
+            return self._read_cols_port( self._idr_addr, self._col_bits, self.ncols )
+
+        mask = 0
+        col_pins = self.col_pins
+        for col in range( self.ncols ) :
+            if col_pins[ col ].value() :
+                mask |= 1 << col
+        return mask
+
+    #-------------------------------------------------------------------------
+
+    def timer_callback ( self, timer ) :
+        """
+        Timer interrupt callback to scan next keypad row/column.
+        NOTE: This is a true interrupt and no memory can be allocated !!
+        """
+
+        row = self.scan_row
+        mask = self.read_cols()
+
+        key_code = self._scan_cols( self.states, row * self.ncols, self.ncols, mask )
+        if key_code >= 0 :
+            self.key_code = key_code
+            self.key_char = self.chars[ key_code ]
+
+        #! Deassert row, assert next row.
+        self.row_pins[ row ].value( 0 )
+        next_row = self._next_row( row, self.nrows )
+        self.row_pins[ next_row ].value( 1 )
+        self.scan_row = next_row
+
+        #! Record the frame once the last row has been read.
+        if self.trace :
+            self._frame_mask |= mask << ( row * self.ncols )
+            if next_row == 0 :
+                self.trace.record( self._frame_mask )
+                self._frame_mask = 0
+
+#!============================================================================
+
+def main_test () :
+    """Main test function."""
+
+    print( "main_test(): start, emitter =", EMITTER )
+
+    micropython.alloc_emergency_exception_buf( 100 )
+
+    keypad = Keypad_Timer_Fast()
+    keypad.start()
+
+    try :
+        while True :
+            key = keypad.get_key()
+            if key :
+                print( "keypad: got key:", key )
+            delay( 1 )
+    except Exception as exc :
+        print( "Exception:", str( exc ) )
+
+    keypad.stop()
+
+    print( "main_test(): end" )
+
+#!============================================================================
+
+run = main_test
+
+if __name__ == '__main__' :
+    main_test()
@@ -0,0 +1,41 @@
+"""
+Native compiled hot paths for `keypad_timer_fast`
+=================================================
+
+Same functions as `keypad_timer_viper`, but using the native emitter (no
+raw pointer access, so the GPIO port read is not available).  Kept in a
+module of its own so a port without the native emitter fails at import.
+"""
+
+import micropython
+
+##============================================================================
+
+@micropython.native
+def scan_cols(states, key_code, ncols, col_mask):
+    """Update the key states of one row from a column bitmask.
+
+       Returns the key code of the last key which went down, or -1.
+    """
+
+    pressed = -1
+    for col in range(ncols):
+        if (col_mask >> col) & 1:
+            if states[key_code] == 0:
+                states[key_code] = 1
+                pressed = key_code
+        else:
+            states[key_code] = 0
+        key_code += 1
+    return pressed
+
+#-----------------------------------------------------------------------------
+
+@micropython.native
+def next_row(row, nrows):
+    """Return the next row to scan."""
+
+    row += 1
+    if row >= nrows:
+        row = 0
+    return row
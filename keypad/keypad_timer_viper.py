@@ -0,0 +1,63 @@
+"""
+Viper compiled hot paths for `keypad_timer_fast`
+================================================
+
+Kept in a module of its own because the `@micropython.viper` decorator is
+a compile time error on ports built without the viper emitter, which
+`keypad_timer_fast` catches so it can fall back to another variant.
+
+All functions work on raw integer state and do not allocate, so they can
+be called from a hard IRQ.
+"""
+
+import micropython
+
+##============================================================================
+
+@micropython.viper
+def scan_cols(states: ptr8, key_code: int, ncols: int, col_mask: int) -> int:
+    """Update the key states of one row from a column bitmask.
+
+       Returns the key code of the last key which went down, or -1.
+    """
+
+    pressed = -1
+    col = 0
+    while col < ncols:
+        if (col_mask >> col) & 1:
+            if int(states[key_code]) == 0:
+                states[key_code] = 1
+                pressed = key_code
+        else:
+            states[key_code] = 0
+        key_code += 1
+        col += 1
+    return pressed
+
+#-----------------------------------------------------------------------------
+
+@micropython.viper
+def next_row(row: int, nrows: int) -> int:
+    """Return the next row to scan."""
+
+    row += 1
+    if row >= nrows:
+        row = 0
+    return row
+
+#-----------------------------------------------------------------------------
+
+@micropython.viper
+def read_cols_port(idr_addr: int, bits: ptr8, ncols: int) -> int:
+    """Read a GPIO input data register and gather the column bits into a mask.
+
+       `bits` holds the port bit number of each column pin.
+    """
+
+    idr = int(ptr32(idr_addr)[0])
+    mask = 0
+    col = 0
+    while col < ncols:
+        mask |= ((idr >> int(bits[col])) & 1) << col
+        col += 1
+    return mask
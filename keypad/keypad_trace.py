@@ -0,0 +1,355 @@
+"""
+Keypad trace recording and replay
+=================================
+
+Records the raw column levels of every keypad scan frame, with timestamps,
+so field problems (missed/double keys) can be replayed and soak tested
+without someone pressing keys.
+
+Notes
+-----
+
+    * A frame mask holds the column level of every key of one scan frame,
+      bit N being key code N (row * ncols + col).
+
+    * `TraceRecorder` keeps fixed size records in a preallocated `bytearray`
+      ring (oldest records are overwritten when full).  Recording does not
+      allocate, so it can be fed from the timer IRQ scanner.  Each record is:
+
+        uint16  dt_ms    -- ms from the previous frame (saturates at 65535)
+        uint16  repeat   -- number of identical frames, each dt_ms apart
+        bytes   mask     -- frame mask, little endian, (nkeys + 7) // 8 bytes
+
+      Runs of identical frames at a constant rate (an idle keypad) share one
+      record, so an idle keypad costs a few bytes per 65535 frames.
+
+    * Trace files are an 8 byte header (`MAGIC`, version, nrows, ncols,
+      record size) followed by the records, oldest first.
+
+    * To record (any scanner with a `trace` attribute):
+        >>> keypad.trace = TraceRecorder(nrows=4, ncols=4)
+        ...
+        >>> keypad.trace.save('keys.trc')
+
+    * To replay through the simulated pins (`hwconfig_SIM`):
+        >>> replay = TraceReplay(Trace.load('keys.trc'), keypad, hwconfig.MATRIX)
+        >>> replay.run(on_key=print)                    ## as fast as possible
+        >>> await replay.run_realtime(on_key=print)     ## at recorded speed
+
+      Replay is bit-exact: every scanner frame sees exactly the recorded
+      column levels, and recording during a replay reproduces the trace
+      byte for byte (the recorded timestamps are passed through).
+
+    * See `bench/bench_keypad_trace.py` for the replay rate.
+
+"""
+
+##============================================================================
+
+import struct
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+##============================================================================
+
+MAGIC = b'KTRC'
+VERSION = 1
+HEADER_FORMAT = '<4sBBBB'
+HEADER_SIZE = 8
+
+DT_MAX = 0xFFFF
+REPEAT_MAX = 0xFFFF
+
+RING_SIZE_DEFAULT = 4096
+
+##============================================================================
+
+class TraceRecorder():
+    """Records frame masks into a ring buffer."""
+
+    def __init__(self, nrows=4, ncols=4, size=RING_SIZE_DEFAULT, clock=ticks_ms):
+        """Constructor.  `size` is the ring buffer size in bytes, `clock()` returns ms."""
+
+        self.clock = clock
+        self.nrows = nrows
+        self.ncols = ncols
+        self.mask_bytes = (nrows * ncols + 7) // 8
+        self.record_size = 4 + self.mask_bytes
+        self.capacity = size // self.record_size
+        self.buf = bytearray(self.capacity * self.record_size)
+        self.clear()
+
+    #-------------------------------------------------------------------------
+
+    def clear(self):
+        """Discard all records."""
+
+        self.index = 0          ## next record slot
+        self.count = 0          ## records in the ring
+        self.frames = 0         ## frames recorded
+        self.last = -1          ## slot of the last record
+        self.last_mask = -1
+        self.last_dt = -1
+        self.last_t = None
+
+    #-------------------------------------------------------------------------
+
+    def record(self, mask, t_ms=None):
+        """Record a frame mask, timestamped now (or at `t_ms`)."""
+
+        if t_ms is None:
+            t_ms = self.clock()
+        dt = 0 if self.last_t is None else ticks_diff(t_ms, self.last_t)
+        if dt > DT_MAX:
+            dt = DT_MAX
+        self.last_t = t_ms
+        self.frames += 1
+
+        buf = self.buf
+        if self.last >= 0 and mask == self.last_mask and dt == self.last_dt:
+            offset = self.last * self.record_size
+            repeat = buf[offset + 2] | (buf[offset + 3] << 8)
+            if repeat < REPEAT_MAX:
+                repeat += 1
+                buf[offset + 2] = repeat & 0xFF
+                buf[offset + 3] = repeat >> 8
+                return
+
+        offset = self.index * self.record_size
+        buf[offset] = dt & 0xFF
+        buf[offset + 1] = dt >> 8
+        buf[offset + 2] = 1
+        buf[offset + 3] = 0
+        m = mask
+        for i in range(offset + 4, offset + self.record_size):
+            buf[i] = m & 0xFF
+            m >>= 8
+
+        self.last = self.index
+        self.last_mask = mask
+        self.last_dt = dt
+        self.index += 1
+        if self.index >= self.capacity:
+            self.index = 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    #-------------------------------------------------------------------------
+
+    def records(self):
+        """Return the records as `bytes`, oldest first."""
+
+        size = self.record_size
+        start = (self.index - self.count) % self.capacity
+        end = start + self.count
+        if end <= self.capacity:
+            return bytes(self.buf[start * size:end * size])
+        return bytes(self.buf[start * size:]) + bytes(self.buf[:(end - self.capacity) * size])
+
+    #-------------------------------------------------------------------------
+
+    def trace(self):
+        """Return the recording as a `Trace`."""
+
+        return Trace(self.nrows, self.ncols, self.records())
+
+    #-------------------------------------------------------------------------
+
+    def save(self, path):
+        """Save the recording to a trace file."""
+
+        self.trace().save(path)
+
+##============================================================================
+
+class Trace():
+    """A recorded trace (header info and records)."""
+
+    def __init__(self, nrows, ncols, records):
+        """Constructor."""
+
+        self.nrows = nrows
+        self.ncols = ncols
+        self.mask_bytes = (nrows * ncols + 7) // 8
+        self.record_size = 4 + self.mask_bytes
+        self.records = records
+
+    #-------------------------------------------------------------------------
+
+    @classmethod
+    def load(cls, path):
+        """Load a trace file."""
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, nrows, ncols, record_size = struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a keypad trace file")
+        trace = cls(nrows, ncols, data[HEADER_SIZE:])
+        if record_size != trace.record_size:
+            raise ValueError("bad trace record size")
+        return trace
+
+    #-------------------------------------------------------------------------
+
+    def save(self, path):
+        """Save to a trace file."""
+
+        with open(path, 'wb') as f:
+            f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, self.nrows, self.ncols, self.record_size))
+            f.write(self.records)
+
+    #-------------------------------------------------------------------------
+
+    def runs(self):
+        """Yield `(dt_ms, repeat, mask)` for each record."""
+
+        data = self.records
+        size = self.record_size
+        for offset in range(0, len(data) - size + 1, size):
+            mask = 0
+            for i in range(offset + size - 1, offset + 3, -1):
+                mask = (mask << 8) | data[i]
+            yield data[offset] | (data[offset + 1] << 8), data[offset + 2] | (data[offset + 3] << 8), mask
+
+    #-------------------------------------------------------------------------
+
+    def frames(self):
+        """Yield `(t_ms, mask)` for each frame, `t_ms` relative to the first frame."""
+
+        t = 0
+        first = True
+        for dt, repeat, mask in self.runs():
+            for _ in range(repeat):
+                if not first:
+                    t += dt
+                first = False
+                yield t, mask
+
+    #-------------------------------------------------------------------------
+
+    def frame_count(self):
+        """Return the number of frames in the trace."""
+
+        return sum(repeat for _, repeat, _ in self.runs())
+
+##============================================================================
+
+class TraceReplay():
+    """Replays a trace through a simulated key matrix into a keypad scanner.
+
+       The keypad needs a `scan_frame(key_chars)` method (`Keypad_uasyncio`),
+       or a timer callback and `get_key()` (`Keypad_Timer_Fast`, one tick per
+       row).  `matrix` is a `hwconfig_SIM.SimMatrix`.
+    """
+
+    def __init__(self, trace, keypad, matrix):
+        """Constructor."""
+
+        self.trace = trace
+        self.keypad = keypad
+        self.matrix = matrix
+        self.frames = 0
+        self.keys = 0
+
+    #-------------------------------------------------------------------------
+
+    def _frame_fun(self):
+        """Return a function which scans one frame and appends key chars to a list."""
+
+        keypad = self.keypad
+        if hasattr(keypad, 'scan_frame'):
+            return keypad.scan_frame
+
+        nrows = len(keypad.row_pins)
+        callback = keypad.timer_callback
+        timer = keypad.timer
+
+        def scan_frame(key_chars):
+            for _ in range(nrows):
+                callback(timer)
+                key = keypad.get_key()
+                if key:
+                    key_chars.append(key)
+
+        return scan_frame
+
+    #-------------------------------------------------------------------------
+
+    def run(self, on_key=None):
+        """Replay as fast as possible.  Calls `on_key(frame, char)` for each key event."""
+
+        scan_frame = self._frame_fun()
+        set_frame_mask = self.matrix.set_frame_mask
+        key_chars = []
+        frame = 0
+
+        ## Recording during a replay keeps the recorded timestamps.
+        recorder = getattr(self.keypad, 'trace', None)
+        if recorder:
+            clock = recorder.clock
+            recorder.clock = self._clock
+        self.t = 0
+
+        for dt, repeat, mask in self.trace.runs():
+            set_frame_mask(mask)
+            for _ in range(repeat):
+                if frame:
+                    self.t += dt
+                scan_frame(key_chars)
+                if key_chars:
+                    self.keys += len(key_chars)
+                    if on_key:
+                        for key_char in key_chars:
+                            on_key(frame, key_char)
+                    del key_chars[:]
+                frame += 1
+
+        if recorder:
+            recorder.clock = clock
+
+        self.frames = frame
+        return frame
+
+    #-------------------------------------------------------------------------
+
+    def _clock(self):
+        return self.t
+
+    #-------------------------------------------------------------------------
+
+    async def run_realtime(self, on_key=None, sleep_ms=None):
+        """Replay at the recorded speed (a coroutine)."""
+
+        if sleep_ms is None:
+            from keypad_uasyncio import sleep_ms
+
+        scan_frame = self._frame_fun()
+        key_chars = []
+        frame = 0
+        start = ticks_ms()
+
+        for t, mask in self.trace.frames():
+            delay = t - ticks_diff(ticks_ms(), start)
+            if delay > 0:
+                await sleep_ms(delay)
+            self.matrix.set_frame_mask(mask)
+            scan_frame(key_chars)
+            for key_char in key_chars:
+                self.keys += 1
+                if on_key:
+                    on_key(frame, key_char)
+            del key_chars[:]
+            frame += 1
+
+        self.frames = frame
+        return frame
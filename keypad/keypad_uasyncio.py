@@ -13,6 +13,17 @@ Notes
         >>> import keypad_uasyncio as k
         >>> k.run()
 
+    * Key events are resolved to chars/actions through a compiled keymap
+      (see keymap.py).  By default the queue gets the original keypad chars;
+      with a `keymap` given it gets action codes, e.g.
+        >>> from keymap import Keymap, LCD_LAYOUT
+        >>> keypad = Keypad_uasyncio(keymap=Keymap(LCD_LAYOUT))
+
+    * Depends on the following modules in this repo (installed in the same
+      directory; the keymap is imported unconditionally, so copy it along
+      when updating a device with the old file set)
+        - keymap
+
     * Need to have the following modules installed (via upip or manually)
         - micropython-uasyncio
         - micropython-uasyncio.queues
@@ -41,15 +52,36 @@ To Do
 
 ##============================================================================
 
-import micropython
+try:
+    import micropython
+except ImportError:
+    micropython = None      ## host simulation (CPython)
 
 try:
     from hwconfig import Pin
 except ImportError:
     from pyb import Pin
 
-import uasyncio as asyncio
-from uasyncio.queues import Queue
+try:
+    from hwconfig import BOARD
+except ImportError:
+    BOARD = None        ## old style hwconfig, pins hard-coded in init()
+
+from keymap import Keymap
+
+try:
+    import uasyncio as asyncio
+    from uasyncio.queues import Queue
+except ImportError:
+    import asyncio
+    from asyncio import Queue
+
+try:
+    sleep_ms = asyncio.sleep_ms
+except AttributeError:
+    ## CPython asyncio has no sleep_ms().
+    def sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
 
 ##============================================================================
 
@@ -70,15 +102,23 @@ class Keypad_uasyncio():
 
     #-------------------------------------------------------------------------
 
-    def __init__(self, queue_size=QUEUE_SIZE_DEFAULT, start=START_DEFAULT, long_keypress_count=LONG_KEYPRESS_COUNT_DEFAULT):
+    def __init__(self, queue_size=QUEUE_SIZE_DEFAULT, start=START_DEFAULT, long_keypress_count=LONG_KEYPRESS_COUNT_DEFAULT, matrix=None, keymap=None):
         """Constructor."""
 
-        self.init(queue_size=queue_size, start=start, long_keypress_count=long_keypress_count)
+        self.init(queue_size=queue_size, start=start, long_keypress_count=long_keypress_count, matrix=matrix, keymap=keymap)
 
     #-------------------------------------------------------------------------
 
-    def init(self, queue_size=QUEUE_SIZE_DEFAULT, start=START_DEFAULT, long_keypress_count=LONG_KEYPRESS_COUNT_DEFAULT):
-        """Initialise/Reinitialise the instance."""
+    def init(self, queue_size=QUEUE_SIZE_DEFAULT, start=START_DEFAULT, long_keypress_count=LONG_KEYPRESS_COUNT_DEFAULT, matrix=None, keymap=None):
+        """Initialise/Reinitialise the instance.
+
+           `matrix` is a `board.KeypadMatrix` (default: the board profile's
+           `KEYPAD`, constructed on first use).
+
+           `keymap` is a `keymap.Keymap`; key events are then pushed to the
+           queue as its action codes.  By default the original keypad chars
+           (`keymap.CHAR_LAYOUT`) are pushed, as chars.
+        """
 
         ## Create the queue to push key events to.
         self.queue = Queue(maxsize=queue_size)
@@ -86,39 +126,71 @@ class Keypad_uasyncio():
         self.running = start
         self.long_keypress_count = long_keypress_count
 
-        ## The chars on the keypad
-        keys = [
-            '1', '2', '3', 'A',
-            '4', '5', '6', 'B',
-            '7', '8', '9', 'C',
-            '*', '0', '#', 'D',
-            ]
-
-        ## The chars to display/return when the key is pressed down for a long time.
-        self.chars_long = [
-            'm', 'i', 'e', 'a',
-            'n', 'j', 'f', 'b',
-            'o', 'k', 'g', 'c',
-            'p', 'l', 'h', 'd',
-            ]
+        ## Key event => action lookup (a char, app action or layer switch).
+        self.actions = keymap is not None
+        self.keymap = keymap if keymap is not None else Keymap()
 
         ## Initialise all keys to the UP state.
-        self.keys = [ { 'char':key, 'state':self.KEY_UP, 'down_count':0 } for key in keys ]
+        self.keys = [ { 'state':self.KEY_UP, 'down_count':0 } for _ in range(self.keymap.nkeys) ]
+
+        self.init_matrix(matrix)
 
-        ## Pin names for rows and columns.
-        self.rows = [ 'PD1', 'PD3', 'PD5', 'PD7' ]
-        self.cols = [ 'PD9', 'PD11', 'PD13', 'PD15' ]
+        ## Functions called with (key_code, key_event) for every key event (see `add_event_hook()`).
+        self.event_hooks = []
 
-        ## Initialise row pins as outputs.
-        self.row_pins = [ Pin(pin_name, mode=Pin.OUT) for pin_name in self.rows ]
+        ## Optional `keypad_trace.TraceRecorder`, fed the column levels of every frame.
+        self.trace = None
 
-        ## Initialise column pins as inputs.
-        self.col_pins = [ Pin(pin_name, mode=Pin.IN, pull=Pin.PULL_DOWN) for pin_name in self.cols ]
+        ## Optional heap monitor (see `set_monitor()`).
+        self.monitor = None
+        self.monitor_region = 0
+
+    #-------------------------------------------------------------------------
+
+    def init_matrix(self, matrix):
+        """Set up the row/column pins (overridden by other scan backends)."""
+
+        if matrix is None and BOARD is not None and 'KEYPAD' in BOARD:
+            matrix = BOARD.KEYPAD
+        self.matrix = matrix
+
+        if matrix:
+            self.rows = matrix.rows
+            self.cols = matrix.cols
+            ## The board's pins, but a list per keypad (callers may patch it).
+            self.row_pins = list(matrix.row_pins)
+            self.col_pins = list(matrix.col_pins)
+        else:
+            ## Pin names for rows and columns.
+            self.rows = [ 'PD1', 'PD3', 'PD5', 'PD7' ]
+            self.cols = [ 'PD9', 'PD11', 'PD13', 'PD15' ]
+
+            ## Initialise row pins as outputs.
+            self.row_pins = [ Pin(pin_name, mode=Pin.OUT) for pin_name in self.rows ]
+
+            ## Initialise column pins as inputs.
+            self.col_pins = [ Pin(pin_name, mode=Pin.IN, pull=Pin.PULL_DOWN) for pin_name in self.cols ]
 
         self.row_scan_delay_ms = 40 // len(self.rows)
 
     #-------------------------------------------------------------------------
 
+    def add_event_hook(self, hook):
+        """Call `hook(key_code, key_event)` for every key event (must not block)."""
+
+        self.event_hooks.append(hook)
+
+    #-------------------------------------------------------------------------
+
+    def set_monitor(self, monitor):
+        """Attribute heap allocations of the scan (not its sleeps) to a `HeapMonitor` region."""
+
+        self.monitor = monitor
+        if monitor:
+            self.monitor_region = monitor.region('scan_frame')
+
+    #-------------------------------------------------------------------------
+
     def start(self):
         """Start keypad scanning."""
 
@@ -144,10 +216,17 @@ class Keypad_uasyncio():
     def key_process(self, key_code, col_pin):
         """Process a key press or release."""
 
+        return self.key_update(key_code, col_pin.value())
+
+    #-------------------------------------------------------------------------
+
+    def key_update(self, key_code, level):
+        """Process a key press or release, given the column pin level."""
+
         key = self.keys[key_code]
         key_event = None
 
-        if col_pin.value():
+        if level:
             ## key pressed down
             if key['state'] == self.KEY_UP:
                 ## just pressed (up => down)
@@ -171,35 +250,104 @@ class Keypad_uasyncio():
 
     #-------------------------------------------------------------------------
 
+    def key_event_process(self, key_code, key_event, key_chars):
+        """Run the event hooks for a key event and append its action (if any) to `key_chars`."""
+
+        for hook in self.event_hooks:
+            hook(key_code, key_event)
+        action = self.keymap.resolve(key_code, key_event)
+        if action:
+            key_chars.append(action if self.actions else chr(action))
+
+    #-------------------------------------------------------------------------
+
+    def scan_row(self, key_code, key_chars):
+        """Check the columns of the asserted row for key events.
+
+           `key_code` is the key code of the first column of the row.  The
+           chars (or action codes, see `init()`) of any key events are
+           appended to `key_chars`.  Returns the
+           column levels as a bitmask, bit N being key code N.
+        """
+
+        mask = 0
+        for col_pin in self.col_pins:
+            ## Process pin state.
+            level = col_pin.value()
+            if level:
+                mask |= 1 << key_code
+            key_event = self.key_update(key_code, level)
+            ## Process key event.
+            if key_event is not None:
+                self.key_event_process(key_code, key_event, key_chars)
+
+            key_code += 1
+
+        return mask
+
+    #-------------------------------------------------------------------------
+
+    def scan_frame(self, key_chars):
+        """Scan all rows without delays (e.g. for trace replay).
+
+           Appends the chars of any key events to `key_chars` and returns the
+           frame mask (see `scan_row()`).
+        """
+
+        ncols = len(self.col_pins)
+        mask = 0
+        key_code = 0
+        for row_pin in self.row_pins:
+            row_pin.value(1)
+            mask |= self.scan_row(key_code, key_chars)
+            row_pin.value(0)
+            key_code += ncols
+
+        if self.trace:
+            self.trace.record(mask)
+
+        return mask
+
+    #-------------------------------------------------------------------------
+
     async def scan_coro(self):
         """A coroutine to scan each row and check column for key events."""
 
+        ncols = len(self.col_pins)
+        key_chars = []
+
         while self.running:
             key_code = 0
-            for row, row_pin in enumerate(self.row_pins):
+            frame_mask = 0
+            for row_pin in self.row_pins:
                 ## Assert row.
                 row_pin.value(1)
 
                 ## Delay between processing each row.
-                await asyncio.sleep_ms(self.row_scan_delay_ms)
+                await sleep_ms(self.row_scan_delay_ms)
+
+                monitor = self.monitor
+                if monitor:
+                    monitor.begin(self.monitor_region)
 
                 ## Check for key events for each column of current row.
-                for col, col_pin in enumerate(self.col_pins):
-                    ## Process pin state.
-                    key_event = self.key_process(key_code=key_code, col_pin=col_pin)
-                    ## Process key event.
-                    if key_event == self.KEY_UP:
-                        key_char = self.keys[key_code]['char']
-                        await self.queue.put(key_char)
-                    elif key_event == self.KEY_DOWN_LONG:
-                        key_char = self.chars_long[key_code]
-                        await self.queue.put(key_char)
-
-                    key_code += 1
+                frame_mask |= self.scan_row(key_code, key_chars)
+                key_code += ncols
 
                 ## Deassert row.
                 row_pin.value(0)
 
+                if monitor:
+                    monitor.end(self.monitor_region)
+
+                ## Push key events.
+                for key_char in key_chars:
+                    await self.queue.put(key_char)
+                del key_chars[:]
+
+            if self.trace:
+                self.trace.record(frame_mask)
+
 ##============================================================================
 
 async def keypad_watcher(keypad):
@@ -229,6 +377,17 @@ def main_test():
     loop.create_task(keypad.scan_coro())
     loop.create_task(keypad_watcher(keypad=keypad))
 
+    ## Monitor the heap (if the heap_monitor module is installed).  Imported
+    ## here, so apps which don't use it don't pay for it at start up.
+    try:
+        from heap_monitor import HeapMonitor
+    except ImportError:
+        HeapMonitor = None
+    if HeapMonitor:
+        monitor = HeapMonitor()
+        keypad.set_monitor(monitor)
+        loop.create_task(monitor.run(report_every=10))
+
     ## Start running the coroutines
     loop.run_forever()
 
@@ -17,9 +17,24 @@ Notes
 
     * Depends of the following modules in this repo (note: assumes installed in same directory)
         - keypad_uasyncio
+        - keymap (imported by keypad_uasyncio)
         - lcd/python_lcd_dhylands_fork/pyb_i2c_lcd
         - lcd/python_lcd_dhylands_fork/lcd
 
+    * Keys are mapped to chars and editing actions by `keymap.LCD_LAYOUT`
+      ('*' backspace, '#' enter, long '*' erase line, long 'D' erase
+      screen), with long 'A'/'B'/'C' toggling the shift, numeric and
+      function (cursor movement) layers.  This changes the original
+      mapping, where long 'A'/'B'/'C' typed 'a'/'b'/'c': those chars are
+      now 'A'/'B'/'C' in the shift layer (long 'A', then 'A' gives 'a').
+      `keymap.CHAR_LAYOUT` keeps the original chars.
+
+    * Only the keypad and uasyncio are imported at module level.  The LCD
+      driver and heap monitor are imported by `main()` when (and if) they
+      are used, and the LCD usually comes from the board profile.  For the
+      fastest start up use precompiled `.mpy` files or freeze the modules
+      (see `tools/build_mpy.py`).
+
     * Depends on the following micropython-lib modules installed (via upip or manually)
         - micropython-uasyncio
         - micropython-uasyncio.queues
@@ -47,35 +62,31 @@ To Do
 
 ##============================================================================
 
-import micropython
-
-import uasyncio as asyncio
-
-## could probably create Keypad and LCD instances in hwconfig file ??
-
-from keypad_uasyncio import Keypad_uasyncio
+try:
+    import micropython
+except ImportError:
+    micropython = None      ## host simulation (CPython)
 
-# try:
-#     from machine import I2C
-# except ImportErrror:
-#     from pyb import I2C
-#from machine import I2C
-from pyb import I2C
+## The keypad pins and LCD come from the board profile in the hwconfig file,
+## if it declares them (see hwapi/board.py).
 
-from pyb_i2c_lcd import I2cLcd
+from keypad_uasyncio import Keypad_uasyncio, asyncio, sleep_ms
+from keymap import Keymap, LCD_LAYOUT, ACTION_FIRST
 
 ##============================================================================
 
-async def keypad_lcd_task(lcd, keypad):
+async def keypad_lcd_task(lcd, keypad, monitor=None):
     """A task to monitor a queue of key events and process them."""
 
+    region = monitor.region('lcd_flush') if monitor else 0
+
     str = "\n".join( [ "+------------------+",
                        "keypad_lcd_uasyncio ",
                        "   Please wait ...  ",
                        "+------------------+",
                        ] )
     lcd.putstr(str)
-    await asyncio.sleep_ms(2000)
+    await sleep_ms(2000)
     lcd.clear()
     lcd.putstr("Press a key ...\n> ")
 
@@ -83,16 +94,65 @@ async def keypad_lcd_task(lcd, keypad):
         key = await keypad.get_key()
         #key = await keypad.queue.get()
         print("keypad_watcher: got key: {!r}".format(key))
-        if key == '*':      ## backspace
-            lcd.move_to(cursor_x=0)
-        elif key == 'p':    ## erase line
-            lcd.clear_row()
-        elif key == '#':    ## enter
-            lcd.putchar("\n")
-        elif key == 'd':    ## erase screen
-            lcd.clear()
-        else:
-            lcd.putchar(key)
+        if monitor:
+            monitor.begin(region)
+        lcd_key_process(lcd, key)
+        if monitor:
+            monitor.end(region)
+
+##============================================================================
+
+def _cursor_move(lcd, dx, dy):
+    """Move the cursor, wrapping around the display."""
+
+    lcd.move_to((lcd.cursor_x + dx) % lcd.num_columns, (lcd.cursor_y + dy) % lcd.num_lines)
+
+## LCD updates for the app actions, indexed by `action - ACTION_FIRST` (see
+## keymap.py).
+LCD_ACTIONS = [
+    lambda lcd: lcd.move_to(cursor_x=0),        ## BACKSPACE
+    lambda lcd: lcd.putchar("\n"),              ## ENTER
+    lambda lcd: lcd.clear_row(),                ## CLEAR_LINE
+    lambda lcd: lcd.clear(),                    ## CLEAR_SCREEN
+    lambda lcd: _cursor_move(lcd, -1, 0),       ## CURSOR_LEFT
+    lambda lcd: _cursor_move(lcd, 1, 0),        ## CURSOR_RIGHT
+    lambda lcd: _cursor_move(lcd, 0, -1),       ## CURSOR_UP
+    lambda lcd: _cursor_move(lcd, 0, 1),        ## CURSOR_DOWN
+    lambda lcd: lcd.move_to(0, 0),              ## HOME
+    ]
+
+def lcd_key_process(lcd, action):
+    """Update the LCD for a key action code."""
+
+    if action < ACTION_FIRST:
+        lcd.putchar(chr(action))
+    else:
+        index = action - ACTION_FIRST
+        if index < len(LCD_ACTIONS):
+            LCD_ACTIONS[index](lcd)
+
+##============================================================================
+
+def make_lcd():
+    """Create the LCD instance, for config modules without a board profile LCD."""
+
+    # try:
+    #     from machine import I2C
+    # except ImportErrror:
+    #     from pyb import I2C
+    #from machine import I2C
+    try:
+        from hwconfig import I2C
+    except ImportError:
+        from pyb import I2C
+
+    try:
+        from pyb_i2c_lcd import I2cLcd
+    except ImportError:
+        from hwconfig import SimLcd as I2cLcd   ## host simulation
+
+    i2c = I2C(1, I2C.MASTER)
+    return I2cLcd(i2c, 0x27, 4, 20)
 
 ##============================================================================
 
@@ -103,19 +163,31 @@ def main():
 
     micropython.alloc_emergency_exception_buf(100)
 
-    ## Create the LCD instance.
-    i2c = I2C(1, I2C.MASTER)
-    lcd = I2cLcd(i2c, 0x27, 4, 20)
+    ## Create the LCD instance (from the board profile, if declared).
+    try:
+        from hwconfig import LCD as lcd
+    except ImportError:
+        lcd = make_lcd()
 
     ## Create the keypad instance.
-    keypad = Keypad_uasyncio(queue_size=4, start=True)
+    keypad = Keypad_uasyncio(queue_size=4, start=True, keymap=Keymap(LCD_LAYOUT))
 
     ## Get a handle to the asyncio event loop.
     loop = asyncio.get_event_loop()
 
+    ## Monitor the heap (if the heap_monitor module is installed).
+    try:
+        from heap_monitor import HeapMonitor
+        monitor = HeapMonitor()
+    except ImportError:
+        monitor = None
+    if monitor:
+        keypad.set_monitor(monitor)
+        loop.create_task(monitor.run(report_every=10))
+
     ## Add the keypad scanning and keypad watcher coroutines.
     loop.create_task(keypad.scan_coro())
-    loop.create_task(keypad_lcd_task(lcd=lcd, keypad=keypad))
+    loop.create_task(keypad_lcd_task(lcd=lcd, keypad=keypad, monitor=monitor))
 
     ## Start running the coroutines
     loop.run_forever()
@@ -0,0 +1,384 @@
+"""
+Deadline driven asyncio event loop integration for GUI toolkits (wxPython)
+==========================================================================
+
+Runs an asyncio event loop inside a GUI main loop without polling.
+
+Instead of running the asyncio loop from a 1ms `wx.Timer` (see the old
+`wx_asyncio_test_1.MyApp.idle_handler`), the adapter runs one asyncio loop
+iteration only when there is something to do:
+
+    * a one-shot GUI timer is armed for exactly the next scheduled asyncio
+      deadline (`call_later()`, `asyncio.sleep()`, ...),
+    * `call_soon()`/`call_later()` from the GUI thread (outside an
+      iteration) and `call_soon_threadsafe()` from other threads wake the
+      GUI thread immediately,
+    * a helper thread waits for I/O readiness on the loop's file descriptors
+      and wakes the GUI thread when one is ready.
+
+Notes
+-----
+
+    * The GUI toolkit is behind a small `GuiBackend` interface:
+        - `WxBackend` uses `wx.CallLater` and `wx.CallAfter`.
+        - `FakeBackend` is headless: it runs its own event loop in the
+          calling thread and counts wakeups, so wakeups per second and timer
+          accuracy can be measured without a display (see
+          `bench/bench_wx_asyncio_loop.py`).
+
+    * Usage (before creating any asyncio tasks):
+        >>> loop = wx_asyncio_loop.install(WxBackend())
+
+    * The adapter uses `SelectorEventLoop` internals (`_ready`,
+      `_scheduled`, `_selector`) to find the next deadline and the file
+      descriptors to watch.
+
+"""
+
+##============================================================================
+
+import asyncio
+import collections
+import math
+import os
+import select
+import threading
+import time
+
+##============================================================================
+
+class GuiBackend():
+    """Interface between the asyncio loop adapter and a GUI toolkit."""
+
+    def start_timer(self, delay, callback):
+        """Arm (or re-arm) the one-shot timer to call `callback()` after `delay` seconds."""
+        raise NotImplementedError
+
+    def stop_timer(self):
+        """Disarm the one-shot timer."""
+        raise NotImplementedError
+
+    def call_after(self, callback):
+        """Call `callback()` in the GUI thread as soon as possible (thread-safe)."""
+        raise NotImplementedError
+
+##============================================================================
+
+class WxBackend(GuiBackend):
+    """wxPython backend."""
+
+    def __init__(self):
+        """Constructor."""
+
+        import wx
+        self.wx = wx
+        self.timer = None
+
+    #-------------------------------------------------------------------------
+
+    def start_timer(self, delay, callback):
+        ## wx timers have ms resolution, round up so we never wake early.
+        ms = max(1, int(math.ceil(delay * 1000)))
+        if self.timer is None:
+            self.timer = self.wx.CallLater(ms, callback)
+        else:
+            self.timer.Restart(ms)
+
+    #-------------------------------------------------------------------------
+
+    def stop_timer(self):
+        if self.timer is not None and self.timer.IsRunning():
+            self.timer.Stop()
+
+    #-------------------------------------------------------------------------
+
+    def call_after(self, callback):
+        self.wx.CallAfter(callback)
+
+##============================================================================
+
+class FakeBackend(GuiBackend):
+    """Headless backend, for testing and benchmarks.
+
+       `run(duration)` runs a GUI style event loop in the calling thread,
+       until `duration` seconds have passed or `stop()` is called.
+       Timer accuracy (actual - requested wakeup time) is collected in
+       `timer_lateness`.
+    """
+
+    def __init__(self, timer_resolution=0.001):
+        """Constructor.  `timer_resolution` (s) mimics the GUI timer's granularity."""
+
+        self.timer_resolution = timer_resolution
+        self.cond = threading.Condition()
+        self.posted = collections.deque()
+        self.deadline = None
+        self.timer_callback = None
+        self.end = None
+
+        ## Statistics.
+        self.wakeups = 0
+        self.timer_wakeups = 0
+        self.posted_wakeups = 0
+        self.timer_lateness = []
+
+    #-------------------------------------------------------------------------
+
+    def start_timer(self, delay, callback):
+        res = self.timer_resolution
+        if res:
+            delay = max(res, math.ceil(delay / res) * res)
+        with self.cond:
+            self.deadline = time.monotonic() + delay
+            self.timer_callback = callback
+
+    #-------------------------------------------------------------------------
+
+    def stop_timer(self):
+        with self.cond:
+            self.deadline = None
+
+    #-------------------------------------------------------------------------
+
+    def call_after(self, callback):
+        with self.cond:
+            self.posted.append(callback)
+            self.cond.notify()
+
+    #-------------------------------------------------------------------------
+
+    def stop(self):
+        """Make `run()` return (thread-safe)."""
+
+        with self.cond:
+            self.end = 0
+            self.cond.notify()
+
+    #-------------------------------------------------------------------------
+
+    def run(self, duration):
+        """Dispatch timer and posted callbacks for `duration` seconds."""
+
+        self.end = time.monotonic() + duration
+        while True:
+            with self.cond:
+                while True:
+                    end = self.end
+                    now = time.monotonic()
+                    if self.posted or now >= end:
+                        break
+                    if self.deadline is not None and now >= self.deadline:
+                        break
+                    timeout = end - now
+                    if self.deadline is not None:
+                        timeout = min(timeout, self.deadline - now)
+                    self.cond.wait(timeout)
+
+                if now >= self.end:
+                    return
+                if self.posted:
+                    callback = self.posted.popleft()
+                    self.posted_wakeups += 1
+                elif self.deadline is not None and now >= self.deadline:
+                    callback = self.timer_callback
+                    self.timer_lateness.append(now - self.deadline)
+                    self.deadline = None
+                    self.timer_wakeups += 1
+                else:
+                    continue
+
+            self.wakeups += 1
+            callback()
+
+##============================================================================
+
+ITERATIONS_PER_WAKEUP = 4
+
+class GuiEventLoop(asyncio.SelectorEventLoop):
+    """An asyncio event loop driven by a `GuiBackend`."""
+
+    def __init__(self, backend):
+        """Constructor."""
+
+        self.backend = backend
+        self.iterations = 0
+
+        self._in_iteration = False
+        self._wake_pending = False
+        self._wake_lock = threading.Lock()
+
+        super().__init__()
+
+        ## I/O poller thread.
+        self._poll_closing = False
+        self._poll_resume = threading.Event()
+        self._poll_map_sig = None
+        self._poll_intr_r, self._poll_intr_w = os.pipe()
+        self._poll_thread = threading.Thread(target=self._poll_thread_main, name='GuiEventLoop-poller', daemon=True)
+        self._poll_thread.start()
+
+        ## Run the first iteration as soon as the GUI loop runs.
+        self._request_wake()
+
+    #-------------------------------------------------------------------------
+
+    def _request_wake(self):
+        """Ask the GUI thread to run an iteration (thread-safe, coalesced)."""
+
+        with self._wake_lock:
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        self.backend.call_after(self._wake)
+
+    #-------------------------------------------------------------------------
+
+    def _write_to_self(self):
+        ## Called by call_soon_threadsafe() (and signal handlers).
+        super()._write_to_self()
+        self._request_wake()
+
+    #-------------------------------------------------------------------------
+
+    def call_soon(self, callback, *args, context=None):
+        handle = super().call_soon(callback, *args, context=context)
+        if not self._in_iteration:
+            self._request_wake()
+        return handle
+
+    #-------------------------------------------------------------------------
+
+    def call_at(self, when, callback, *args, context=None):
+        ## (call_later() goes through call_at())  Scheduled from a GUI
+        ## handler, the timer has to be re-armed for the new deadline.
+        handle = super().call_at(when, callback, *args, context=context)
+        if not self._in_iteration:
+            self._request_wake()
+        return handle
+
+    #-------------------------------------------------------------------------
+
+    def _wake(self):
+        with self._wake_lock:
+            self._wake_pending = False
+        self.run_once()
+
+    #-------------------------------------------------------------------------
+
+    def run_once(self):
+        """Run one loop iteration, then arm the GUI timer for the next deadline."""
+
+        if self.is_closed() or self.is_running():
+            return
+
+        ## Callbacks scheduled by an iteration (e.g. a task woken by a
+        ## future) are run in the same wakeup, up to a few iterations.
+        self._in_iteration = True
+        try:
+            for _ in range(ITERATIONS_PER_WAKEUP):
+                super().call_soon(self.stop)
+                self.run_forever()
+                self.iterations += 1
+                if not self._ready:
+                    break
+        finally:
+            self._in_iteration = False
+
+        self._poll_rearm()
+        self._arm_timer()
+
+    #-------------------------------------------------------------------------
+
+    def next_deadline(self):
+        """Return the delay (s) until the loop next has work, or None if idle."""
+
+        if self._ready:
+            return 0
+        ## (a cancelled handle at the head just causes one early, empty iteration)
+        if self._scheduled:
+            return max(0, self._scheduled[0].when() - self.time())
+        return None
+
+    #-------------------------------------------------------------------------
+
+    def _arm_timer(self):
+        delay = self.next_deadline()
+        if delay is None:
+            self.backend.stop_timer()
+        elif delay == 0:
+            self.backend.stop_timer()
+            self._request_wake()
+        else:
+            self.backend.start_timer(delay, self._timer_expired)
+
+    #-------------------------------------------------------------------------
+
+    def _timer_expired(self):
+        self.run_once()
+
+    #-------------------------------------------------------------------------
+
+    def _poll_rearm(self):
+        """Let the poller thread watch the (possibly changed) descriptors again."""
+
+        sig = [ (key.fd, key.events) for key in self._selector.get_map().values() ]
+        sig.sort()
+        if sig != self._poll_map_sig:
+            self._poll_map_sig = sig
+            os.write(self._poll_intr_w, b'x')
+        self._poll_resume.set()
+
+    #-------------------------------------------------------------------------
+
+    def _poll_thread_main(self):
+        """Wait for I/O readiness and wake the GUI thread."""
+
+        intr = self._poll_intr_r
+        while not self._poll_closing:
+            readers = [ intr ]
+            writers = []
+            try:
+                for key in list(self._selector.get_map().values()):
+                    if key.fd == self._ssock.fileno():
+                        continue        ## covered by _write_to_self()
+                    if key.events & 1:
+                        readers.append(key.fd)
+                    if key.events & 2:
+                        writers.append(key.fd)
+                readable, writable, _ = select.select(readers, writers, [])
+            except (OSError, ValueError, RuntimeError):
+                ## the map changed/closed under us, try again
+                time.sleep(0.001)
+                continue
+
+            if intr in readable:
+                os.read(intr, 4096)
+                if len(readable) == 1 and not writable:
+                    continue
+
+            ## Something is ready; wake the GUI and wait until it has run an
+            ## iteration, so the same readiness is not reported in a loop.
+            self._poll_resume.clear()
+            self._request_wake()
+            self._poll_resume.wait()
+
+    #-------------------------------------------------------------------------
+
+    def close(self):
+        self._poll_closing = True
+        self._poll_resume.set()
+        os.write(self._poll_intr_w, b'x')
+        self._poll_thread.join(1)
+        os.close(self._poll_intr_r)
+        os.close(self._poll_intr_w)
+        self.backend.stop_timer()
+        super().close()
+
+##============================================================================
+
+def install(backend):
+    """Create a `GuiEventLoop` for `backend` and make it the current event loop."""
+
+    loop = GuiEventLoop(backend)
+    asyncio.set_event_loop(loop)
+    return loop
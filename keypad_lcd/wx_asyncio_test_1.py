@@ -5,24 +5,32 @@ Test wxPython/Phoenix application with asyncio module
 Creates a dialog with 4 gauges.
 
     * Gauge 1 is updated every 100ms by a wxTimer.
-    * Gauge 2 is updated every 200ms by an asyncio coroutine/task.
-    * Gauge 3 is updated every 300ms by an asyncio coroutine/task.
-    * Gauge 4 is updated every 400ms by an asyncio coroutine/task.
-
-The main app calls the `idle_handler` to run a single iteration of the asyncio
-event loop.
-
-If the `idle_handler` requests more idle events immediately the guages update
-as expected, however the CPU load is high (~100%).
-
-Using a wxTimer with 1ms inverval to call the asyncio event loop seems to work
-well and keeps the CPU load (~2-3%).
+    * Gauge 2 is updated every 100ms by an asyncio coroutine/task.
+    * Gauge 3 is updated every 200ms by an asyncio coroutine/task.
+    * Gauge 4 is updated every 300ms by an asyncio coroutine/task, which
+      gets its value from (simulated) blocking work run in a thread pool via
+      `wx_offload`, so the dialog does not freeze.
+
+The timer and tasks write the gauge values into a `wx_gauge_store.GaugeStore`,
+and a `FrameUpdater` applies the changed values to the gauges once per frame
+(30 FPS), so the gauges are repainted together rather than once per update.
+
+The asyncio event loop runs inside the wx main loop via `wx_asyncio_loop`:
+an iteration only runs when the loop has work to do (the next deadline, a
+`call_soon()`/`call_later()`, a `call_soon_threadsafe()` or I/O readiness),
+armed with `wx.CallLater`/`wx.CallAfter`, so the CPU load is ~0% while idle
+and coroutines wake on time rather than on a polling tick.
 """
 
 import wx
 import wx.lib.sized_controls as wxSC
 
 import asyncio
+import time
+
+import wx_asyncio_loop
+import wx_offload
+from wx_gauge_store import GaugeStore, FrameUpdater
 
 ##============================================================================
 
@@ -58,6 +66,15 @@ class MyDialog(wxSC.SizedDialog):
         wx.StaticText(pane, label="Gauge 4")
         self.gauge4 = wx.Gauge(pane, range=max, size=size)
 
+        ## Gauge values are written to the store, and applied to the gauges
+        ## once per frame.
+        self.store = GaugeStore()
+        self.updater = FrameUpdater(self.store, fps=30, freeze=self)
+        self.updater.bind('gauge1', self.gauge1)
+        self.updater.bind('gauge2', self.gauge2)
+        self.updater.bind('gauge3', self.gauge3)
+        self.updater.bind('gauge4', self.gauge4)
+
         ## add dialog buttons
         self.SetButtonSizer(self.CreateStdDialogButtonSizer(wx.OK | wx.CANCEL))
 
@@ -70,6 +87,9 @@ class MyDialog(wxSC.SizedDialog):
         self.timer = wx.Timer(self)
         self.timer.Start(100)
 
+        ## Run blocking work off the GUI thread.
+        self.offload = wx_offload.Offloader(max_workers=2)
+
         ## Get a handle to the asyncio event loop.
         loop = asyncio.get_event_loop()
 
@@ -80,19 +100,27 @@ class MyDialog(wxSC.SizedDialog):
 
     def __del__(self):
         self.timer.Stop()
+        self.updater.close()
+        self.offload.shutdown(wait=False)
+
+    @staticmethod
+    def slow_next_count(count, count_max):
+        """Blocking work (e.g. parsing a device stream), run in the thread pool."""
+        time.sleep(0.05)
+        return 0 if count >= count_max else count + 1
 
     def timer_handler(self, event):
         """TimerHandler updates gauge1."""
         #print("timer_handler:")
         self.count1 = 0 if self.count1 >= self.count_max else self.count1 + 1
-        self.gauge1.SetValue(self.count1)
+        self.store.set('gauge1', self.count1)
 
     async def update_gauge2_task(self):
         """Asynchronous function/task to update gauge2."""
         while True:
             #print("update_gauge2_task:")
             self.count2 = 0 if self.count2 >= self.count_max else self.count2 + 1
-            self.gauge2.SetValue(self.count2)
+            self.store.set('gauge2', self.count2)
             #await asyncio.sleep_ms(200);
             await asyncio.sleep(100/1000);      ## 100ms
 
@@ -101,15 +129,15 @@ class MyDialog(wxSC.SizedDialog):
         while True:
             #print("update_gauge3_task:")
             self.count3 = 0 if self.count3 >= self.count_max else self.count3 + 1
-            self.gauge3.SetValue(self.count3)
+            self.store.set('gauge3', self.count3)
             await asyncio.sleep(200/1000);      ## 200ms
 
     async def update_gauge4_task(self):
         """Asynchronous function/task to update gauge4."""
         while True:
             #print("update_gauge4_task:")
-            self.count4 = 0 if self.count4 >= self.count_max else self.count4 + 1
-            self.gauge4.SetValue(self.count4)
+            self.count4 = await self.offload.run(self.slow_next_count, self.count4, self.count_max)
+            self.store.set('gauge4', self.count4)
             await asyncio.sleep(300/1000);      ## 300ms
 
 ##============================================================================
@@ -121,31 +149,12 @@ class MyApp(wx.App):
         ## Only specified windows will receive the idle event, not all windows.
         wx.IdleEvent.SetMode(wx.IDLE_PROCESS_SPECIFIED)
 
-        ## bind idle event run the asyncio event loop.
-        self.Bind(wx.EVT_IDLE, self.idle_handler)
-
-        self.timer = wx.Timer(self)
-        self.timer.Start(1)
-
-        ## bind timer event handler (to run asyncio loop).
-        self.Bind(wx.EVT_TIMER, self.idle_handler)
-
-        ## Get a handle to the asyncio event loop.
-        loop = self.asyncio_loop = asyncio.get_event_loop()
-
-    def __del__(self):
-        self.timer.Stop()
-
-    def idle_handler(self, event):
-        """Idle handler runs the asyncio event loop."""
-        #print("idel_handler: MyApp")
-
-        ## Run the asyncio loop for once until all events handled (i.e. not forever).
-        #self.asyncio_loop._run_once()
-        self.asyncio_loop.call_soon(self.asyncio_loop.stop) ; self.asyncio_loop.run_forever()
+        ## Run the asyncio event loop from wx, woken at its next deadline.
+        loop = self.asyncio_loop = wx_asyncio_loop.install(wx_asyncio_loop.WxBackend())
 
-        ## Force another idle event to be generated even if no wx events have occurred (note: high cpu usage !!)
-        #event.RequestMore(True)
+    def OnExit(self):
+        self.asyncio_loop.close()
+        return 0
 
 def main():
     """Show the main form."""
@@ -0,0 +1,243 @@
+"""
+Frame coalesced widget updates (model/view) for wxPython dashboards
+===================================================================
+
+Tasks, timers and offloaded jobs write values into a shared `GaugeStore`
+(the model) instead of calling `SetValue()` on widgets directly.  A
+`FrameUpdater` (the view side) applies the values which changed since the
+last frame to their widgets, once per frame at a configurable FPS.
+
+    * Many writes to the same value within a frame cost one widget call.
+    * Writes which do not change a value cost no widget call at all.
+    * All widget calls of a frame are made together (inside `Freeze()` /
+      `Thaw()` of a parent window, if given), so they cause one repaint.
+
+Notes
+-----
+
+    * Usage:
+        >>> store = GaugeStore()
+        >>> updater = FrameUpdater(store, fps=30, freeze=panel)
+        >>> updater.bind('gauge1', gauge1)        # calls gauge1.SetValue(v)
+        >>> store.set('gauge1', 10)
+
+    * The frame tick is only scheduled when a value changes, so an idle
+      dashboard causes no wakeups (see `wx_asyncio_loop`).  A write from a
+      wx event handler wakes an idle loop.  Frames are
+      aligned to the frame period, so a value is applied at most one frame
+      period after it is written.
+
+    * The store and updater are used from the GUI thread only (i.e. by
+      asyncio tasks and wx event handlers).  Results from worker threads
+      are delivered there by `wx_offload`.
+
+    * `CountingWidget` and `CountingWindow` stand in for wx widgets in
+      headless mode and count the calls made on them (see
+      `bench/bench_wx_gauges.py`).
+
+"""
+
+##============================================================================
+
+import asyncio
+
+##============================================================================
+
+FPS_DEFAULT = 30
+
+class GaugeStore():
+    """Shared model: named values, with tracking of which have changed."""
+
+    def __init__(self):
+        """Constructor."""
+
+        self.values = {}
+        self.dirty = {}             ## name -> None, in insertion order
+        self.listener = None
+
+        ## Statistics.
+        self.writes = 0
+        self.changes = 0
+
+    #-------------------------------------------------------------------------
+
+    def set(self, name, value):
+        """Set a value; it is applied to its widget at the next frame."""
+
+        self.writes += 1
+        if name in self.values and self.values[name] == value:
+            return
+        self.values[name] = value
+        self.changes += 1
+        was_clean = not self.dirty
+        self.dirty[name] = None
+        if was_clean and self.listener is not None:
+            self.listener()
+
+    #-------------------------------------------------------------------------
+
+    def get(self, name, default=None):
+        """Return a value."""
+
+        return self.values.get(name, default)
+
+    #-------------------------------------------------------------------------
+
+    def take_dirty(self):
+        """Return the names changed since the last call, and clear them."""
+
+        dirty = self.dirty
+        self.dirty = {}
+        return dirty
+
+##============================================================================
+
+class FrameUpdater():
+    """Applies changed store values to their widgets, once per frame."""
+
+    def __init__(self, store, fps=FPS_DEFAULT, freeze=None, loop=None):
+        """Constructor.
+
+           `freeze` is an optional parent window, frozen while the widgets of
+           a frame are updated.
+        """
+
+        self.store = store
+        self.period = 1.0 / fps
+        self.freeze = freeze
+        self.loop = loop
+        self.bindings = {}
+        self.handle = None
+        self.last_frame = None
+
+        store.listener = self._schedule
+
+        ## Statistics.
+        self.frames = 0
+        self.widget_calls = 0
+
+    #-------------------------------------------------------------------------
+
+    def bind(self, name, widget, setter='SetValue'):
+        """Apply value `name` with `widget.<setter>(value)`."""
+
+        self.bindings[name] = getattr(widget, setter)
+        if name in self.store.values:
+            self.store.dirty[name] = None
+            self._schedule()
+
+    #-------------------------------------------------------------------------
+
+    def _get_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        return self.loop
+
+    #-------------------------------------------------------------------------
+
+    def _schedule(self):
+        """Schedule the next frame (called when the store becomes dirty)."""
+
+        if self.handle is not None:
+            return
+        ## call_soon(), then delay inside the loop: a write from a wx event
+        ## handler (outside a loop iteration) has to wake the loop, which
+        ## only call_soon() does on every loop.
+        self.handle = self._get_loop().call_soon(self._arm)
+
+    #-------------------------------------------------------------------------
+
+    def _arm(self):
+        """Run the frame now, or schedule it one frame period after the last one."""
+
+        loop = self._get_loop()
+        if self.last_frame is None or loop.time() >= self.last_frame + self.period:
+            self.tick()
+        else:
+            self.handle = loop.call_at(self.last_frame + self.period, self.tick)
+
+    #-------------------------------------------------------------------------
+
+    def tick(self):
+        """Apply the changed values to their widgets (one frame)."""
+
+        self.handle = None
+        self.last_frame = self._get_loop().time()
+        dirty = self.store.take_dirty()
+        if not dirty:
+            return
+
+        self.frames += 1
+        values = self.store.values
+        bindings = self.bindings
+        freeze = self.freeze
+        if freeze is not None:
+            freeze.Freeze()
+        try:
+            for name in dirty:
+                setter = bindings.get(name)
+                if setter is not None:
+                    setter(values[name])
+                    self.widget_calls += 1
+        finally:
+            if freeze is not None:
+                freeze.Thaw()
+
+    #-------------------------------------------------------------------------
+
+    def close(self):
+        """Cancel any scheduled frame."""
+
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        self.store.listener = None
+
+##============================================================================
+
+class CountingWidget():
+    """Headless stand-in for a wx widget: counts `SetValue()` calls."""
+
+    def __init__(self, window=None):
+        """Constructor.  `window` is the (counting) parent window, if any."""
+
+        self.window = window
+        self.value = None
+        self.calls = 0
+
+    def SetValue(self, value):
+        self.value = value
+        self.calls += 1
+        if self.window is not None:
+            self.window.invalidate()
+
+#-----------------------------------------------------------------------------
+
+class CountingWindow():
+    """Headless stand-in for a wx parent window: counts repaints.
+
+       Like wx, a widget change repaints the window unless it is frozen, in
+       which case one repaint happens on `Thaw()`.
+    """
+
+    def __init__(self):
+        """Constructor."""
+
+        self.frozen = 0
+        self.invalid = False
+        self.repaints = 0
+
+    def invalidate(self):
+        if self.frozen:
+            self.invalid = True
+        else:
+            self.repaints += 1
+
+    def Freeze(self):
+        self.frozen += 1
+
+    def Thaw(self):
+        self.frozen -= 1
+        if not self.frozen and self.invalid:
+            self.invalid = False
+            self.repaints += 1
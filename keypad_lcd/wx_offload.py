@@ -0,0 +1,177 @@
+"""
+Offload blocking work from the GUI thread, with batched result delivery
+=======================================================================
+
+Runs blocking or CPU heavy functions (parsing device streams, file I/O, ...)
+in a `concurrent.futures` thread or process pool, so the GUI thread (which
+also runs the asyncio loop, see `wx_asyncio_loop`) does not freeze.
+
+Notes
+-----
+
+    * Await a result from a coroutine:
+        >>> offload = Offloader(backend)
+        >>> result = await offload.run(parse, data)
+
+      or deliver it to a plain callback on the GUI thread:
+        >>> offload.submit(on_result, parse, data)
+
+    * Results are marshalled back to the GUI thread in batches: the worker
+      threads append finished jobs to a pending list, and only the first
+      result of a batch posts a flush to the GUI thread, which completes
+      every pending result.  So N results arriving together cost one GUI
+      wakeup, where posting each result with its own `wx.CallAfter` costs
+      N.  (A `wx_asyncio_loop.GuiEventLoop` already coalesces the
+      `call_soon_threadsafe()` wakeups of `loop.run_in_executor()` while
+      one is pending, so there the two are about level.)
+
+    * `max_batch` bounds the results handled per flush, so a burst of
+      results does not stall the GUI thread either; the rest are handled by
+      a further flush.
+
+    * Results are marshalled with the event loop's `call_soon_threadsafe()`,
+      so with a `wx_asyncio_loop.GuiEventLoop` a batch and the coroutines it
+      wakes run in a single GUI wakeup.  Alternatively give a `backend`,
+      anything with a thread-safe `call_after(callback)` (e.g. a
+      `wx_asyncio_loop` backend), for callers which do not use asyncio.
+
+    * An exception raised by a callback is printed (and counted in
+      `callback_errors`); delivery carries on with the next result.
+
+    * See `bench/bench_wx_offload.py` for GUI thread stall times with and
+      without offload.
+
+"""
+
+##============================================================================
+
+import asyncio
+import collections
+import concurrent.futures
+import threading
+import traceback
+
+##============================================================================
+
+MAX_BATCH_DEFAULT = 64
+
+class Offloader():
+    """Runs functions in an executor and delivers results to the GUI thread in batches."""
+
+    def __init__(self, backend=None, executor=None, max_workers=None, processes=False, max_batch=MAX_BATCH_DEFAULT, loop=None):
+        """Constructor.
+
+           Uses `executor`, or creates a thread pool (a process pool if
+           `processes`) with `max_workers` workers.
+        """
+
+        if executor is None:
+            pool = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+            executor = pool(max_workers=max_workers)
+            self.own_executor = True
+        else:
+            self.own_executor = False
+        self.executor = executor
+        self.backend = backend
+        self.loop = loop
+        self.max_batch = max_batch
+
+        self.lock = threading.Lock()
+        self.pending = collections.deque()
+        self.flush_posted = False
+
+        ## Statistics.
+        self.submitted = 0
+        self.completed = 0
+        self.flushes = 0
+        self.callback_errors = 0
+
+    #-------------------------------------------------------------------------
+
+    def _get_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.get_event_loop()
+        return self.loop
+
+    #-------------------------------------------------------------------------
+
+    def _post_flush(self):
+        if self.backend is not None:
+            self.backend.call_after(self._flush)
+        else:
+            self._get_loop().call_soon_threadsafe(self._flush)
+
+    #-------------------------------------------------------------------------
+
+    def _done(self, callback, future):
+        """Executor callback (any thread): queue the result for the GUI thread."""
+
+        with self.lock:
+            self.pending.append((callback, future))
+            if self.flush_posted:
+                return
+            self.flush_posted = True
+        self._post_flush()
+
+    #-------------------------------------------------------------------------
+
+    def _flush(self):
+        """Deliver pending results (GUI thread)."""
+
+        self.flushes += 1
+        for _ in range(self.max_batch):
+            with self.lock:
+                if not self.pending:
+                    self.flush_posted = False
+                    return
+                callback, future = self.pending.popleft()
+            self.completed += 1
+            try:
+                callback(future)
+            except Exception:
+                ## A bad callback must not leave the rest undelivered.
+                self.callback_errors += 1
+                traceback.print_exc()
+
+        ## More than max_batch results: let the GUI breathe, then carry on.
+        self._post_flush()
+
+    #-------------------------------------------------------------------------
+
+    def submit(self, callback, fn, *args):
+        """Run `fn(*args)` in the executor; call `callback(future)` on the GUI thread when done."""
+
+        self.submitted += 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._done(callback, f))
+        return future
+
+    #-------------------------------------------------------------------------
+
+    def run(self, fn, *args):
+        """Run `fn(*args)` in the executor; returns an awaitable for the result."""
+
+        result = self._get_loop().create_future()
+
+        def deliver(future):
+            if result.cancelled():
+                return
+            if future.cancelled():
+                result.cancel()
+                return
+            exc = future.exception()
+            if exc is not None:
+                result.set_exception(exc)
+            else:
+                result.set_result(future.result())
+
+        self.submit(deliver, fn, *args)
+        return result
+
+    #-------------------------------------------------------------------------
+
+    def shutdown(self, wait=True):
+        """Shut down the executor (if created here)."""
+
+        if self.own_executor:
+            self.executor.shutdown(wait=wait)
@@ -18,37 +18,53 @@ from machine import Pin, Signal
 
 import uasyncio
 
+try:
+    from heap_monitor import HeapMonitor
+except ImportError:
+    HeapMonitor = None
+
 
 #
-# LEDs on Keypad/LED board connection to PE connector.
+# LEDs on Keypad/LED board connection to PE connector, from the board
+# profile (a `board.LedBank`, which can set all LEDs with one port write).
+# Older config modules don't declare them, so fall back to a list.
 #
-LED_0 = Signal(Pin("E15", Pin.OUT), inverted=True)
-LED_1 = Signal(Pin("E14", Pin.OUT), inverted=True)
-LED_2 = Signal(Pin("E13", Pin.OUT), inverted=True)
-LED_3 = Signal(Pin("E12", Pin.OUT), inverted=True)
-LED_4 = Signal(Pin("E11", Pin.OUT), inverted=True)
-LED_5 = Signal(Pin("E10", Pin.OUT), inverted=True)
-LED_6 = Signal(Pin("E9", Pin.OUT), inverted=True)
-LED_7 = Signal(Pin("E8", Pin.OUT), inverted=True)
+try:
+    from hwconfig import LEDS
+except ImportError:
+    LEDS = [ Signal(Pin(name, Pin.OUT), inverted=True) for name in ("E15", "E14", "E13", "E12", "E11", "E10", "E9", "E8") ]
+
+
+def write_leds(mask):
+    """Switch the LEDs on/off from a bitmask (bit i = LEDS[i])."""
+
+    if hasattr(LEDS, 'write'):
+        LEDS.write(mask)
+        return
+    for i in range(len(LEDS)):
+        LEDS[i].value((mask >> i) & 1)
 
 #
-# List of LEDs.
+# Optional heap monitor.  LED updates (not the sleeps between them) are
+# attributed to its 'led_frame' region.
 #
-LEDS = [ LED_0, LED_1, LED_2, LED_3, LED_4, LED_5, LED_6, LED_7 ]
+monitor = None
+monitor_region = 0
 
 
 async def cycle_leds(cycle_count, delay):
     """A task to fade the LED on and off."""
 
+    if monitor:
+        monitor.begin(monitor_region)
+
     on_idx = cycle_count & 7
-    on_led = LEDS[on_idx]
 
-    # Turn all LEDs off.
-    for led in LEDS:
-        led.off()
+    # Turn next LED on, and all the others off.
+    write_leds(1 << on_idx)
 
-    # Turn next LED on.
-    on_led.on()
+    if monitor:
+        monitor.end(monitor_region)
 
     await uasyncio.sleep_ms(delay)
 
@@ -56,15 +72,19 @@ async def cycle_leds(cycle_count, delay):
 async def flash_leds(delay):
     """A task to flash the LEDs."""
 
+    if monitor:
+        monitor.begin(monitor_region)
+
     # Turn all LEDs on.
-    for led in LEDS:
-        led.on()
+    write_leds(0xFF)
+
+    if monitor:
+        monitor.end(monitor_region)
 
     await uasyncio.sleep_ms(delay)
 
     # Turn all LEDs off.
-    for led in LEDS:
-        led.off()
+    write_leds(0)
 
     await uasyncio.sleep_ms(delay)
 
@@ -106,7 +126,13 @@ async def check_button():
 
 
 def main():
+    global monitor, monitor_region
+
     loop = uasyncio.get_event_loop()
+    if HeapMonitor:
+        monitor = HeapMonitor()
+        monitor_region = monitor.region('led_frame')
+        loop.create_task(monitor.run(report_every=10))
     loop.create_task(check_button())
     loop.create_task(update_leds())
     loop.run_forever()
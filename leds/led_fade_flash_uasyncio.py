@@ -81,6 +81,15 @@ async def check_button(button):
 
 
 def main():
+    # Sleep between task wakeups (if the tickless_idle module is installed),
+    # the button being a wake source.  Only saves power on ports where
+    # ticks_ms() counts in lightsleep (not stm32, see tickless_idle).
+    try:
+        import tickless_idle
+        tickless_idle.install().add_wake_pin(BUTTON)
+    except ImportError:
+        pass
+
     loop = uasyncio.get_event_loop()
     loop.create_task(check_button(BUTTON))
     loop.create_task(update_led(LED))
@@ -0,0 +1,324 @@
+"""
+Heap and fragmentation monitor for long-running MicroPython apps
+================================================================
+
+A background uasyncio task which samples the heap, times GC pauses and
+attributes allocations to instrumented code regions, so slow memory creep
+over hours/days can be seen.
+
+Notes
+-----
+
+    * Each sample records:
+        - time (ms),
+        - heap allocated before the collect,
+        - heap free after the collect,
+        - live heap (allocated after the collect),
+        - GC pause (us) of the collect,
+        - largest free block after the collect,
+        - bytes allocated in each region since the previous sample.
+
+    * Samples are kept in a fixed ring buffer (an `array`), so the monitor
+      itself does not allocate once running (apart from the probe below).
+      Cumulative region totals are Python ints, as a multi-day soak
+      overflows a 32 bit array; they stay small ints (no allocation) up to
+      2**30 bytes.
+
+    * Fragmentation is the share of the free heap not in the largest free
+      block, `1 - largest / free`.  The largest block is found after the
+      collect by a binary search of `bytearray` allocations (to 64 bytes),
+      with a collect after each that succeeds: about a dozen more collects
+      per sample.  `frag=False` skips it.
+
+    * Code regions are instrumented with `begin()`/`end()` pairs.  These are
+      cheap (two `gc.mem_alloc()` calls) and do not allocate:
+
+        >>> mon = HeapMonitor()
+        >>> SCAN = mon.region('scan_frame')
+        ...
+        >>> mon.begin(SCAN)
+        >>> ... code ...
+        >>> mon.end(SCAN)
+
+      A collect inside a region hides that region's allocations for that
+      pass (negative deltas are ignored).
+
+    * Leak detection fits a least-squares line to the live heap over the
+      samples in the ring buffer.  A full ring with a slope above
+      `leak_threshold` bytes/hour is reported as a leak.
+
+    * To run it alongside an app:
+        >>> loop.create_task(mon.run())
+
+    * On CPython (host simulation) `gc.mem_alloc()` does not exist, so
+      `tracemalloc` is used instead and free memory (and the largest free
+      block) reads as 0.
+
+"""
+
+##============================================================================
+
+import gc
+from array import array
+
+try:
+    from time import ticks_ms, ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+try:
+    mem_alloc = gc.mem_alloc
+    mem_free = gc.mem_free
+except AttributeError:
+    ## host simulation (CPython)
+    import tracemalloc
+
+    def mem_alloc():
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return tracemalloc.get_traced_memory()[0]
+
+    def mem_free():
+        return 0
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    sleep_ms = asyncio.sleep_ms
+except AttributeError:
+    ## CPython asyncio has no sleep_ms().
+    def sleep_ms(ms):
+        return asyncio.sleep(ms / 1000)
+
+##============================================================================
+
+FRAG_RESOLUTION = 64                ## bytes
+
+def largest_free(free):
+    """Return the largest block (bytes, to `FRAG_RESOLUTION`) that can be allocated, at most `free`."""
+
+    lo = 0
+    hi = free
+    while hi - lo > FRAG_RESOLUTION:
+        n = (lo + hi) // 2
+        try:
+            buf = bytearray(n)
+        except MemoryError:
+            hi = n
+            continue
+        buf = None
+        gc.collect()
+        lo = n
+    return lo
+
+##============================================================================
+
+SAMPLES_DEFAULT = 120
+INTERVAL_MS_DEFAULT = 60000
+LEAK_THRESHOLD_DEFAULT = 1024       ## bytes/hour
+REGIONS_MAX = 8
+
+class HeapMonitor():
+    """Samples heap usage and GC pauses into a ring buffer."""
+
+    ## Sample fields (followed by one field per region).
+    F_TIME      = 0
+    F_ALLOC     = 1
+    F_FREE      = 2
+    F_LIVE      = 3
+    F_GC_US     = 4
+    F_LARGEST   = 5
+    F_REGIONS   = 6
+
+    #-------------------------------------------------------------------------
+
+    def __init__(self, samples=SAMPLES_DEFAULT, interval_ms=INTERVAL_MS_DEFAULT, leak_threshold=LEAK_THRESHOLD_DEFAULT, regions_max=REGIONS_MAX, frag=True):
+        """Constructor."""
+
+        self.samples = samples
+        self.frag = frag
+        self.interval_ms = interval_ms
+        self.leak_threshold = leak_threshold
+        self.regions_max = regions_max
+        self.fields = self.F_REGIONS + regions_max
+
+        self.ring = array('i', [ 0 ] * (samples * self.fields))
+        self.count = 0          ## total samples taken
+        self.index = 0          ## next ring slot
+
+        self.region_names = []
+        self.region_start = array('i', [ 0 ] * regions_max)
+        self.region_bytes = array('i', [ 0 ] * regions_max)       ## since last sample
+        self.region_total = [ 0 ] * regions_max                   ## since start
+        self.region_calls = [ 0 ] * regions_max
+
+        self.gc_max_us = 0
+
+    #-------------------------------------------------------------------------
+
+    def region(self, name):
+        """Register a code region and return its id (re-registering returns the same id)."""
+
+        if name in self.region_names:
+            return self.region_names.index(name)
+        if len(self.region_names) >= self.regions_max:
+            raise ValueError("too many regions")
+        self.region_names.append(name)
+        return len(self.region_names) - 1
+
+    #-------------------------------------------------------------------------
+
+    def begin(self, region):
+        """Mark the start of a region."""
+
+        self.region_start[region] = mem_alloc()
+
+    #-------------------------------------------------------------------------
+
+    def end(self, region):
+        """Mark the end of a region and account its allocations."""
+
+        delta = mem_alloc() - self.region_start[region]
+        if delta > 0:
+            self.region_bytes[region] += delta
+            self.region_total[region] += delta
+        self.region_calls[region] += 1
+
+    #-------------------------------------------------------------------------
+
+    def sample(self):
+        """Take a sample (runs a timed `gc.collect()`)."""
+
+        ring = self.ring
+        base = self.index * self.fields
+
+        ring[base + self.F_TIME] = ticks_ms()
+        ring[base + self.F_ALLOC] = mem_alloc()
+
+        start = ticks_us()
+        gc.collect()
+        gc_us = ticks_diff(ticks_us(), start)
+
+        free = mem_free()
+        ring[base + self.F_FREE] = free
+        ring[base + self.F_LIVE] = mem_alloc()
+        ring[base + self.F_GC_US] = gc_us
+        if gc_us > self.gc_max_us:
+            self.gc_max_us = gc_us
+        ring[base + self.F_LARGEST] = largest_free(free) if self.frag else 0
+
+        for region in range(self.regions_max):
+            ring[base + self.F_REGIONS + region] = self.region_bytes[region]
+            self.region_bytes[region] = 0
+
+        self.index = (self.index + 1) % self.samples
+        self.count += 1
+
+    #-------------------------------------------------------------------------
+
+    def get(self, age, field):
+        """Return a field of a sample, `age` 0 being the most recent."""
+
+        i = (self.index - 1 - age) % self.samples
+        return self.ring[i * self.fields + field]
+
+    #-------------------------------------------------------------------------
+
+    def available(self):
+        """Return the number of samples in the ring buffer."""
+
+        return min(self.count, self.samples)
+
+    #-------------------------------------------------------------------------
+
+    def fragmentation(self, age=0):
+        """Return the share (%) of the free heap not in the largest free block."""
+
+        free = self.get(age, self.F_FREE)
+        if not free or not self.frag:
+            return 0
+        return 100 * (1 - self.get(age, self.F_LARGEST) / free)
+
+    #-------------------------------------------------------------------------
+
+    def leak_rate(self):
+        """Return the live heap growth (bytes/hour) over the ring buffer."""
+
+        n = self.available()
+        if n < 2:
+            return 0
+
+        ## Least-squares slope; times relative to the oldest sample.
+        t0 = self.get(n - 1, self.F_TIME)
+        sum_t = sum_y = sum_tt = sum_ty = 0
+        for age in range(n):
+            t = ticks_diff(self.get(age, self.F_TIME), t0)
+            y = self.get(age, self.F_LIVE)
+            sum_t += t
+            sum_y += y
+            sum_tt += t * t
+            sum_ty += t * y
+        denom = n * sum_tt - sum_t * sum_t
+        if not denom:
+            return 0
+        return (n * sum_ty - sum_t * sum_y) * 3600000 / denom
+
+    #-------------------------------------------------------------------------
+
+    def leaking(self):
+        """True if the ring is full and the live heap grows faster than the threshold."""
+
+        return self.count >= self.samples and self.leak_rate() > self.leak_threshold
+
+    #-------------------------------------------------------------------------
+
+    def report(self):
+        """Print a summary of the most recent sample and the regions."""
+
+        if not self.count:
+            print("heap_monitor: no samples")
+            return
+
+        print("heap_monitor: samples={} alloc={} free={} live={} largest={} frag={:.0f}% gc={}us gc_max={}us leak_rate={:.0f}B/h{}".format(
+            self.count,
+            self.get(0, self.F_ALLOC),
+            self.get(0, self.F_FREE),
+            self.get(0, self.F_LIVE),
+            self.get(0, self.F_LARGEST),
+            self.fragmentation(),
+            self.get(0, self.F_GC_US),
+            self.gc_max_us,
+            self.leak_rate(),
+            " LEAK?" if self.leaking() else "",
+            ))
+        for region, name in enumerate(self.region_names):
+            calls = self.region_calls[region]
+            total = self.region_total[region]
+            print("    {:16s} calls={} bytes={} last={} per_call={:.1f}".format(
+                name, calls, total,
+                self.get(0, self.F_REGIONS + region),
+                total / calls if calls else 0,
+                ))
+
+    #-------------------------------------------------------------------------
+
+    async def run(self, report_every=0):
+        """A task to take a sample every `interval_ms`, reporting every `report_every` samples."""
+
+        while True:
+            self.sample()
+            if report_every and self.count % report_every == 0:
+                self.report()
+            await sleep_ms(self.interval_ms)
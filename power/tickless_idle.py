@@ -0,0 +1,348 @@
+"""
+Tickless idle for uasyncio apps
+===============================
+
+Puts the MCU to sleep (`machine.lightsleep`, or `pyb.wfi`) between event
+loop wakeups, instead of keeping it fully awake until the next task is due.
+
+A hook in the scheduler gets the time to the next task deadline.  When that
+is at least `threshold_ms` (or there is no deadline at all), it sleeps for
+the time less `margin_ms`, or until a wake source (pin IRQ) fires, and the
+loop then waits out the rest as usual.
+
+Notes
+-----
+
+    * Install before running the loop:
+        >>> import tickless_idle
+        >>> idle = tickless_idle.install(threshold_ms=10, margin_ms=2)
+        >>> idle.add_wake_pin(BUTTON)                   ## optional
+        >>> loop.run_forever()
+
+    * uasyncio v3: the loop calls `_io_queue.wait_io_event(dt)` with the time
+      (ms) to the next deadline (-1: none), and the hook wraps it.  It only
+      sleeps when no stream I/O is being waited on, apart from IRQ driven
+      `ThreadSafeFlag`s (a UART read needs the poll).  CPython asyncio (host
+      simulation): the hook wraps the loop's selector, and
+      `call_soon_threadsafe()` ends a sleep.
+
+    * Accuracy: a task is never run early (the loop checks deadlines, not
+      the sleep), and is late by at most `max(0, overshoot - margin_ms)` more
+      than without the hook, where `overshoot` is how late the sleep
+      primitive returns (wake up latency, sleep timer granularity).  With
+      the default 2ms margin a lightsleep waking up to 2ms late costs no
+      accuracy; the margin is the time spent awake before each deadline.
+
+    * Sleep primitive (`sleep`, called as `sleep(ms)`, or `sleep()` to sleep
+      until a wake source fires): `LIGHTSLEEP` from the `hwconfig` module if
+      it has one (the simulated board's fake, which counts the time asleep),
+      else on stm32 (`pyb`) a `pyb.wfi()` loop (`wfi_sleep`), else
+      `machine.lightsleep`.
+
+    * The hook only saves power on ports whose `ticks_ms()` keeps counting
+      during `machine.lightsleep` (e.g. esp32, rp2).  On stm32 (the Olimex
+      E407) it has no effect: lightsleep is STOP mode, where `ticks_ms()`
+      stops (deadlines would drift by the time asleep), so `wfi_sleep` is
+      used, and that is what the port's idle loop already does (its
+      `sleep_ms`/poll run `__WFI()` through `MICROPY_EVENT_POLL_HOOK`), so
+      the MCU sleeps just as much without the hook.  Saving power there
+      needs a lightsleep with an RTC wakeup and tick compensation, which
+      this module does not do.
+
+    * No lost wakeups: the hook clears `woken` before checking for pending
+      events (a waited on `ThreadSafeFlag` already set), and the sleep is
+      skipped, or ended, if a wake source fires or a flag is set after
+      that.  `wfi_sleep` makes the last check with IRQs disabled (a pending
+      IRQ still ends `wfi`), so none can slip in before the `wfi`.
+
+    * Wake sources: `add_wake_pin()` sets a pin IRQ (with `wake=machine.SLEEP`
+      where the port needs it, e.g. esp32).  On stm32 any enabled EXTI
+      interrupt ends a lightsleep.
+
+    * `sleeps`, `asleep_ms`, `irq_wakeups` and `report()` give the time
+      asleep vs awake since `install()`.
+
+"""
+
+##============================================================================
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_ms():
+        return int(perf_counter() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+try:
+    from hwconfig import LIGHTSLEEP        ## simulated board
+except ImportError:
+    LIGHTSLEEP = None
+
+try:
+    import machine
+except ImportError:
+    machine = None
+
+try:
+    import pyb
+except ImportError:
+    pyb = None
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+
+try:
+    from uasyncio import core
+except ImportError:
+    try:
+        from asyncio import core        ## MicroPython 1.21+ (uasyncio renamed)
+    except ImportError:
+        core = None                     ## CPython asyncio
+
+ThreadSafeFlag = getattr(asyncio, 'ThreadSafeFlag', None)
+
+##============================================================================
+
+THRESHOLD_MS_DEFAULT = 10
+MARGIN_MS_DEFAULT = 2
+
+##============================================================================
+
+class TicklessIdle():
+    """Sleeps between event loop wakeups (see `install()`)."""
+
+    def __init__(self, threshold_ms=THRESHOLD_MS_DEFAULT, margin_ms=MARGIN_MS_DEFAULT, sleep=None):
+        """Constructor.  `sleep` is the sleep primitive (default: see the module notes)."""
+
+        if sleep is None:
+            if LIGHTSLEEP is not None:
+                sleep = LIGHTSLEEP
+            elif pyb is None and machine and hasattr(machine, 'lightsleep'):
+                sleep = machine.lightsleep
+            else:
+                sleep = self.wfi_sleep      ## stm32: ticks_ms() stops in lightsleep (no saving, see notes)
+        self.sleep = sleep
+        self.sleep_wake = getattr(sleep, 'wake', None)
+        self.threshold_ms = max(threshold_ms, margin_ms + 1)
+        self.margin_ms = margin_ms
+
+        ## Set by wake source IRQs (cleared by the hook before its checks).
+        self.woken = False
+        ## Set by the hook: returns True if an event is already pending.
+        self.ready = None
+
+        self.start_ms = ticks_ms()
+        self.sleeps = 0
+        self.asleep_ms = 0
+        self.irq_wakeups = 0
+
+    #-------------------------------------------------------------------------
+
+    def add_wake_pin(self, pin, trigger=None, handler=None):
+        """Make a pin IRQ a wake source, calling `handler(pin)` (if any) from the IRQ."""
+
+        if trigger is None:
+            trigger = pin.IRQ_FALLING | pin.IRQ_RISING
+
+        def irq(pin):
+            self.woken = True
+            if handler:
+                handler(pin)
+
+        wake = getattr(machine, 'SLEEP', None)
+        if wake is not None:
+            try:
+                pin.irq(handler=irq, trigger=trigger, wake=wake)
+                return
+            except (TypeError, ValueError):
+                pass
+        pin.irq(handler=irq, trigger=trigger)
+
+    #-------------------------------------------------------------------------
+
+    def wake(self):
+        """End a sleep early (e.g. from another thread, or an IRQ)."""
+
+        self.woken = True
+        if self.sleep_wake:
+            self.sleep_wake()
+
+    #-------------------------------------------------------------------------
+
+    def wfi_sleep(self, ms=None):
+        """Sleep primitive: `pyb.wfi()` until `ms` have passed or a wake source fires."""
+
+        start = ticks_ms()
+        while ms is None or ticks_diff(ticks_ms(), start) < ms:
+            irq_state = pyb.disable_irq()
+            if self.pending():
+                pyb.enable_irq(irq_state)
+                break
+            pyb.wfi()
+            pyb.enable_irq(irq_state)
+
+    #-------------------------------------------------------------------------
+
+    def pending(self):
+        """Return True if a wake source has fired, or an event is pending, since the hook's checks."""
+
+        return self.woken or (self.ready is not None and self.ready())
+
+    #-------------------------------------------------------------------------
+
+    def can_sleep(self, dt):
+        """Return True if the time to the next deadline (ms, -1: none) is worth sleeping."""
+
+        return dt < 0 or dt >= self.threshold_ms
+
+    #-------------------------------------------------------------------------
+
+    def idle(self, dt):
+        """Sleep for `dt` ms less the margin (until woken if `dt` < 0)."""
+
+        if self.pending():
+            return
+        start = ticks_ms()
+        if dt < 0:
+            self.sleep()
+        else:
+            self.sleep(dt - self.margin_ms)
+        self.asleep_ms += ticks_diff(ticks_ms(), start)
+        self.sleeps += 1
+        if self.woken:
+            self.irq_wakeups += 1
+
+    #-------------------------------------------------------------------------
+
+    def report(self):
+        """Print and return `(asleep_ms, awake_ms)` since `install()`."""
+
+        total = ticks_diff(ticks_ms(), self.start_ms)
+        awake = total - self.asleep_ms
+        print("tickless_idle: sleeps={} irq_wakeups={} asleep={}ms awake={}ms ({:.1f}% asleep)".format(
+            self.sleeps, self.irq_wakeups, self.asleep_ms, awake, 100 * self.asleep_ms / total if total else 0))
+        return self.asleep_ms, awake
+
+##============================================================================
+
+class _UasyncioHook():
+    """Wraps uasyncio's `_io_queue.wait_io_event(dt)`."""
+
+    def __init__(self, io_queue, idle):
+        """Constructor."""
+
+        self.io_queue = io_queue
+        self.idle = idle
+        self.wait_io_event = io_queue.wait_io_event
+        idle.ready = self._flag_set
+
+    #-------------------------------------------------------------------------
+
+    def _irq_only(self):
+        """Return True if only `ThreadSafeFlag`s (or nothing) are waiting for I/O."""
+
+        for entry in self.io_queue.map.values():
+            if ThreadSafeFlag is None or not isinstance(entry[-1], ThreadSafeFlag):
+                return False
+        return True
+
+    #-------------------------------------------------------------------------
+
+    def _flag_set(self):
+        """Return True if a waited on `ThreadSafeFlag` is set (by an IRQ since its task waited)."""
+
+        for entry in self.io_queue.map.values():
+            if getattr(entry[-1], 'state', 0):
+                return True
+        return False
+
+    #-------------------------------------------------------------------------
+
+    def __call__(self, dt):
+        ## Clear before the checks (in `idle()`): a wake source firing after
+        ## this skips or ends the sleep.
+        self.idle.woken = False
+        if self.idle.can_sleep(dt) and self._irq_only():
+            self.idle.idle(dt)
+            dt = 0          ## poll I/O (flags set by IRQs), the loop recomputes dt
+        self.wait_io_event(dt)
+
+#-----------------------------------------------------------------------------
+
+class _SelectorHook():
+    """Wraps a CPython asyncio loop's selector (host simulation)."""
+
+    def __init__(self, selector, idle):
+        """Constructor."""
+
+        self.selector = selector
+        self.idle = idle
+        ## The loop's self-pipe (for `call_soon_threadsafe()`).
+        self.nfds = len(selector.get_map())
+        idle.ready = self._ready
+
+    #-------------------------------------------------------------------------
+
+    def _ready(self):
+        """Return True if the self-pipe is readable (a `call_soon_threadsafe()` since the checks)."""
+
+        return bool(self.selector.select(0))
+
+    #-------------------------------------------------------------------------
+
+    def select(self, timeout=None):
+        dt = -1 if timeout is None else int(timeout * 1000)
+        self.idle.woken = False
+        if self.idle.can_sleep(dt) and len(self.selector.get_map()) <= self.nfds:
+            self.idle.idle(dt)
+            timeout = 0
+        return self.selector.select(timeout)
+
+    #-------------------------------------------------------------------------
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+##============================================================================
+
+def install(threshold_ms=THRESHOLD_MS_DEFAULT, margin_ms=MARGIN_MS_DEFAULT, sleep=None, loop=None):
+    """Install the tickless idle hook in the event loop; return the `TicklessIdle`."""
+
+    idle = TicklessIdle(threshold_ms=threshold_ms, margin_ms=margin_ms, sleep=sleep)
+    if core is not None:
+        io_queue = core._io_queue
+        io_queue.wait_io_event = _UasyncioHook(io_queue, idle)
+    else:
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        loop._selector = _SelectorHook(loop._selector, idle)
+        write_to_self = loop._write_to_self
+
+        def wake_loop():
+            write_to_self()
+            idle.wake()
+
+        loop._write_to_self = wake_loop
+    return idle
+
+#-----------------------------------------------------------------------------
+
+def uninstall(loop=None):
+    """Remove the hook."""
+
+    if core is not None:
+        io_queue = core._io_queue
+        if isinstance(io_queue.wait_io_event, _UasyncioHook):
+            io_queue.wait_io_event = io_queue.wait_io_event.wait_io_event
+    else:
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        if isinstance(loop._selector, _SelectorHook):
+            loop._selector = loop._selector.selector
+            del loop._write_to_self
@@ -0,0 +1,235 @@
+"""
+Build precompiled .mpy bundles and frozen module manifests (host side)
+======================================================================
+
+Compiling `.py` source on the board costs boot time and heap (and leaves
+the heap fragmented before the app starts).  This script precompiles the
+modules of an app into a bundle of `.mpy` files with `mpy-cross`, to copy
+to the board's filesystem, or writes a manifest to freeze them into the
+firmware.
+
+Notes
+-----
+
+    * Bundles (see `BUNDLES`): keypad_lcd, keypad, leds, and sim (the
+      simulated board, for the unix port boot benchmark).
+
+    * The keypad_lcd bundle includes the LCD driver (`lcd_api`,
+      `pyb_i2c_lcd`) from the `lcd/python_lcd_dhylands_fork` git submodule,
+      so it is not compiled from source on the board either.  The build
+      fails if the submodule is not checked out:
+        $ git submodule update --init lcd/python_lcd_dhylands_fork
+
+    * To build the keypad_lcd bundle into `dist/keypad_lcd/`:
+        $ python3 tools/build_mpy.py keypad_lcd
+
+      then copy `dist/keypad_lcd/*.mpy` (and the board's hwconfig) to the
+      board, e.g. with `mpremote cp dist/keypad_lcd/*.mpy :`.
+
+    * Modules with `@micropython.native`/`@micropython.viper` code need the
+      target architecture, e.g. `--march armv7emsp` for an STM32F4; without
+      it they are left out (`keypad_timer_fast` then falls back to Python).
+
+    * `--opt N` is passed to `mpy-cross -O` (e.g. 3 to drop asserts and
+      line numbers, for smaller files and heap).
+
+    * To write a frozen module manifest for the bundles:
+        $ python3 tools/build_mpy.py --manifest tools/manifest.py keypad_lcd keypad leds
+        $ make -C ports/stm32 BOARD=... FROZEN_MANIFEST=/path/to/tools/manifest.py
+
+    * `--pyc` writes sourceless CPython `.pyc` files instead, so the source
+      vs precompiled start up comparison of `bench/bench_boot.py` can run on
+      a host without MicroPython.
+
+"""
+
+##============================================================================
+
+import argparse
+import os
+import py_compile
+import shutil
+import subprocess
+import sys
+
+##============================================================================
+
+REPO_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+## The LCD driver (from the lcd/python_lcd_dhylands_fork git submodule),
+## imported by the board's `BOARD.LCD`.
+LCD_SUBMODULE = 'lcd/python_lcd_dhylands_fork'
+LCD_DRIVER = [
+    LCD_SUBMODULE + '/lcd/lcd_api.py',
+    LCD_SUBMODULE + '/lcd/pyb_i2c_lcd.py',
+    ]
+
+## Bundle name => module source files (relative to the repo root).
+BUNDLES = {
+    'keypad_lcd': [
+        'hwapi/board.py',
+        'keypad/keymap.py',
+        'keypad/keypad_uasyncio.py',
+        'keypad_lcd/keypad_lcd_uasyncio.py',
+        'monitor/heap_monitor.py',
+        ] + LCD_DRIVER,
+    'keypad': [
+        'hwapi/board.py',
+        'keypad/keymap.py',
+        'keypad/keypad_uasyncio.py',
+        'keypad/keypad_expander.py',
+        'keypad/keypad_timer.py',
+        'keypad/keypad_timer_fast.py',
+        'keypad/keypad_timer_native.py',
+        'keypad/keypad_timer_viper.py',
+        'keypad/keypad_trace.py',
+        'keypad/key_stream.py',
+        'keypad/key_log.py',
+        'power/tickless_idle.py',
+        ],
+    'leds': [
+        'hwapi/board.py',
+        'leds/led_array.py',
+        'leds/led_fade_flash_uasyncio.py',
+        'monitor/heap_monitor.py',
+        'power/tickless_idle.py',
+        ],
+    'sim': [
+        'hwapi/hwconfig_SIM.py',
+        ],
+    }
+
+## Modules which need `-march` (native/viper emitters).
+NATIVE_MODULES = [ 'keypad/keypad_timer_native.py', 'keypad/keypad_timer_viper.py' ]
+
+DIST_DIR = os.path.join(REPO_ROOT, 'dist')
+
+##============================================================================
+
+def bundle_files(names):
+    """Return the (unique) source files of the named bundles."""
+
+    files = []
+    for name in names:
+        for path in BUNDLES[name]:
+            if path not in files:
+                files.append(path)
+    return files
+
+#-----------------------------------------------------------------------------
+
+def check_files(files):
+    """Return an error message if any source file is missing, else None."""
+
+    missing = [ path for path in files if not os.path.isfile(os.path.join(REPO_ROOT, path)) ]
+    if not missing:
+        return None
+    msg = "missing source files: " + ', '.join(missing)
+    if any(path.startswith(LCD_SUBMODULE + '/') for path in missing):
+        msg += "\n(the LCD driver submodule is not checked out: git submodule update --init {})".format(LCD_SUBMODULE)
+    return msg
+
+#-----------------------------------------------------------------------------
+
+def mpy_cross_version(mpy_cross):
+    """Return the `mpy-cross --version` string (raises OSError if not found)."""
+
+    return subprocess.check_output([ mpy_cross, '--version' ]).decode().strip()
+
+#-----------------------------------------------------------------------------
+
+def build(files, out_dir, mpy_cross='mpy-cross', march=None, opt=None, pyc=False):
+    """Compile `files` into `out_dir`; return the list of files written."""
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for path in files:
+        src = os.path.join(REPO_ROOT, path)
+        module = os.path.splitext(os.path.basename(path))[0]
+
+        if pyc:
+            dst = os.path.join(out_dir, module + '.pyc')
+            py_compile.compile(src, cfile=dst, doraise=True)
+        else:
+            if path in NATIVE_MODULES and not march:
+                print('skipping', path, '(needs --march)')
+                continue
+            dst = os.path.join(out_dir, module + '.mpy')
+            cmd = [ mpy_cross, '-o', dst ]
+            if march:
+                cmd.append('-march=' + march)
+            if opt is not None:
+                cmd.append('-O{}'.format(opt))
+            cmd.append(src)
+            subprocess.check_call(cmd)
+
+        written.append(dst)
+        print('{:40s} {:6d} -> {:6d} bytes'.format(path, os.path.getsize(src), os.path.getsize(dst)))
+    return written
+
+#-----------------------------------------------------------------------------
+
+def write_manifest(files, path, names):
+    """Write a frozen module manifest for `files`."""
+
+    manifest_dir = os.path.dirname(os.path.abspath(path))
+    lines = [
+        '# Frozen module manifest for the {} bundle(s), generated by tools/build_mpy.py.'.format(', '.join(names)),
+        '#',
+        '#   $ make -C ports/stm32 BOARD=... FROZEN_MANIFEST={}'.format(os.path.relpath(path, REPO_ROOT)),
+        '',
+        'include("$(PORT_DIR)/boards/manifest.py")',
+        '',
+        ]
+    for src in files:
+        base = os.path.relpath(os.path.join(REPO_ROOT, os.path.dirname(src)), manifest_dir)
+        lines.append('module("{}", base_path="{}")'.format(os.path.basename(src), base))
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    print('manifest written to', path)
+
+##============================================================================
+
+def main(argv=None):
+    """Main function."""
+
+    parser = argparse.ArgumentParser(description="Build .mpy bundles / frozen manifests.")
+    parser.add_argument('bundles', nargs='*', default=[ 'keypad_lcd' ], help="bundles: " + ', '.join(sorted(BUNDLES)))
+    parser.add_argument('--out', help="output directory (default: dist/<bundle>)")
+    parser.add_argument('--mpy-cross', default='mpy-cross', help="mpy-cross executable")
+    parser.add_argument('--march', help="target architecture for native/viper code (e.g. armv7emsp)")
+    parser.add_argument('--opt', type=int, help="mpy-cross optimisation level (-O)")
+    parser.add_argument('--pyc', action='store_true', help="write sourceless CPython .pyc files instead")
+    parser.add_argument('--manifest', metavar='FILE', help="write a frozen module manifest instead")
+    args = parser.parse_args(argv)
+
+    for name in args.bundles:
+        if name not in BUNDLES:
+            parser.error("unknown bundle: " + name)
+    files = bundle_files(args.bundles)
+    error = check_files(files)
+    if error:
+        print(error, file=sys.stderr)
+        return 1
+
+    if args.manifest:
+        write_manifest(files, args.manifest, args.bundles)
+        return 0
+
+    if not args.pyc:
+        try:
+            print(mpy_cross_version(args.mpy_cross))
+        except OSError:
+            print("mpy-cross not found (install with `pip install mpy-cross`, or give --mpy-cross)")
+            return 1
+
+    out_dir = args.out or os.path.join(DIST_DIR, '+'.join(args.bundles))
+    if os.path.isdir(out_dir) and not args.out:
+        shutil.rmtree(out_dir)
+    build(files, out_dir, mpy_cross=args.mpy_cross, march=args.march, opt=args.opt, pyc=args.pyc)
+    return 0
+
+##============================================================================
+
+if __name__ == '__main__':
+    sys.exit(main())
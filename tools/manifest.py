@@ -0,0 +1,24 @@
+# Frozen module manifest for the keypad_lcd, keypad, leds bundle(s), generated by tools/build_mpy.py.
+#
+#   $ make -C ports/stm32 BOARD=... FROZEN_MANIFEST=tools/manifest.py
+
+include("$(PORT_DIR)/boards/manifest.py")
+
+module("board.py", base_path="../hwapi")
+module("keymap.py", base_path="../keypad")
+module("keypad_uasyncio.py", base_path="../keypad")
+module("keypad_lcd_uasyncio.py", base_path="../keypad_lcd")
+module("heap_monitor.py", base_path="../monitor")
+module("lcd_api.py", base_path="../lcd/python_lcd_dhylands_fork/lcd")
+module("pyb_i2c_lcd.py", base_path="../lcd/python_lcd_dhylands_fork/lcd")
+module("keypad_expander.py", base_path="../keypad")
+module("keypad_timer.py", base_path="../keypad")
+module("keypad_timer_fast.py", base_path="../keypad")
+module("keypad_timer_native.py", base_path="../keypad")
+module("keypad_timer_viper.py", base_path="../keypad")
+module("keypad_trace.py", base_path="../keypad")
+module("key_stream.py", base_path="../keypad")
+module("key_log.py", base_path="../keypad")
+module("tickless_idle.py", base_path="../power")
+module("led_array.py", base_path="../leds")
+module("led_fade_flash_uasyncio.py", base_path="../leds")